@@ -23,35 +23,163 @@ def create_app():
     # DB config
     app.config["SQLALCHEMY_DATABASE_URI"] = os.getenv("DATABASE_URL")
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
-
-    # Uploads
-    app.config["UPLOAD_FOLDER"] = os.path.join("static", "uploads")
-
-    # Email
-    app.config["MAIL_SERVER"] = "smtp.gmail.com"
-    app.config["MAIL_PORT"] = 587
-    app.config["MAIL_USE_TLS"] = True
+    # Connection pool of each worker process (ignored on SQLite)
+    app.config["DB_POOL_SIZE"] = int(os.getenv("DB_POOL_SIZE", 5))
+    app.config["DB_MAX_OVERFLOW"] = int(os.getenv("DB_MAX_OVERFLOW", 5))
+    app.config["DB_POOL_TIMEOUT"] = int(os.getenv("DB_POOL_TIMEOUT", 10))  # seconds
+    app.config["DB_POOL_RECYCLE"] = int(os.getenv("DB_POOL_RECYCLE", 1800))  # seconds
+    app.config["DB_POOL_PRE_PING"] = os.getenv("DB_POOL_PRE_PING", "1") == "1"
+    # PostgreSQL statement timeout in ms (0: none), overridden per URL prefix
+    app.config["DB_STATEMENT_TIMEOUT"] = int(os.getenv("DB_STATEMENT_TIMEOUT", 5000))
+    app.config["DB_STATEMENT_TIMEOUTS"] = {
+        "/admin/": int(os.getenv("DB_ADMIN_STATEMENT_TIMEOUT", 60000)),
+    }
+
+    # Uploads (resized variants are written next to the originals)
+    app.config["UPLOAD_FOLDER"] = os.path.join(app.root_path, "static", "uploads")
+    app.config["IMAGE_FORMATS"] = os.getenv("IMAGE_FORMATS", "avif,webp").split(",")
+    app.config["IMAGE_QUALITY"] = int(os.getenv("IMAGE_QUALITY", 80))
+
+    # Static files: fingerprinted URLs from `flask assets-build` (if built)
+    app.config["ASSETS_USE_MANIFEST"] = os.getenv("ASSETS_USE_MANIFEST", "1") == "1"
+    app.config["ASSETS_MAX_AGE"] = 365 * 24 * 3600  # seconds
+
+    # Response compression (off when a reverse proxy already compresses)
+    app.config["COMPRESS_ENABLED"] = os.getenv("COMPRESS_ENABLED", "1") == "1"
+    app.config["COMPRESS_MIN_SIZE"] = int(os.getenv("COMPRESS_MIN_SIZE", 500))  # bytes
+    app.config["COMPRESS_LEVEL"] = 6  # gzip, 1-9
+    app.config["COMPRESS_BROTLI_QUALITY"] = 4  # 0-11
+
+    # Catalog paging
+    app.config["CATALOG_PAGE_SIZE"] = int(os.getenv("CATALOG_PAGE_SIZE", 24))
+    app.config["CATALOG_MAX_PAGE_SIZE"] = int(os.getenv("CATALOG_MAX_PAGE_SIZE", 96))
+    # Streamed catalog: header first, product cards while they are read
+    app.config["CATALOG_STREAMING"] = os.getenv("CATALOG_STREAMING", "0") == "1"
+    app.config["CATALOG_STREAM_YIELD_PER"] = 24  # rows per fetch
+    app.config["CATALOG_STREAM_BUFFER"] = 16 * 1024  # characters per chunk
+    # Catalog, index and product pages read an in-memory copy of the catalog
+    app.config["CATALOG_SNAPSHOT"] = os.getenv("CATALOG_SNAPSHOT", "1") == "1"
+    # ...filtered and sorted with NumPy arrays when numpy is installed
+    app.config["CATALOG_COLUMNAR"] = os.getenv("CATALOG_COLUMNAR", "1") == "1"
+
+    # Logged-in users cached per process (0 disables the cache)
+    app.config["USER_CACHE_TTL"] = int(os.getenv("USER_CACHE_TTL", 60))  # seconds
+    app.config["USER_CACHE_MAX_ENTRIES"] = 4096
+
+    # Password hashing: werkzeug method, worker processes per web worker
+    # (0: in the request)
+    app.config["PASSWORD_HASH_METHOD"] = os.getenv(
+        "PASSWORD_HASH_METHOD", "scrypt:32768:8:1"
+    )
+    app.config["PASSWORD_HASH_WORKERS"] = int(
+        os.getenv("PASSWORD_HASH_WORKERS", min(os.cpu_count() or 1, 4))
+    )
+    app.config["PASSWORD_HASH_MAX_PENDING"] = 32  # queued or running hashes
+    app.config["PASSWORD_HASH_TIMEOUT"] = 5  # seconds to wait for a free slot
+
+    # Cart summary kept in the session (larger carts are read from the DB)
+    app.config["CART_SESSION_MAX_ITEMS"] = int(os.getenv("CART_SESSION_MAX_ITEMS", 50))
+    # Operations accepted by one /cart/batch request
+    app.config["CART_BATCH_MAX_OPS"] = 100
+
+    # Catalog search (in-process index is used on non-PostgreSQL databases);
+    # at most SEARCH_MAX_RESULTS results are listed by relevance
+    app.config["SEARCH_MAX_RESULTS"] = int(os.getenv("SEARCH_MAX_RESULTS", 500))
+    app.config["SEARCH_INDEX_TTL"] = int(os.getenv("SEARCH_INDEX_TTL", 300))
+
+    # Catalog facets (type/category/brand dropdowns)
+    app.config["FACET_CACHE_TTL"] = int(os.getenv("FACET_CACHE_TTL", 300))
+
+    # Rendered-fragment cache: memory | filesystem | redis | null
+    app.config["PAGE_CACHE_TYPE"] = os.getenv("PAGE_CACHE_TYPE", "memory")
+    app.config["PAGE_CACHE_TTL"] = int(os.getenv("PAGE_CACHE_TTL", 600))
+    app.config["PAGE_CACHE_MAX_ENTRIES"] = 1024
+    app.config["PAGE_CACHE_DIR"] = os.getenv(
+        "PAGE_CACHE_DIR", os.path.join(app.instance_path, "page_cache")
+    )
+    app.config["PAGE_CACHE_REDIS_URL"] = os.getenv("PAGE_CACHE_REDIS_URL")
+
+    # Each process re-reads the content version (ETag, cache keys) at most
+    # this often; changes made by other processes show up that late
+    app.config["CONTENT_VERSION_TTL"] = int(os.getenv("CONTENT_VERSION_TTL", 2))
+
+    # Email (MAIL_SERVER/MAIL_PORT/MAIL_USE_TLS can point at a local SMTP stand-in)
+    app.config["MAIL_SERVER"] = os.getenv("MAIL_SERVER", "smtp.gmail.com")
+    app.config["MAIL_PORT"] = int(os.getenv("MAIL_PORT", 587))
+    app.config["MAIL_USE_TLS"] = os.getenv("MAIL_USE_TLS", "1") == "1"
     app.config["MAIL_USE_SSL"] = False
     app.config["MAIL_USERNAME"] = os.getenv("DEL_EMAIL")
     app.config["MAIL_PASSWORD"] = os.getenv("PASSWORD")
 
+    # Outbound mail queue: "thread" runs the dispatcher inside the web process,
+    # "external" leaves it to `flask mail-worker`
+    app.config["MAIL_QUEUE_MODE"] = os.getenv("MAIL_QUEUE_MODE", "thread")
+    app.config["MAIL_QUEUE_WORKERS"] = int(os.getenv("MAIL_QUEUE_WORKERS", 1))
+    app.config["MAIL_QUEUE_BATCH_SIZE"] = int(os.getenv("MAIL_QUEUE_BATCH_SIZE", 20))
+    app.config["MAIL_QUEUE_POLL_INTERVAL"] = 5  # seconds
+    app.config["MAIL_QUEUE_MAX_ATTEMPTS"] = 8
+    app.config["MAIL_QUEUE_RETRY_DELAY"] = 30  # seconds, doubled on each retry
+    app.config["MAIL_QUEUE_CLAIM_TIMEOUT"] = 600  # seconds
+
+    # Image variants queue: "thread" feeds a process pool from the web process,
+    # "external" leaves it to `flask image-worker`, "inline" resizes in the request.
+    # In "thread" mode each web worker has its own pool of IMAGE_QUEUE_WORKERS
+    app.config["IMAGE_QUEUE_MODE"] = os.getenv("IMAGE_QUEUE_MODE", "thread")
+    app.config["IMAGE_QUEUE_WORKERS"] = int(os.getenv("IMAGE_QUEUE_WORKERS", 2))
+    app.config["IMAGE_QUEUE_POLL_INTERVAL"] = 5  # seconds
+    app.config["IMAGE_QUEUE_MAX_ATTEMPTS"] = 3
+    app.config["IMAGE_QUEUE_RETRY_DELAY"] = 30  # seconds, doubled on each retry
+    app.config["IMAGE_QUEUE_CLAIM_TIMEOUT"] = 600  # seconds
+
     app.secret_key = os.getenv("SECRET_KEY") or "verysecret"
 
     app.config["PERMANENT_SESSION_LIFETIME"] = timedelta(days=7)
+    # Session data kept server-side, the cookie holds only its id:
+    # sql | memory | redis | cookie (Flask's signed cookie)
+    app.config["SESSION_STORE"] = os.getenv("SESSION_STORE", "sql")
+    app.config["SESSION_REDIS_URL"] = os.getenv(
+        "SESSION_REDIS_URL", "redis://localhost:6379/1"
+    )
+    app.config["SESSION_MEMORY_MAX_ENTRIES"] = 10000
+    app.config["SESSION_COMPRESS_MIN_SIZE"] = 256  # bytes
 
     # Инициализация расширений
+    from .dbpool import engine_options, init_db_pool
+
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = engine_options(app.config)
     db.init_app(app)
     mail.init_app(app)
     login_manager.init_app(app)
     csrf.init_app(app)
     migrate = Migrate(app, db)
 
-    # 🔽 Настройка login_manager
-    from .models import User  # импортируем здесь, чтобы избежать циклического импорта
+    # Счётчики пула соединений для /healthz, таймауты запросов по URL
+    init_db_pool(app)
 
-    @login_manager.user_loader
-    def load_user(user_id):
-        return User.query.get(int(user_id))
+    # 🔽 Настройка login_manager
+    from .models import Products, Blog, CarBrand
+    from .cache import init_cache, register_invalidation
+    from .versioning import track_content
+    from .images import init_images
+    from .assets import init_assets
+    from .usercache import init_user_cache, load_user
+    from .passwords import init_passwords
+    from .sessions import init_sessions
+
+    # 🔽 Версия контента (ETag) и кэш фрагментов страниц
+    track_content(Products, Blog, CarBrand)
+    init_cache(app)
+    register_invalidation(Products, Blog, CarBrand)
+    init_images(app)
+    init_assets(app)
+
+    # Пользователь берётся из кэша, а не из БД на каждом запросе
+    init_user_cache(app)
+    login_manager.user_loader(load_user)
+    init_passwords(app)
+
+    # Данные сессии хранятся на сервере, в cookie только её id
+    init_sessions(app)
 
     # 🔽 Инициализация админки
     from .admin import admin
@@ -69,4 +197,10 @@ def create_app():
     app.register_blueprint(auth_bp, url_prefix="/auth")
     app.register_blueprint(cart_bp)
 
+    # 🔽 Сжатие ответов (gzip/brotli, готовые .br/.gz для статики)
+    if app.config["COMPRESS_ENABLED"]:
+        from .compression import init_compression
+
+        init_compression(app)
+
     return app
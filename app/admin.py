@@ -1,30 +1,29 @@
 from flask_admin import Admin, AdminIndexView, expose
 from flask_admin.contrib.sqla import ModelView
-from flask import redirect, session, url_for, current_app
-from markupsafe import Markup
+from sqlalchemy.orm import joinedload
+from flask import redirect, session, url_for
 from .models import CarBrand, Products, Blog, Subscriber, User, Order
+from .facets import invalidate_facets
+from .search import invalidate_search_index
+from .snapshot import invalidate_snapshot
+from .images import picture, save_upload
+from .imagejobs import wake_image_workers
 from wtforms.validators import DataRequired
 from wtforms.fields import TextAreaField
 from wtforms import FileField
 from . import db
-import uuid
-import os
 
 
-def generate_filename(product_id, file_data):
+def invalidate_catalog_caches():
     """
-    Generates a unique filename for uploaded product images.
+    Drops the in-process catalog caches (search index, facets and the
+    catalog snapshot).
 
-    Args:
-        product_id (int or None): The ID of the product, if known.
-        file_data (FileStorage): The uploaded file.
-
-    Returns:
-        str: A unique filename based on the product ID and a UUID.
+    Called after products or brands are changed through the admin.
     """
-    base = f"filter_{product_id}" if product_id else "photo"
-    ext = file_data.filename.rsplit(".", 1)[-1]
-    return f"{base}_{uuid.uuid4().hex}.{ext}"
+    invalidate_search_index()
+    invalidate_facets()
+    invalidate_snapshot()
 
 
 class MyAdminIndexView(AdminIndexView):
@@ -55,6 +54,18 @@ class CarBrandAdmin(ModelView):
     column_default_sort = ("name", False)
     column_sortable_list = ["name"]
 
+    def after_model_change(self, form, model, is_created):
+        """
+        Drops the catalog caches, which hold brand names.
+        """
+        invalidate_catalog_caches()
+
+    def after_model_delete(self, model):
+        """
+        Drops the catalog caches, which hold brand names.
+        """
+        invalidate_catalog_caches()
+
 
 class ProductsView(ModelView):
     """
@@ -97,6 +108,7 @@ class ProductsAdmin(ProductsView):
         "photo_upload",
     )
     column_filters = ("brand", "type", "category", "in_stock", "is_main")
+    column_select_related_list = (Products.brand,)
     form_args = dict(
         brand={
             "label": "Марка авто",
@@ -136,12 +148,7 @@ class ProductsAdmin(ProductsView):
         filename = None
 
         if file and file.filename:
-            filename = generate_filename(
-                form.brand.data.id if form.brand.data else None, file
-            )
-            path = os.path.join(current_app.config["UPLOAD_FOLDER"], filename)
-            os.makedirs(current_app.config["UPLOAD_FOLDER"], exist_ok=True)
-            file.save(path)
+            filename = save_upload(file)
 
         product = Products(
             name=form.name.data,
@@ -158,8 +165,22 @@ class ProductsAdmin(ProductsView):
         )
         db.session.add(product)
         db.session.commit()
+        wake_image_workers()
+        invalidate_catalog_caches()
         return redirect(self.get_url(".index_view"))
 
+    def after_model_change(self, form, model, is_created):
+        """
+        Drops the catalog caches after a product is edited.
+        """
+        invalidate_catalog_caches()
+
+    def after_model_delete(self, model):
+        """
+        Drops the catalog caches after a product is deleted.
+        """
+        invalidate_catalog_caches()
+
     def _preview(view, context, model, name):
         """
         Renders a thumbnail preview of the uploaded product image.
@@ -174,9 +195,7 @@ class ProductsAdmin(ProductsView):
             Markup: HTML markup for image or empty string.
         """
         if model.photo_filename:
-            return Markup(
-                f'<img src="/static/uploads/{model.photo_filename}" style="max-height: 80px;">'
-            )
+            return picture(model.photo_filename, "thumb", style="max-height: 80px;")
         return ""
 
     column_formatters = {"preview": _preview}
@@ -219,10 +238,7 @@ class BlogAdmin(ModelView):
         filename = None
 
         if file and file.filename:
-            filename = generate_filename(None, file)
-            path = os.path.join(current_app.config["UPLOAD_FOLDER"], filename)
-            os.makedirs(current_app.config["UPLOAD_FOLDER"], exist_ok=True)
-            file.save(path)
+            filename = save_upload(file)
 
         post = Blog(
             title=form.title.data,
@@ -234,6 +250,7 @@ class BlogAdmin(ModelView):
         )
         db.session.add(post)
         db.session.commit()
+        wake_image_workers()
         return redirect(self.get_url(".index_view"))
 
     def _preview(view, context, model, name):
@@ -250,9 +267,7 @@ class BlogAdmin(ModelView):
             Markup: HTML with the image or empty string.
         """
         if model.photo_filename:
-            return Markup(
-                f'<img src="/static/uploads/{model.photo_filename}" style="max-height: 80px;">'
-            )
+            return picture(model.photo_filename, "thumb", style="max-height: 80px;")
         return ""
 
     column_formatters = {"preview": _preview}
@@ -282,12 +297,22 @@ class OrderAdmin(ModelView):
     column_list = ["id", "user_email", "created_at", "status"]
     column_filters = ["status", "created_at"]
     column_searchable_list = ["user.email"]
+    column_labels = {"user_email": "Email клиента"}
     form_columns = ["user", "status"]
 
-    def user_email(self, obj):
-        return obj.user.email
+    def get_query(self):
+        """
+        Loads the customer together with each order for the list view.
+        """
+        return super().get_query().options(joinedload(Order.user))
+
+    def _user_email(view, context, model, name):
+        """
+        Renders the customer email (``user`` is eager-loaded for the list).
+        """
+        return model.user.email
 
-    user_email.short_description = "Email клиента"
+    column_formatters = {"user_email": _user_email}
 
 
 # Registering all models in the admin interface
@@ -0,0 +1,283 @@
+"""
+Fingerprinted static assets.
+
+``flask assets-build`` copies the files of ``app/static`` into
+``static/build`` under names that contain a hash of their content
+(``css/style.3f2a9c1b0d4e.css``), rewrites ``url()`` references inside the
+stylesheets to those names, minifies the CSS into one bundle and writes
+``.gz`` (and ``.br``, with the ``brotli`` package) siblings of the text
+files. ``build/manifest.json`` maps source names to built ones.
+
+When a manifest exists, ``url_for("static", filename=...)`` returns the
+fingerprinted URL and such responses are sent with a year-long
+``Cache-Control: immutable``, as are content-addressed uploads. Rebuild
+after changing static files.
+"""
+
+import gzip
+import hashlib
+import json
+import os
+import re
+
+from flask import current_app, request, url_for
+from markupsafe import Markup
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - brotli is optional
+    brotli = None
+
+BUILD_DIR = "build"
+MANIFEST = "manifest.json"
+
+# Generated or user content that is not fingerprinted
+SKIP_DIRS = {BUILD_DIR, "uploads", "screenshots"}
+
+# Stylesheets of base.html, in cascade order, served as one bundle
+CSS_BUNDLE = (
+    "css/bootstrap.min.css",
+    "css/nice-select.css",
+    "css/font-awesome.min.css",
+    "css/icofont.css",
+    "css/slicknav.min.css",
+    "css/owl-carousel.css",
+    "css/datepicker.css",
+    "css/animate.min.css",
+    "css/magnific-popup.css",
+    "css/normalize.css",
+    "css/style.css",
+    "css/responsive.css",
+)
+BUNDLE_NAME = "css/site.css"
+
+# Files worth precompressing (images and woff fonts are compressed already)
+COMPRESSIBLE = {".css", ".js", ".svg", ".json", ".txt", ".ttf", ".eot", ".otf", ".ico"}
+
+# Immutable static paths: build output and content-addressed uploads
+IMMUTABLE_RE = re.compile(
+    r"^(?:%s/|uploads/[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}[.\w]*$)" % BUILD_DIR
+)
+
+URL_RE = re.compile(r"""url\(\s*(['"]?)([^'")]+)\1\s*\)""")
+
+# Quoted CSS strings (with escapes), which minification must not touch
+STRING_RE = r""""(?:\\.|[^"\\])*"|'(?:\\.|[^'\\])*'"""
+CSS_STRING_RE = re.compile("(" + STRING_RE + ")", re.S)
+CSS_COMMENT_RE = re.compile("(" + STRING_RE + r")|/\*.*?\*/", re.S)
+
+
+def fingerprint(data):
+    """
+    Returns the short content hash used in built file names.
+    """
+    return hashlib.sha256(data).hexdigest()[:12]
+
+
+def fingerprinted_name(name, data):
+    """
+    Inserts the content hash before the extension of a static file name.
+
+    Args:
+        name (str): e.g. ``css/style.css``.
+        data (bytes): File content.
+
+    Returns:
+        str: e.g. ``css/style.3f2a9c1b0d4e.css``.
+    """
+    stem, ext = os.path.splitext(name)
+    return f"{stem}.{fingerprint(data)}{ext}"
+
+
+def minify_css(css):
+    """
+    Removes comments and insignificant whitespace from a stylesheet.
+
+    Conservative on purpose: whitespace around ``:``, ``+`` and ``-`` is kept,
+    as it is meaningful in selectors and ``calc()``. Quoted strings
+    (``content: "a  b"``, ``url("x;y.png")``) are copied unchanged.
+    """
+    # Strings are matched first, so "/*" inside one does not open a comment
+    css = CSS_COMMENT_RE.sub(lambda match: match.group(1) or "", css)
+
+    parts = CSS_STRING_RE.split(css)
+    for i in range(0, len(parts), 2):
+        part = re.sub(r"\s+", " ", parts[i])
+        part = re.sub(r"\s*([{};,>])\s*", r"\1", part)
+        parts[i] = part.replace(";}", "}")
+    return "".join(parts).strip()
+
+
+def _rewrite_urls(css, source_name, manifest, static_url_path):
+    """
+    Points ``url()`` references of a stylesheet at the built files.
+
+    References are resolved against the source location (absolute
+    ``/static/...`` URLs too) and emitted relative to ``build/css``.
+    """
+    source_dir = os.path.dirname(source_name)
+    static_prefix = static_url_path.rstrip("/") + "/"
+
+    def replace(match):
+        url = match.group(2).strip()
+        if url.startswith(("data:", "http:", "https:", "//", "#")):
+            return match.group(0)
+
+        # "../fonts/x.eot?#iefix" -> "../fonts/x.eot", "?#iefix"
+        path, rest = re.match(r"([^?#]*)(.*)", url).groups()
+        if url.startswith(static_prefix):
+            target = path[len(static_prefix) :]
+        elif path.startswith("/"):
+            return match.group(0)
+        else:
+            target = os.path.normpath(os.path.join(source_dir, path))
+        target = target.replace(os.sep, "/")
+
+        built = manifest.get(target, target)
+        relative = os.path.relpath(built, os.path.join(BUILD_DIR, source_dir))
+        return f'url("{relative.replace(os.sep, "/")}{rest}")'
+
+    return URL_RE.sub(replace, css)
+
+
+def _write(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+def _precompress(path, data):
+    """
+    Writes ``.gz`` / ``.br`` siblings of a built file when they are smaller.
+    """
+    compressed = {"gz": gzip.compress(data, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        compressed["br"] = brotli.compress(data, quality=11)
+    for ext, payload in compressed.items():
+        if len(payload) < len(data):
+            _write(f"{path}.{ext}", payload)
+
+
+def build_assets(static_folder, static_url_path="/static"):
+    """
+    Builds the fingerprinted copy of the static folder.
+
+    Args:
+        static_folder (str): Path of ``app/static``.
+        static_url_path (str): URL prefix of the static files, used to
+            resolve absolute ``url()`` references in stylesheets.
+
+    Returns:
+        dict: The manifest, ``{source name: built name}``.
+    """
+    # Files of earlier builds are left in place: pages rendered before a
+    # deploy keep referencing them
+    build_root = os.path.join(static_folder, BUILD_DIR)
+
+    sources = {}
+    for root, dirs, files in os.walk(static_folder):
+        if root == static_folder:
+            dirs[:] = [d for d in dirs if d not in SKIP_DIRS]
+        for name in files:
+            path = os.path.join(root, name)
+            sources[os.path.relpath(path, static_folder).replace(os.sep, "/")] = path
+
+    manifest = {}
+    outputs = {}
+
+    # Everything but stylesheets first: the CSS references their names
+    for name, path in sorted(sources.items()):
+        if name.endswith(".css"):
+            continue
+        with open(path, "rb") as f:
+            data = f.read()
+        manifest[name] = f"{BUILD_DIR}/{fingerprinted_name(name, data)}"
+        outputs[manifest[name]] = data
+
+    minified = {}
+    for name, path in sorted(sources.items()):
+        if not name.endswith(".css"):
+            continue
+        with open(path, encoding="utf-8", errors="surrogateescape") as f:
+            css = f.read()
+        css = minify_css(_rewrite_urls(css, name, manifest, static_url_path))
+        # Only one @charset is allowed, at the very start of the bundle
+        minified[name] = re.sub(r'@charset\s+"[^"]*";', "", css)
+        data = css.encode("utf-8", errors="surrogateescape")
+        manifest[name] = f"{BUILD_DIR}/{fingerprinted_name(name, data)}"
+        outputs[manifest[name]] = data
+
+    bundle = "\n".join(minified[name] for name in CSS_BUNDLE if name in minified)
+    data = ('@charset "UTF-8";\n' + bundle).encode("utf-8", errors="surrogateescape")
+    manifest[BUNDLE_NAME] = f"{BUILD_DIR}/{fingerprinted_name(BUNDLE_NAME, data)}"
+    outputs[manifest[BUNDLE_NAME]] = data
+
+    for name, data in outputs.items():
+        path = os.path.join(static_folder, name)
+        _write(path, data)
+        if os.path.splitext(name)[1].lower() in COMPRESSIBLE:
+            _precompress(path, data)
+
+    # Written last: a half-finished build is never picked up
+    _write(
+        os.path.join(build_root, MANIFEST),
+        json.dumps(manifest, indent=1, sort_keys=True).encode(),
+    )
+    return manifest
+
+
+def load_manifest(static_folder):
+    """
+    Reads the build manifest, or returns ``{}`` if assets were not built.
+    """
+    try:
+        with open(os.path.join(static_folder, BUILD_DIR, MANIFEST)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def stylesheets():
+    """
+    Renders the ``<link>`` tags of the site stylesheets: the bundle when
+    assets are built, the separate source files otherwise.
+    """
+    if BUNDLE_NAME in current_app.extensions["assets"]:
+        names = (BUNDLE_NAME,)
+    else:
+        names = CSS_BUNDLE
+    return Markup("\n").join(
+        Markup('<link rel="stylesheet" href="{}">').format(
+            url_for("static", filename=name)
+        )
+        for name in names
+    )
+
+
+def init_assets(app):
+    """
+    Serves static files through the build manifest with far-future caching.
+    """
+    manifest = {}
+    if app.config["ASSETS_USE_MANIFEST"]:
+        manifest = load_manifest(app.static_folder)
+    app.extensions["assets"] = manifest
+    app.jinja_env.globals["stylesheets"] = stylesheets
+
+    @app.url_defaults
+    def fingerprint_static_urls(endpoint, values):
+        if endpoint == "static" and values.get("filename") in manifest:
+            values["filename"] = manifest[values["filename"]]
+
+    @app.after_request
+    def cache_immutable_files(response):
+        if (
+            request.endpoint == "static"
+            and response.status_code in (200, 304)
+            and IMMUTABLE_RE.match(request.view_args.get("filename", ""))
+        ):
+            response.cache_control.public = True
+            response.cache_control.max_age = app.config["ASSETS_MAX_AGE"]
+            response.cache_control.immutable = True
+            response.cache_control.no_cache = None
+        return response
@@ -1,9 +1,8 @@
 from flask import Blueprint
 from . import db
-from flask import request, redirect, render_template, url_for, flash
+from flask import request, redirect, render_template, url_for, flash, make_response
 from flask_login import login_user, logout_user
-from werkzeug.security import check_password_hash, generate_password_hash
-
+from .passwords import HashingBusy
 
 auth_bp = Blueprint("auth", __name__)
 
@@ -29,10 +28,14 @@ def user_login():
                     "Пользователь с таким email не найден. Возможно, вы хотите зарегистрироваться?",
                     category="warning",
                 )
-            elif not check_password_hash(user.password_hash, password):
+            elif not user.check_password(password):
                 # Пароль неверный - даём подсказку
                 flash("Неверный пароль. Проверьте правильность ввода", category="error")
             else:
+                # Хэш со старыми параметрами заменяем, пока пароль известен
+                if user.password_needs_rehash():
+                    user.set_password(password)
+                    db.session.commit()
                 # Успешный вход
                 login_user(user, remember=login_form.remember.data)
                 return redirect(url_for("prof.profile"))
@@ -60,6 +63,23 @@ def user_login():
     )
 
 
+@auth_bp.errorhandler(HashingBusy)
+def hashing_busy(e):
+    # Пул хэширования переполнен (всплеск попыток входа): отвечаем 503,
+    # а не ждём очереди
+    from app.models import LoginForm, RegisterForm
+
+    flash("Сервер перегружен. Попробуйте войти через минуту.", category="error")
+    response = make_response(
+        render_template(
+            "user_login.html", login_form=LoginForm(), register_form=RegisterForm()
+        ),
+        503,
+    )
+    response.headers["Retry-After"] = "60"
+    return response
+
+
 @auth_bp.route("/logout")
 def user_logout():
     logout_user()
@@ -0,0 +1,287 @@
+"""
+Rendered-fragment cache.
+
+Templates mark expensive, user-independent parts with::
+
+    {% cache "index-products" %} ... {% endcache %}
+    {% cache "blog-card", post.id %} ... {% endcache %}
+
+Views pass un-executed queries to those parts, so a cache hit skips both
+the rendering and the SQL. The backend is chosen by ``PAGE_CACHE_TYPE``:
+``memory`` (per-process LRU with TTL), ``filesystem`` (shared between
+processes on one host), ``redis`` (needs the ``redis`` package) or ``null``.
+
+Committing a change to ``Products``, ``Blog`` or ``CarBrand`` clears the
+cache (see ``register_invalidation``); keys also carry the content version,
+so per-process caches of other workers stop serving stale fragments.
+"""
+
+import hashlib
+import os
+import pickle
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app, has_app_context
+from jinja2 import nodes
+from jinja2.ext import Extension
+from markupsafe import Markup
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from .versioning import get_content_version
+
+
+class NullCache:
+    """
+    Cache that stores nothing (caching disabled).
+    """
+
+    def get(self, key):
+        return None
+
+    def set(self, key, value, ttl=None):
+        pass
+
+    def delete(self, key):
+        pass
+
+    def clear(self):
+        pass
+
+
+class MemoryCache:
+    """
+    Thread-safe in-process LRU cache with per-entry TTL.
+    """
+
+    def __init__(self, max_entries=1024, default_ttl=300):
+        self.max_entries = max_entries
+        self.default_ttl = default_ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.monotonic() + (ttl or self.default_ttl)
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class FileSystemCache:
+    """
+    Cache stored as pickle files in a directory, shared by all processes
+    on the host.
+    """
+
+    def __init__(self, directory, default_ttl=300):
+        self.directory = directory
+        self.default_ttl = default_ttl
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, hashlib.sha1(key.encode()).hexdigest())
+
+    def get(self, key):
+        try:
+            with open(self._path(key), "rb") as f:
+                expires_at, value = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+        if expires_at < time.time():
+            self.delete(key)
+            return None
+        return value
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.time() + (ttl or self.default_ttl)
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                pickle.dump((expires_at, value), f, pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self._path(key))
+        except OSError:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def delete(self, key):
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+    def clear(self):
+        for name in os.listdir(self.directory):
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except OSError:
+                pass
+
+
+class RedisCache:
+    """
+    Cache in Redis (or a Redis-compatible server) shared by all hosts.
+
+    ``clear`` bumps a generation number that is part of every key instead
+    of scanning for keys; old entries simply expire.
+    """
+
+    def __init__(self, url, default_ttl=300, prefix="agt:page:"):
+        import redis
+
+        self.client = redis.Redis.from_url(url)
+        self.default_ttl = default_ttl
+        self.prefix = prefix
+
+    def _key(self, key):
+        generation = int(self.client.get(self.prefix + "generation") or 0)
+        return f"{self.prefix}{generation}:{key}"
+
+    def get(self, key):
+        raw = self.client.get(self._key(key))
+        return pickle.loads(raw) if raw is not None else None
+
+    def set(self, key, value, ttl=None):
+        self.client.set(
+            self._key(key), pickle.dumps(value), ex=int(ttl or self.default_ttl)
+        )
+
+    def delete(self, key):
+        self.client.delete(self._key(key))
+
+    def clear(self):
+        self.client.incr(self.prefix + "generation")
+
+
+def create_cache(config):
+    """
+    Builds the cache backend selected by the application config.
+
+    Args:
+        config (Config): Flask config with the ``PAGE_CACHE_*`` settings.
+
+    Returns:
+        Cache backend instance.
+    """
+    cache_type = config["PAGE_CACHE_TYPE"]
+    ttl = config["PAGE_CACHE_TTL"]
+    if cache_type == "memory":
+        return MemoryCache(config["PAGE_CACHE_MAX_ENTRIES"], ttl)
+    if cache_type == "filesystem":
+        return FileSystemCache(config["PAGE_CACHE_DIR"], ttl)
+    if cache_type == "redis":
+        return RedisCache(config["PAGE_CACHE_REDIS_URL"], ttl)
+    if cache_type == "null":
+        return NullCache()
+    raise ValueError(f"Unknown PAGE_CACHE_TYPE: {cache_type}")
+
+
+def get_cache():
+    """
+    Returns the page cache of the current application.
+    """
+    return current_app.extensions["page_cache"]
+
+
+class FragmentCacheExtension(Extension):
+    """
+    Jinja ``{% cache name, *args %}...{% endcache %}`` tag backed by the
+    page cache.
+    """
+
+    tags = {"cache"}
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        parts = [parser.parse_expression()]
+        while parser.stream.skip_if("comma"):
+            parts.append(parser.parse_expression())
+        body = parser.parse_statements(("name:endcache",), drop_needle=True)
+        return nodes.CallBlock(
+            self.call_method("_render", [nodes.List(parts)]), [], [], body
+        ).set_lineno(lineno)
+
+    def _render(self, parts, caller):
+        # The content version makes entries of other processes go stale too
+        version = get_content_version()
+        key = f"fragment:{version}:" + ":".join(str(part) for part in parts)
+        cache = get_cache()
+        value = cache.get(key)
+        if value is None:
+            value = str(caller())
+            cache.set(key, value)
+        return Markup(value)
+
+
+# Models whose committed changes invalidate the cached fragments
+_watched_models = ()
+
+
+def _collect_changes(session, flush_context):
+    """
+    Remembers which watched models were written in this transaction.
+    """
+    if session.info.get("page_cache_dirty"):
+        return
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        if isinstance(obj, _watched_models):
+            session.info["page_cache_dirty"] = True
+            return
+
+
+def _clear_on_commit(session):
+    if session.info.pop("page_cache_dirty", False) and has_app_context():
+        get_cache().clear()
+
+
+def _forget_on_rollback(session, previous_transaction):
+    session.info.pop("page_cache_dirty", None)
+
+
+def register_invalidation(*models):
+    """
+    Clears the page cache whenever a transaction that wrote one of the
+    models commits.
+
+    Args:
+        *models: Model classes to watch.
+    """
+    global _watched_models
+
+    _watched_models = tuple(models)
+    if not event.contains(Session, "after_flush", _collect_changes):
+        event.listen(Session, "after_flush", _collect_changes)
+        event.listen(Session, "after_commit", _clear_on_commit)
+        event.listen(Session, "after_soft_rollback", _forget_on_rollback)
+
+
+def init_cache(app):
+    """
+    Sets up the page cache and the ``{% cache %}`` template tag for the app.
+    """
+    app.extensions["page_cache"] = create_cache(app.config)
+    app.jinja_env.add_extension(FragmentCacheExtension)
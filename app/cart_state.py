@@ -0,0 +1,95 @@
+"""
+Cart summary (product_id -> quantity) of the current user.
+
+The summary is kept in the session and updated by the cart routes, so
+catalog and product pages render cart buttons without querying
+``cart_item``. It is loaded from the database only when the session has
+none for the current user (new login, another device, oversized cart).
+"""
+
+from flask import current_app, g, session
+from flask_login import current_user
+
+from . import db
+from .models import CartItem
+
+SESSION_KEY = "cart"
+
+
+def _store(quantities):
+    """
+    Saves the summary into the session unless it is too large for it.
+    """
+    if len(quantities) > current_app.config["CART_SESSION_MAX_ITEMS"]:
+        session.pop(SESSION_KEY, None)
+        return
+    session[SESSION_KEY] = {
+        "user_id": current_user.id,
+        "items": {str(product_id): qty for product_id, qty in quantities.items()},
+    }
+
+
+def get_cart_quantities():
+    """
+    Returns the current user's cart summary, loading it at most once
+    per request.
+
+    Returns:
+        dict: ``{product_id: quantity}``, empty for anonymous users.
+    """
+    if not current_user.is_authenticated:
+        return {}
+    if "cart_quantities" in g:
+        return g.cart_quantities
+
+    state = session.get(SESSION_KEY)
+    if state and state.get("user_id") == current_user.id:
+        quantities = {int(pid): qty for pid, qty in state["items"].items()}
+    else:
+        quantities = dict(
+            db.session.query(CartItem.product_id, CartItem.quantity).filter_by(
+                user_id=current_user.id
+            )
+        )
+        _store(quantities)
+
+    g.cart_quantities = quantities
+    return quantities
+
+
+def remember_cart(cart_items):
+    """
+    Replaces the summary with freshly loaded cart items.
+
+    Args:
+        cart_items (list): ``CartItem`` rows of the current user (or rows
+            with ``product_id`` and ``quantity`` columns).
+    """
+    quantities = {item.product_id: item.quantity for item in cart_items}
+    g.cart_quantities = quantities
+    _store(quantities)
+
+
+def set_cart_quantity(product_id, quantity):
+    """
+    Updates one line of the summary after a cart change.
+
+    Args:
+        product_id (int): Product id.
+        quantity (int): New quantity; zero or less removes the line.
+    """
+    quantities = dict(get_cart_quantities())
+    if quantity > 0:
+        quantities[int(product_id)] = quantity
+    else:
+        quantities.pop(int(product_id), None)
+    g.cart_quantities = quantities
+    _store(quantities)
+
+
+def clear_cart_state():
+    """
+    Empties the summary (after checkout).
+    """
+    g.cart_quantities = {}
+    _store({})
@@ -0,0 +1,151 @@
+"""
+Columnar filter/sort engine for the catalog snapshot.
+
+Product attributes are held in NumPy arrays, one row per product. Exact
+filters (type, category, brand) are precomputed boolean bitmaps, the price
+range becomes a slice of the sorted price index, and every sort order is a
+precomputed permutation. A catalog query is then a handful of vectorised
+``&`` operations plus one ``flatnonzero`` over the permuted mask, instead
+of a Python predicate per product.
+
+Used by ``CatalogSnapshot`` when the ``numpy`` package is installed.
+"""
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - numpy is optional
+    np = None
+
+# Attributes with an exact-match bitmap per value
+BITMAP_ATTRS = ("type", "category", "brand_id")
+
+
+def available():
+    """
+    Tells whether NumPy is installed.
+    """
+    return np is not None
+
+
+class ColumnarCatalog:
+    """
+    Bitmaps and sort permutations over the rows of a snapshot.
+    """
+
+    def __init__(self, products, orders):
+        """
+        Args:
+            products (tuple): Product records; a row number is the position
+                in this tuple.
+            orders (dict): ``{attribute: records in ascending (attribute,
+                id) order}`` for every sortable attribute.
+        """
+        size = len(products)
+        self.size = size
+        self._rows = {product.id: row for row, product in enumerate(products)}
+
+        self._bitmaps = {}
+        for attr in BITMAP_ATTRS:
+            values = {}
+            for row, product in enumerate(products):
+                values.setdefault(getattr(product, attr), []).append(row)
+            bitmaps = {}
+            for value, rows in values.items():
+                bitmap = np.zeros(size, dtype=bool)
+                bitmap[rows] = True
+                bitmaps[value] = bitmap
+            self._bitmaps[attr] = bitmaps
+
+        # order[attr][i]: row at sorted position i; rank[attr][row]: inverse
+        self._order, self._rank = {}, {}
+        for attr, ordered in orders.items():
+            order = np.fromiter(
+                (self._rows[p.id] for p in ordered), dtype=np.intp, count=size
+            )
+            rank = np.empty(size, dtype=np.intp)
+            rank[order] = np.arange(size, dtype=np.intp)
+            self._order[attr], self._rank[attr] = order, rank
+
+        self._sorted_prices = np.fromiter(
+            (products[row].price for row in self._order["price"]),
+            dtype=np.float64,
+            count=size,
+        )
+
+    def mask(
+        self,
+        type_filter=None,
+        category_filter=None,
+        brand_id=None,
+        price_min=None,
+        price_max=None,
+        ids=None,
+    ):
+        """
+        Computes the rows that pass the catalog filters.
+
+        Args:
+            type_filter, category_filter (str, optional): Exact values.
+            brand_id (int, optional): Brand filter.
+            price_min, price_max (number, optional): Inclusive price bounds.
+            ids (iterable, optional): Restrict to these product ids (search
+                results).
+
+        Returns:
+            numpy.ndarray: Boolean mask indexed by row.
+        """
+        mask = np.ones(self.size, dtype=bool)
+        for attr, value in zip(BITMAP_ATTRS, (type_filter, category_filter, brand_id)):
+            if value is None:
+                continue
+            bitmap = self._bitmaps[attr].get(value)
+            if bitmap is None:
+                return np.zeros(self.size, dtype=bool)
+            mask &= bitmap
+
+        if price_min is not None or price_max is not None:
+            low, high = 0, self.size
+            if price_min is not None:
+                low = np.searchsorted(self._sorted_prices, price_min, side="left")
+            if price_max is not None:
+                high = np.searchsorted(self._sorted_prices, price_max, side="right")
+            rank = self._rank["price"]
+            mask &= (rank >= low) & (rank < high)
+
+        if ids is not None:
+            selected = np.zeros(self.size, dtype=bool)
+            rows = [self._rows[i] for i in ids if i in self._rows]
+            selected[rows] = True
+            mask &= selected
+        return mask
+
+    def select(self, mask, attr, descending, start, limit):
+        """
+        Returns the rows of the mask in sort order, from a sorted position.
+
+        Args:
+            mask (numpy.ndarray): Result of ``mask``.
+            attr (str): Sort attribute.
+            descending (bool): Walk the order backwards.
+            start (int): First sorted position to consider (the last one,
+                going down, when descending).
+            limit (int): Maximum number of rows.
+
+        Returns:
+            list: Row numbers.
+        """
+        order = self._order[attr]
+        positions = np.flatnonzero(mask[order])
+        if descending:
+            end = np.searchsorted(positions, start, side="right")
+            positions = positions[max(end - limit, 0) : end][::-1]
+        else:
+            begin = np.searchsorted(positions, start, side="left")
+            positions = positions[begin : begin + limit]
+        return order[positions].tolist()
+
+    def contains(self, mask, product_id):
+        """
+        Tells whether a product passes the mask.
+        """
+        return bool(mask[self._rows[product_id]])
@@ -0,0 +1,280 @@
+"""
+Response compression (WSGI middleware).
+
+Text responses (HTML, CSS, JS, JSON, SVG, uncompressed fonts) above
+``COMPRESS_MIN_SIZE`` bytes are compressed on the fly with Brotli (if the
+``brotli`` package is installed) or gzip, whichever the client prefers.
+Streamed responses are flushed chunk by chunk, so the browser still gets
+the start of the page early.
+
+Static files with a precompressed sibling on disk (``style.css.br``,
+``style.css.gz``, as written by ``flask assets-build``) are served from
+that sibling instead, at no per-request cost.
+
+Responses that embed a CSRF token are never compressed (BREACH): with the
+secret and attacker-controlled input (a search query) in one compressed
+body, the response size leaks the token byte by byte. The token is
+rendered into ``base.html``, so this leaves most HTML pages uncompressed;
+static files, JSON and fragments without a form are still compressed.
+Masking the token per response would keep HTML compressible, but every
+form and the ``X-CSRFToken`` header would have to unmask it first.
+"""
+
+import os
+import zlib
+
+from flask import current_app, g, request
+from werkzeug.datastructures import Headers
+from werkzeug.security import safe_join
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - brotli is optional
+    brotli = None
+
+# Content types worth compressing; everything else (images, woff) is
+# compressed already
+COMPRESSIBLE_TYPES = {
+    "text/html",
+    "text/css",
+    "text/plain",
+    "text/javascript",
+    "text/xml",
+    "application/javascript",
+    "application/json",
+    "application/xml",
+    "image/svg+xml",
+    "image/x-icon",
+    "font/ttf",
+    "font/otf",
+    "application/vnd.ms-fontobject",
+}
+
+# File extensions of precompressed siblings
+SIBLING_EXTENSIONS = {"br": ".br", "gzip": ".gz"}
+
+# WSGI environ flag of responses that must be sent uncompressed
+UNCOMPRESSED_KEY = "agt.compress.skip"
+
+
+def parse_accept_encoding(header):
+    """
+    Parses an ``Accept-Encoding`` header.
+
+    Args:
+        header (str): Header value, e.g. ``"gzip, br;q=0.9"``.
+
+    Returns:
+        dict: ``{coding: quality}``; a quality of zero refuses the coding.
+    """
+    codings = {}
+    for part in header.split(","):
+        coding, _, params = part.strip().partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        codings[coding] = quality
+    return codings
+
+
+def choose_encoding(header, brotli_available=brotli is not None):
+    """
+    Picks the best supported content coding for an ``Accept-Encoding`` value.
+
+    Returns:
+        str or None: ``"br"``, ``"gzip"`` or None for no compression.
+    """
+    codings = parse_accept_encoding(header or "")
+    candidates = ["br", "gzip"] if brotli_available else ["gzip"]
+    best, best_quality = None, 0.0
+    for coding in candidates:
+        quality = codings.get(coding, codings.get("*", 0.0))
+        if quality > best_quality:
+            best, best_quality = coding, quality
+    return best
+
+
+class _Compressor:
+    """
+    Incremental gzip or Brotli encoder with a common interface.
+    """
+
+    def __init__(self, encoding, level, brotli_quality):
+        if encoding == "br":
+            self._brotli = brotli.Compressor(quality=brotli_quality)
+            self._zlib = None
+        else:
+            self._brotli = None
+            # wbits 31: gzip container
+            self._zlib = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, data):
+        if self._brotli is not None:
+            return self._brotli.process(data)
+        return self._zlib.compress(data)
+
+    def flush(self):
+        if self._brotli is not None:
+            return self._brotli.flush()
+        return self._zlib.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        if self._brotli is not None:
+            return self._brotli.finish()
+        return self._zlib.flush()
+
+
+def _add_vary(headers):
+    vary = headers.get("Vary")
+    if not vary:
+        headers["Vary"] = "Accept-Encoding"
+    elif "accept-encoding" not in vary.lower():
+        headers["Vary"] = f"{vary}, Accept-Encoding"
+
+
+def _mimetype(headers):
+    return headers.get("Content-Type", "").split(";")[0].strip().lower()
+
+
+class CompressionMiddleware:
+    """
+    Compresses responses of the wrapped WSGI application.
+    """
+
+    def __init__(self, wsgi_app, app):
+        """
+        Args:
+            wsgi_app: The WSGI application to wrap.
+            app (Flask): Application whose config and static folder to use.
+        """
+        self.wsgi_app = wsgi_app
+        self.min_size = app.config["COMPRESS_MIN_SIZE"]
+        self.level = app.config["COMPRESS_LEVEL"]
+        self.brotli_quality = app.config["COMPRESS_BROTLI_QUALITY"]
+        self.static_folder = app.static_folder
+        self.static_prefix = app.static_url_path.rstrip("/") + "/"
+
+    def __call__(self, environ, start_response):
+        encoding = choose_encoding(environ.get("HTTP_ACCEPT_ENCODING"))
+        if encoding is not None:
+            sibling = self._precompressed(environ, encoding)
+            if sibling is not None:
+                # Werkzeug sets Content-Type and Content-Encoding from the name
+                environ = dict(environ, PATH_INFO=sibling)
+                return self.wsgi_app(environ, self._varying(start_response, True))
+
+        if encoding is None or environ.get("REQUEST_METHOD") == "HEAD":
+            return self.wsgi_app(environ, self._varying(start_response))
+        return self._compress(environ, start_response, encoding)
+
+    @staticmethod
+    def _varying(start_response, always=False):
+        """
+        Wraps ``start_response`` to add ``Vary: Accept-Encoding`` to responses
+        that are compressed for other clients.
+        """
+
+        def start(status, headers, exc_info=None):
+            headers = Headers(headers)
+            if always or _mimetype(headers) in COMPRESSIBLE_TYPES:
+                _add_vary(headers)
+            return start_response(status, headers.to_wsgi_list(), exc_info)
+
+        return start
+
+    def _precompressed(self, environ, encoding):
+        """
+        Returns the path of a precompressed sibling of the requested static
+        file, or None.
+        """
+        path = environ.get("PATH_INFO", "")
+        if environ.get("REQUEST_METHOD") not in ("GET", "HEAD"):
+            return None
+        if not path.startswith(self.static_prefix):
+            return None
+        filename = safe_join(self.static_folder, path[len(self.static_prefix) :])
+        if filename is None:
+            return None
+        ext = SIBLING_EXTENSIONS[encoding]
+        if not os.path.isfile(filename + ext):
+            return None
+        return path + ext
+
+    def _should_compress(self, environ, status, headers):
+        if environ.get(UNCOMPRESSED_KEY):
+            return False
+        if not status.startswith("200"):
+            return False
+        if "Content-Encoding" in headers or "Content-Range" in headers:
+            return False
+        if "no-transform" in headers.get("Cache-Control", ""):
+            return False
+        if _mimetype(headers) not in COMPRESSIBLE_TYPES:
+            return False
+        length = headers.get("Content-Length")
+        # Streamed bodies have no length and are usually large
+        return length is None or int(length) >= self.min_size
+
+    def _compress(self, environ, start_response, encoding):
+        state = {}
+
+        def start_compressing(status, headers, exc_info=None):
+            headers = Headers(headers)
+            if _mimetype(headers) in COMPRESSIBLE_TYPES:
+                _add_vary(headers)
+            if self._should_compress(environ, status, headers):
+                state["streamed"] = "Content-Length" not in headers
+                state["compressor"] = _Compressor(
+                    encoding, self.level, self.brotli_quality
+                )
+                headers["Content-Encoding"] = encoding
+                headers.remove("Content-Length")
+                headers.remove("Accept-Ranges")
+                # The compressed body is a different representation
+                etag = headers.get("ETag")
+                if etag and not etag.startswith("W/"):
+                    headers["ETag"] = "W/" + etag
+            return start_response(status, headers.to_wsgi_list(), exc_info)
+
+        body = self.wsgi_app(environ, start_compressing)
+        if "compressor" not in state:
+            return body
+        return self._compressed_body(body, state["compressor"], state["streamed"])
+
+    @staticmethod
+    def _compressed_body(body, compressor, streamed):
+        try:
+            for chunk in body:
+                data = compressor.compress(chunk)
+                if streamed and chunk:
+                    data += compressor.flush()
+                if data:
+                    yield data
+            yield compressor.finish()
+        finally:
+            if hasattr(body, "close"):
+                body.close()
+
+
+def _skip_csrf_responses(response):
+    """
+    Flags responses that rendered a CSRF token, so they are not compressed.
+    """
+    if current_app.config["WTF_CSRF_FIELD_NAME"] in g:
+        request.environ[UNCOMPRESSED_KEY] = True
+    return response
+
+
+def init_compression(app):
+    """
+    Wraps the application in ``CompressionMiddleware``.
+    """
+    app.after_request(_skip_csrf_responses)
+    app.wsgi_app = CompressionMiddleware(app.wsgi_app, app)
@@ -0,0 +1,179 @@
+"""
+Database engine configuration and connection pool health.
+
+``engine_options`` turns the ``DB_*`` settings into
+``SQLALCHEMY_ENGINE_OPTIONS``: pool size and overflow per worker process,
+checkout timeout, pre-ping, recycle and (on PostgreSQL) a server-side
+``statement_timeout``. Every gunicorn worker has its own pool, so the
+database sees up to ``workers * (DB_POOL_SIZE + DB_MAX_OVERFLOW)``
+connections plus those of the CLI workers.
+
+``DB_STATEMENT_TIMEOUTS`` overrides the statement timeout for URL prefixes
+(e.g. a longer one for the admin). The override is applied with
+``SET LOCAL`` when a request's transaction begins, so it costs no extra
+connection and ends with the transaction.
+
+``init_db_pool`` counts pool events per process (checkouts, new and
+invalidated connections, checkout timeouts, peak usage) for ``/healthz``,
+and answers checkout timeouts with ``503`` instead of a server error.
+"""
+
+import threading
+import time
+
+from flask import current_app, g, has_request_context, jsonify, request
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import TimeoutError as PoolTimeout
+
+from . import db
+
+_metrics = {
+    "connects": 0,
+    "checkouts": 0,
+    "invalidated": 0,
+    "timeouts": 0,
+    "peak_checked_out": 0,
+    "last_timeout": None,
+}
+_metrics_lock = threading.Lock()
+
+
+def engine_options(config):
+    """
+    Builds engine options from the ``DB_*`` settings.
+
+    Pool sizing and the statement timeout are left out on SQLite, whose
+    pools differ and which has no statement timeout.
+
+    Args:
+        config (dict): Application config.
+
+    Returns:
+        dict: Value for ``SQLALCHEMY_ENGINE_OPTIONS``.
+    """
+    uri = config.get("SQLALCHEMY_DATABASE_URI")
+    if not uri:
+        return {}
+    backend = make_url(uri).get_backend_name()
+
+    options = {
+        "pool_pre_ping": config["DB_POOL_PRE_PING"],
+        "pool_recycle": config["DB_POOL_RECYCLE"],
+    }
+    if backend == "sqlite":
+        return options
+
+    options.update(
+        pool_size=config["DB_POOL_SIZE"],
+        max_overflow=config["DB_MAX_OVERFLOW"],
+        pool_timeout=config["DB_POOL_TIMEOUT"],
+    )
+    if backend == "postgresql" and config["DB_STATEMENT_TIMEOUT"] > 0:
+        options["connect_args"] = {
+            "options": f"-c statement_timeout={config['DB_STATEMENT_TIMEOUT']}"
+        }
+    return options
+
+
+def _route_timeout():
+    """
+    Statement timeout override for the current URL, or None.
+    """
+    timeout, matched = None, ""
+    for prefix, ms in current_app.config["DB_STATEMENT_TIMEOUTS"].items():
+        if request.path.startswith(prefix) and len(prefix) > len(matched):
+            timeout, matched = ms, prefix
+    return timeout
+
+
+def _count(key, checked_out=None):
+    with _metrics_lock:
+        _metrics[key] += 1
+        if checked_out is not None and checked_out > _metrics["peak_checked_out"]:
+            _metrics["peak_checked_out"] = checked_out
+
+
+def pool_status():
+    """
+    Reads the pool state and counters without touching a connection.
+
+    Returns:
+        dict: ``pool`` (class, size, checked in/out, overflow, capacity;
+        fields the pool class lacks are None) and ``metrics``.
+    """
+    pool = db.engine.pool
+
+    def read(name):
+        method = getattr(pool, name, None)
+        return method() if method is not None else None
+
+    size = read("size")
+    max_overflow = getattr(pool, "_max_overflow", None)
+    capacity = None
+    if size is not None and max_overflow is not None and max_overflow >= 0:
+        capacity = size + max_overflow
+
+    with _metrics_lock:
+        metrics = dict(_metrics)
+    if metrics["last_timeout"] is not None:
+        metrics["last_timeout"] = round(time.time() - metrics["last_timeout"])
+
+    return {
+        "pool": {
+            "class": type(pool).__name__,
+            "size": size,
+            "checked_in": read("checkedin"),
+            "checked_out": read("checkedout"),
+            "overflow": read("overflow"),
+            "capacity": capacity,
+        },
+        "metrics": metrics,
+    }
+
+
+def init_db_pool(app):
+    """
+    Registers the pool counters, per-route statement timeouts and the
+    checkout timeout handler. Call after ``db.init_app``.
+    """
+    with app.app_context():
+        engine = db.engine
+
+    @event.listens_for(engine, "connect")
+    def count_connect(dbapi_connection, connection_record):
+        _count("connects")
+
+    @event.listens_for(engine, "checkout")
+    def count_checkout(dbapi_connection, connection_record, connection_proxy):
+        checked_out = getattr(engine.pool, "checkedout", None)
+        _count("checkouts", checked_out() if checked_out is not None else None)
+
+    @event.listens_for(engine, "invalidate")
+    def count_invalidate(dbapi_connection, connection_record, exception):
+        _count("invalidated")
+
+    if engine.dialect.name == "postgresql" and app.config["DB_STATEMENT_TIMEOUTS"]:
+
+        @event.listens_for(db.session, "after_begin")
+        def set_route_timeout(session, transaction, connection):
+            if not has_request_context():
+                return
+            if "statement_timeout" not in g:
+                g.statement_timeout = _route_timeout()
+            if g.statement_timeout is not None:
+                connection.exec_driver_sql(
+                    f"SET LOCAL statement_timeout = {int(g.statement_timeout)}"
+                )
+
+    @app.errorhandler(PoolTimeout)
+    def pool_exhausted(e):
+        # Every connection of this worker stayed busy for DB_POOL_TIMEOUT
+        with _metrics_lock:
+            _metrics["timeouts"] += 1
+            _metrics["last_timeout"] = time.time()
+        app.logger.warning("Database pool exhausted: %s", e)
+        response = jsonify(success=False, error="Сервер перегружен")
+        response.status_code = 503
+        response.headers["Retry-After"] = "5"
+        return response
@@ -0,0 +1,128 @@
+"""
+Catalog facets: the type/category/brand dropdown values with product counts.
+
+All facets are derived from a single grouped query over ``product``; the
+grouped rows and the facets computed for each filter combination are cached
+in-process until the content version changes (a product or brand was
+written by any process) or ``FACET_CACHE_TTL`` expires.
+"""
+
+import threading
+import time
+from collections import namedtuple
+
+from flask import current_app
+
+from . import db
+from .models import CarBrand, Products
+from .versioning import get_content_version
+
+Facets = namedtuple("Facets", ["types", "categories", "brands"])
+FacetValue = namedtuple("FacetValue", ["value", "count"])
+BrandFacet = namedtuple("BrandFacet", ["id", "name", "count"])
+
+# Upper bound on cached filter combinations (filter values come from the URL)
+MAX_CACHED_COMBINATIONS = 256
+
+_rows = None
+_rows_version = None
+_rows_loaded_at = 0.0
+_facets = {}
+_lock = threading.Lock()
+
+
+def _load_rows():
+    """
+    Runs the grouped facet query.
+
+    Returns:
+        list: Tuples of ``(type, category, brand_id, brand_name, count)``.
+    """
+    return (
+        db.session.query(
+            Products.type,
+            Products.category,
+            Products.brand_id,
+            CarBrand.name,
+            db.func.count(Products.id),
+        )
+        .outerjoin(CarBrand, Products.brand_id == CarBrand.id)
+        .group_by(Products.type, Products.category, Products.brand_id, CarBrand.name)
+        .all()
+    )
+
+
+def compute_facets(rows, type_filter, category_filter):
+    """
+    Derives the dropdown values from the grouped rows.
+
+    Types are narrowed by the category filter, categories and brands by
+    the type filter, so the other dropdowns only offer reachable values.
+    """
+    types, categories, brands = {}, {}, {}
+    for type_, category, brand_id, brand_name, count in rows:
+        if not category_filter or category == category_filter:
+            types[type_] = types.get(type_, 0) + count
+        if not type_filter or type_ == type_filter:
+            categories[category] = categories.get(category, 0) + count
+            if brand_id is not None:
+                name, total = brands.get(brand_id, (brand_name, 0))
+                brands[brand_id] = (name, total + count)
+
+    return Facets(
+        types=[FacetValue(value, count) for value, count in sorted(types.items())],
+        categories=[
+            FacetValue(value, count) for value, count in sorted(categories.items())
+        ],
+        brands=sorted(
+            (BrandFacet(id, name, count) for id, (name, count) in brands.items()),
+            key=lambda brand: str(brand.name),
+        ),
+    )
+
+
+def get_facets(type_filter=None, category_filter=None):
+    """
+    Returns the catalog facets for the active filter combination.
+
+    Args:
+        type_filter (str or None): Selected product type.
+        category_filter (str or None): Selected product category.
+
+    Returns:
+        Facets: Types and categories as ``FacetValue`` lists and brands as
+        a ``BrandFacet`` list sorted by name.
+    """
+    global _rows, _rows_version, _rows_loaded_at
+
+    key = (type_filter or "", category_filter or "")
+    version = get_content_version()
+    ttl = current_app.config["FACET_CACHE_TTL"]
+    with _lock:
+        if (
+            _rows is None
+            or _rows_version != version
+            or time.monotonic() - _rows_loaded_at > ttl
+        ):
+            _rows = _load_rows()
+            _rows_version = version
+            _rows_loaded_at = time.monotonic()
+            _facets.clear()
+
+        facets = _facets.get(key)
+        if facets is None:
+            if len(_facets) >= MAX_CACHED_COMBINATIONS:
+                _facets.clear()
+            facets = _facets[key] = compute_facets(_rows, *key)
+        return facets
+
+
+def invalidate_facets():
+    """
+    Drops the cached facets so the next request reloads them.
+    """
+    global _rows
+
+    with _lock:
+        _rows = None
+        _facets.clear()
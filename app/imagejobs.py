@@ -0,0 +1,258 @@
+"""
+Background generation of image variants.
+
+``save_upload`` stores the original and adds an ``image_job`` row inside
+the view's transaction; the view returns without resizing anything. An
+``ImageWorkerPool`` claims pending jobs and transcodes them in a process
+pool of ``IMAGE_QUEUE_WORKERS`` processes. Pages show the original until a
+job is done; finishing a batch bumps the content version, so ETags and
+cached fragments switch to the variants.
+
+The pool starts lazily in the web process on the first
+``wake_image_workers`` call (``IMAGE_QUEUE_MODE = "thread"``), runs as a
+separate process with ``flask image-worker`` (``"external"``), or is
+skipped altogether (``"inline"``: variants are made in the request).
+Claims are atomic, so several processes can share the queue.
+
+In ``thread`` mode every web worker starts its own pool, so a server with
+N web workers runs N x ``IMAGE_QUEUE_WORKERS`` image processes. The
+default pool is therefore small; with many web workers prefer
+``external`` and size that single pool to the cores it may use.
+
+Pool processes are spawned rather than forked: the web process has
+threads and open database connections that a forked child would inherit.
+"""
+
+import logging
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime, timedelta
+
+from flask import current_app
+
+from . import db
+from .images import process_image, supported_formats, transcode
+from .models import ImageJob
+from .versioning import bump_content_version
+
+logger = logging.getLogger(__name__)
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def enqueue_image(filename):
+    """
+    Queues the generation of variants for an upload in the current
+    transaction (or makes them right away in ``inline`` mode).
+
+    Args:
+        filename (str): Name of the original relative to ``UPLOAD_FOLDER``.
+
+    Returns:
+        ImageJob or None: The queued job.
+    """
+    if not supported_formats():
+        return None
+    if current_app.config["IMAGE_QUEUE_MODE"] == "inline":
+        try:
+            process_image(filename)
+        except (OSError, ValueError) as e:
+            logger.warning("Could not generate variants of %s: %s", filename, e)
+        return None
+
+    job = ImageJob(filename=filename)
+    db.session.add(job)
+    return job
+
+
+def wake_image_workers():
+    """
+    Nudges the worker pool, starting it first in ``thread`` mode.
+    """
+    global _pool
+
+    if current_app.config["IMAGE_QUEUE_MODE"] != "thread":
+        return
+    with _pool_lock:
+        if _pool is None:
+            _pool = ImageWorkerPool(current_app._get_current_object())
+            _pool.start()
+    _pool.wake()
+
+
+class ImageWorkerPool:
+    """
+    Feeds queued image jobs to a pool of worker processes.
+    """
+
+    def __init__(self, app):
+        """
+        Args:
+            app (Flask): Application whose config and database to use.
+        """
+        self.app = app
+        self.workers = app.config["IMAGE_QUEUE_WORKERS"]
+        self.batch_size = self.workers * 2
+        self.poll_interval = app.config["IMAGE_QUEUE_POLL_INTERVAL"]
+        self.max_attempts = app.config["IMAGE_QUEUE_MAX_ATTEMPTS"]
+        self.retry_delay = app.config["IMAGE_QUEUE_RETRY_DELAY"]
+        self.claim_timeout = timedelta(seconds=app.config["IMAGE_QUEUE_CLAIM_TIMEOUT"])
+        self._executor = None
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """
+        Starts the worker processes and the thread that feeds them.
+        """
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+        )
+        self._thread = threading.Thread(
+            target=self._run, name="image-workers", daemon=True
+        )
+        self._thread.start()
+
+    def wake(self):
+        """
+        Makes the idle pool check the queue now.
+        """
+        self._wakeup.set()
+
+    def stop(self, timeout=None):
+        """
+        Lets the current batch finish and shuts the processes down.
+        """
+        self._stopping.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+
+    def run_forever(self):
+        """
+        Runs the pool until interrupted (used by ``flask image-worker``).
+        """
+        self.start()
+        try:
+            while self._thread.is_alive():
+                self._thread.join(1)
+        except KeyboardInterrupt:
+            self.stop()
+
+    def _run(self):
+        while not self._stopping.is_set():
+            try:
+                with self.app.app_context():
+                    done = self.run_once()
+            except Exception:
+                logger.exception("Image worker iteration failed")
+                done = 0
+            if not done:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+
+    def run_once(self):
+        """
+        Claims one batch of due jobs and transcodes it in the pool.
+
+        Must be called inside an application context.
+
+        Returns:
+            int: Number of jobs processed.
+        """
+        batch = self._claim()
+        if not batch:
+            return 0
+
+        folder = self.app.config["UPLOAD_FOLDER"]
+        formats = supported_formats()
+        quality = self.app.config["IMAGE_QUALITY"]
+        futures = {
+            self._executor.submit(
+                transcode, folder, job.filename, formats, quality
+            ): job
+            for job in batch
+        }
+        for future in as_completed(futures):
+            job = futures[future]
+            try:
+                future.result()
+            except Exception as e:
+                self._failed(job, e)
+            else:
+                job.status = "done"
+                job.finished_at = datetime.utcnow()
+                job.last_error = None
+
+        # New variants change the rendered pages
+        bump_content_version(db.session)
+        db.session.commit()
+        return len(batch)
+
+    def _due(self, now):
+        return db.or_(
+            db.and_(ImageJob.status == "pending", ImageJob.next_attempt_at <= now),
+            # Claimed by a worker that died mid-batch
+            db.and_(
+                ImageJob.status == "processing",
+                ImageJob.claimed_at < now - self.claim_timeout,
+            ),
+        )
+
+    def _claim(self):
+        """
+        Atomically marks a batch of due jobs as taken by this pool.
+        """
+        now = datetime.utcnow()
+        ids = (
+            db.session.execute(
+                db.select(ImageJob.id)
+                .where(self._due(now))
+                .order_by(ImageJob.id)
+                .limit(self.batch_size)
+            )
+            .scalars()
+            .all()
+        )
+        claimed = []
+        for job_id in ids:
+            result = db.session.execute(
+                db.update(ImageJob)
+                .where(ImageJob.id == job_id, self._due(now))
+                .values(status="processing", claimed_at=now)
+                .execution_options(synchronize_session=False)
+            )
+            if result.rowcount == 1:
+                claimed.append(job_id)
+        db.session.commit()
+
+        if not claimed:
+            return []
+        return ImageJob.query.filter(ImageJob.id.in_(claimed)).all()
+
+    def _failed(self, job, error):
+        """
+        Schedules a retry with exponential backoff or gives up.
+        """
+        job.attempts += 1
+        job.last_error = str(error)[:1000]
+        if job.attempts >= self.max_attempts:
+            job.status = "failed"
+            logger.error("Giving up on image %s: %s", job.filename, error)
+            return
+
+        delay = min(self.retry_delay * 2 ** (job.attempts - 1), 3600)
+        job.status = "pending"
+        job.next_attempt_at = datetime.utcnow() + timedelta(seconds=delay)
+        logger.warning(
+            "Image %s failed (attempt %s), retrying in %ss: %s",
+            job.filename,
+            job.attempts,
+            delay,
+            error,
+        )
@@ -0,0 +1,511 @@
+"""
+Uploaded image pipeline.
+
+Every uploaded photo is kept as-is (the original) under its SHA-256, as
+``ab/cd/abcd...ef.jpg``: identical uploads share one file, names never
+change their content, and the files are referenced from the
+``photo_filename`` columns of products, blog posts and users. Files no row
+references are removed by ``collect_garbage`` (``flask uploads-gc``).
+
+Originals are resized into variants for the places they are shown:
+
+    thumb   160 px wide   admin lists, cart rows, avatars
+    card    480 px wide   catalog and index grids, blog list
+    full   1200 px wide   product and blog pages
+
+Variants are written next to the original as ``<name>.<variant>.<format>``
+in every format of ``IMAGE_FORMATS`` that Pillow can encode (AVIF, WebP).
+Variants are generated in the background (see ``app/imagejobs.py``).
+Templates render uploads with the ``picture`` global, which emits
+``<source srcset>`` entries for the variants and falls back to the original
+for files that have none (older uploads, or Pillow not installed).
+"""
+
+import hashlib
+import os
+import re
+import tempfile
+import threading
+import time
+from collections import Counter
+
+from flask import current_app, url_for
+from markupsafe import Markup
+from sqlalchemy import func, select, union_all
+from werkzeug.exceptions import BadRequest
+from werkzeug.utils import secure_filename
+
+from . import db
+from .models import Blog, Products, User
+
+try:
+    from PIL import Image, ImageOps, features
+except ImportError:  # pragma: no cover - Pillow is optional at runtime
+    Image = None
+
+# Variant name -> maximum width in pixels
+VARIANTS = {"thumb": 160, "card": 480, "full": 1200}
+
+MIME_TYPES = {"avif": "image/avif", "webp": "image/webp"}
+
+# Extensions accepted for uploads (when the installed Pillow can open them)
+UPLOAD_EXTENSIONS = {".jpg", ".jpeg", ".png", ".gif", ".webp", ".avif"}
+
+# "<stem>.<variant>.<format>" -> stem
+VARIANT_RE = re.compile(
+    r"^(?P<stem>.+)\.(?:%s)\.(?:%s)$" % ("|".join(VARIANTS), "|".join(MIME_TYPES))
+)
+
+# Models whose ``photo_filename`` references stored uploads
+PHOTO_MODELS = (Products, Blog, User)
+
+# Originals that already have variants, per format (they are never removed
+# while the original is in use, so positive answers can be kept)
+_available = {}
+_available_lock = threading.Lock()
+
+# Original -> actual width of each variant (uploads never change content)
+_widths = {}
+
+
+def supported_formats():
+    """
+    Returns the configured variant formats Pillow can encode, best first.
+
+    Returns:
+        tuple: Format names, e.g. ``("avif", "webp")``.
+    """
+    if Image is None:
+        return ()
+    return tuple(
+        fmt for fmt in current_app.config["IMAGE_FORMATS"] if features.check(fmt)
+    )
+
+
+def upload_path(filename):
+    """
+    Returns the absolute path of an uploaded file.
+
+    Args:
+        filename (str): Name relative to ``UPLOAD_FOLDER``.
+
+    Returns:
+        str: Path on disk.
+    """
+    return os.path.join(current_app.config["UPLOAD_FOLDER"], filename)
+
+
+def variant_name(filename, variant, fmt):
+    """
+    Returns the file name of a variant of an upload.
+
+    Args:
+        filename (str): Name of the original.
+        variant (str): Key of ``VARIANTS``.
+        fmt (str): Image format (``webp``, ``avif``).
+
+    Returns:
+        str: e.g. ``filter_1_ab12.card.webp`` for ``filter_1_ab12.png``.
+    """
+    stem = os.path.splitext(filename)[0]
+    return f"{stem}.{variant}.{fmt}"
+
+
+class UnsupportedUpload(BadRequest):
+    """
+    Raised (answered with 400) for an upload that is not a supported image.
+    """
+
+    description = "Недопустимый формат файла"
+
+
+def allowed_extensions():
+    """
+    Returns the upload extensions the installed Pillow can open.
+
+    Without Pillow every extension of ``UPLOAD_EXTENSIONS`` is accepted
+    (no variants are made then anyway).
+
+    Returns:
+        set: Lowercase extensions with the leading dot.
+    """
+    if Image is None:
+        return set(UPLOAD_EXTENSIONS)
+    registered = Image.registered_extensions()
+    return {ext for ext in UPLOAD_EXTENSIONS if registered.get(ext) in Image.OPEN}
+
+
+def _check_image(path):
+    """
+    Raises ``UnsupportedUpload`` unless Pillow recognises the file.
+    """
+    if Image is None:
+        return
+    try:
+        with Image.open(path):
+            pass
+    except (OSError, Image.DecompressionBombError) as e:
+        raise UnsupportedUpload() from e
+
+
+def store_upload(file):
+    """
+    Stores an uploaded file under the hash of its content.
+
+    A file with the same content is stored only once; its modification time
+    is refreshed so ``collect_garbage`` leaves it alone until the row that
+    references it is committed.
+
+    Args:
+        file (FileStorage): The uploaded file.
+
+    Returns:
+        str: Name relative to ``UPLOAD_FOLDER``, e.g. ``ab/cd/abcd...ef.jpg``.
+
+    Raises:
+        UnsupportedUpload: If the extension is not one of
+            ``allowed_extensions()`` or the content is not such an image.
+    """
+    ext = os.path.splitext(secure_filename(file.filename or ""))[1].lower()
+    if ext not in allowed_extensions():
+        raise UnsupportedUpload()
+
+    folder = current_app.config["UPLOAD_FOLDER"]
+    os.makedirs(folder, exist_ok=True)
+
+    digest = hashlib.sha256()
+    fd, tmp_path = tempfile.mkstemp(dir=folder, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            for chunk in iter(lambda: file.stream.read(64 * 1024), b""):
+                digest.update(chunk)
+                f.write(chunk)
+        _check_image(tmp_path)
+
+        content_hash = digest.hexdigest()
+        filename = f"{content_hash[:2]}/{content_hash[2:4]}/{content_hash}{ext}"
+        path = upload_path(filename)
+        if os.path.exists(path):
+            os.remove(tmp_path)
+            os.utime(path)
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return filename
+
+
+def save_upload(file):
+    """
+    Stores an uploaded image and queues the generation of its variants.
+
+    Pages show the original until the variants are ready. The job is added
+    to the current transaction: call ``wake_image_workers`` after the commit.
+
+    Args:
+        file (FileStorage): The uploaded file.
+
+    Returns:
+        str: The stored file name, for ``photo_filename``.
+
+    Raises:
+        UnsupportedUpload: If the file is not a supported image.
+    """
+    from .imagejobs import enqueue_image
+
+    filename = store_upload(file)
+    # A duplicate of an earlier upload already has its variants
+    if not all(has_variants(filename, fmt) for fmt in supported_formats()):
+        enqueue_image(filename)
+    return filename
+
+
+def upload_references():
+    """
+    Counts the rows that reference each stored upload.
+
+    Returns:
+        Counter: ``{filename: number of rows}``.
+    """
+    refs = union_all(
+        *(
+            select(model.photo_filename.label("filename")).where(
+                model.photo_filename.isnot(None)
+            )
+            for model in PHOTO_MODELS
+        )
+    ).subquery()
+    rows = db.session.execute(
+        select(refs.c.filename, func.count()).group_by(refs.c.filename)
+    )
+    return Counter(dict(rows.all()))
+
+
+def collect_garbage(grace_period=86400, dry_run=False):
+    """
+    Removes uploads that no row references, with their variants.
+
+    Files modified within the grace period are kept: they may belong to an
+    upload whose transaction has not committed yet.
+
+    Args:
+        grace_period (int): Minimum age of removed files, in seconds.
+        dry_run (bool): Only report what would be removed.
+
+    Returns:
+        list: Names of the removed files, relative to ``UPLOAD_FOLDER``.
+    """
+    folder = current_app.config["UPLOAD_FOLDER"]
+    referenced = upload_references()
+    cutoff = time.time() - grace_period
+
+    originals, variants = [], []
+    for root, _, files in os.walk(folder):
+        for name in files:
+            filename = os.path.relpath(os.path.join(root, name), folder)
+            filename = filename.replace(os.sep, "/")
+            match = VARIANT_RE.match(filename)
+            if match:
+                variants.append((filename, match.group("stem")))
+            else:
+                originals.append(filename)
+
+    removed, kept_stems = [], set()
+    for filename in originals:
+        path = upload_path(filename)
+        if filename in referenced or os.path.getmtime(path) > cutoff:
+            kept_stems.add(filename.rsplit(".", 1)[0])
+            continue
+        removed.append(filename)
+    for filename, stem in variants:
+        if stem not in kept_stems:
+            removed.append(filename)
+
+    if not dry_run:
+        for filename in removed:
+            try:
+                os.remove(upload_path(filename))
+            except OSError:
+                pass
+        # Drop emptied shard directories
+        for root, _, _ in os.walk(folder, topdown=False):
+            if root != folder and not os.listdir(root):
+                try:
+                    os.rmdir(root)
+                except OSError:
+                    pass
+    return removed
+
+
+def _save_atomic(image, path, fmt, quality):
+    """
+    Encodes an image into a temporary file and moves it into place, so
+    readers never see a half-written variant.
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            image.save(f, format=fmt.upper(), quality=quality)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def transcode(folder, filename, formats, quality):
+    """
+    Writes all variants of an uploaded image next to it.
+
+    Needs no application context, so it can run in a worker process.
+    Images are never enlarged: a variant of a small original keeps its size.
+
+    Args:
+        folder (str): ``UPLOAD_FOLDER``.
+        filename (str): Name of the original relative to ``folder``.
+        formats (tuple): Formats to write.
+        quality (int): Encoder quality (0-100).
+
+    Returns:
+        list: Paths of the written variants.
+    """
+    written = []
+    with Image.open(os.path.join(folder, filename)) as original:
+        image = ImageOps.exif_transpose(original)
+        if image.mode not in ("RGB", "RGBA"):
+            has_alpha = "A" in image.getbands() or "transparency" in image.info
+            image = image.convert("RGBA" if has_alpha else "RGB")
+
+        # Largest first, so each smaller variant is resampled from less data
+        for variant, width in sorted(
+            VARIANTS.items(), key=lambda item: item[1], reverse=True
+        ):
+            if image.width > width:
+                height = max(1, round(image.height * width / image.width))
+                image = image.resize((width, height), Image.LANCZOS)
+            for fmt in formats:
+                variant_path = os.path.join(
+                    folder, variant_name(filename, variant, fmt)
+                )
+                _save_atomic(image, variant_path, fmt, quality)
+                written.append(variant_path)
+    return written
+
+
+def process_image(filename, formats=None):
+    """
+    Generates all variants of an uploaded image in this process.
+
+    Args:
+        filename (str): Name of the original relative to ``UPLOAD_FOLDER``.
+        formats (tuple, optional): Formats to write, ``supported_formats()``
+            by default.
+
+    Returns:
+        list: Paths of the written variants.
+    """
+    formats = supported_formats() if formats is None else formats
+    if not formats:
+        return []
+    return transcode(
+        current_app.config["UPLOAD_FOLDER"],
+        filename,
+        formats,
+        current_app.config["IMAGE_QUALITY"],
+    )
+
+
+def has_variants(filename, fmt):
+    """
+    Tells whether the variants of an upload exist in the given format.
+    """
+    key = (filename, fmt)
+    if key in _available:
+        return True
+    # "thumb" is written last, so it exists only when all variants do
+    if not os.path.exists(upload_path(variant_name(filename, "thumb", fmt))):
+        return False
+    with _available_lock:
+        _available[key] = True
+    return True
+
+
+def variant_widths(filename, fmt):
+    """
+    Returns the actual width of each variant of an upload.
+
+    Originals are never enlarged, so variants of a small image are narrower
+    than ``VARIANTS`` says. The width of the ``full`` variant (read from its
+    header) bounds all of them.
+
+    Args:
+        filename (str): Name of the original.
+        fmt (str): A format its variants exist in.
+
+    Returns:
+        dict: ``{variant: width in pixels}``.
+    """
+    widths = _widths.get(filename)
+    if widths is None:
+        try:
+            with Image.open(upload_path(variant_name(filename, "full", fmt))) as image:
+                largest = image.width
+        except OSError:
+            return dict(VARIANTS)
+        widths = {
+            variant: min(width, largest) for variant, width in VARIANTS.items()
+        }
+        with _available_lock:
+            _widths[filename] = widths
+    return widths
+
+
+def _upload_url(name):
+    return url_for("static", filename=f"uploads/{name}")
+
+
+def image_url(filename, variant="card"):
+    """
+    Returns the URL of one variant, or of the original if it has none.
+
+    Args:
+        filename (str): Name of the original.
+        variant (str): Key of ``VARIANTS``.
+
+    Returns:
+        str: URL of the WebP (or other fallback format) variant.
+    """
+    for fmt in reversed(supported_formats()):
+        if has_variants(filename, fmt):
+            return _upload_url(variant_name(filename, variant, fmt))
+    return _upload_url(filename)
+
+
+def image_srcset(filename, fmt):
+    """
+    Returns a ``srcset`` value listing the variants of an upload.
+
+    Variants are described by their actual width; of the variants that kept
+    the size of a small original only the first one is listed.
+
+    Args:
+        filename (str): Name of the original.
+        fmt (str): Variant format.
+
+    Returns:
+        str: e.g. ``".../x.thumb.webp 160w, .../x.card.webp 480w, ..."``.
+    """
+    candidates, listed = [], set()
+    for variant, width in sorted(
+        variant_widths(filename, fmt).items(), key=lambda item: item[1]
+    ):
+        if width in listed:
+            continue
+        listed.add(width)
+        url = _upload_url(variant_name(filename, variant, fmt))
+        candidates.append(f"{url} {width}w")
+    return ", ".join(candidates)
+
+
+def picture(filename, variant="card", sizes=None, **attrs):
+    """
+    Renders an uploaded image as ``<picture>`` with its responsive variants.
+
+    Args:
+        filename (str): Name of the original.
+        variant (str): Variant used when the browser ignores ``srcset``.
+        sizes (str, optional): ``sizes`` attribute, the variant's width
+            by default.
+        **attrs: Attributes of the ``<img>`` (``class_`` for ``class``);
+            ``loading="lazy"`` is added unless given.
+
+    Returns:
+        Markup: The HTML.
+    """
+    sizes = sizes or f"{VARIANTS[variant]}px"
+    sources = [
+        Markup('<source type="{}" srcset="{}" sizes="{}">').format(
+            MIME_TYPES[fmt], image_srcset(filename, fmt), sizes
+        )
+        for fmt in supported_formats()
+        if has_variants(filename, fmt)
+    ]
+
+    attrs.setdefault("loading", "lazy")
+    img_attrs = Markup("").join(
+        Markup(' {}="{}"').format(name.rstrip("_"), value)
+        for name, value in attrs.items()
+        if value is not None
+    )
+    img = Markup('<img src="{}"{}>').format(image_url(filename, variant), img_attrs)
+    return Markup("<picture>{}{}</picture>").format(Markup("").join(sources), img)
+
+
+def init_images(app):
+    """
+    Makes ``picture`` and ``image_url`` available in templates.
+    """
+    app.jinja_env.globals.update(picture=picture, image_url=image_url)
@@ -0,0 +1,261 @@
+"""
+Outbound mail queue.
+
+Views put messages into the ``mail_outbox`` table with ``enqueue_mail``
+inside their own transaction and return right away. A ``MailDispatcher``
+sends them in the background: worker threads claim batches of due
+messages, send each batch over a single SMTP connection and retry failures
+with exponential backoff.
+
+The dispatcher starts lazily in the web process on the first
+``wake_mail_dispatcher`` call (``MAIL_QUEUE_MODE = "thread"``), or runs as
+a separate process with ``flask mail-worker`` (``MAIL_QUEUE_MODE =
+"external"``). Claims are atomic, so several processes can share the
+outbox.
+"""
+
+import logging
+import threading
+from datetime import datetime, timedelta
+
+from flask import current_app
+from flask_mail import Message
+
+from . import db, mail
+from .models import MailOutbox
+
+logger = logging.getLogger(__name__)
+
+_dispatcher = None
+_dispatcher_lock = threading.Lock()
+
+
+def enqueue_mail(subject, sender, recipients, body=None, html=None):
+    """
+    Adds a message to the outbox in the current transaction.
+
+    The caller commits; call ``wake_mail_dispatcher`` after the commit to
+    have it sent without waiting for the next poll. A message without
+    recipients (e.g. ``REC_EMAIL`` unset) could never be delivered: it is
+    logged and skipped.
+
+    Args:
+        subject (str): Message subject.
+        sender (str or None): From address (``MAIL_DEFAULT_SENDER`` if None).
+        recipients (list): Recipient addresses; empty ones are ignored.
+        body (str, optional): Plain text body.
+        html (str, optional): HTML body.
+
+    Returns:
+        MailOutbox or None: The queued message, None if it was skipped.
+    """
+    recipients = [r.strip() for r in recipients if r and r.strip()]
+    if not recipients:
+        logger.warning("Mail %r has no recipients, not queued", subject)
+        return None
+
+    message = MailOutbox(
+        subject=subject,
+        sender=sender,
+        recipients=",".join(recipients),
+        body=body,
+        html=html,
+    )
+    db.session.add(message)
+    return message
+
+
+def wake_mail_dispatcher():
+    """
+    Nudges the dispatcher, starting it first in ``thread`` mode.
+    """
+    global _dispatcher
+
+    if current_app.config["MAIL_QUEUE_MODE"] != "thread":
+        return
+    with _dispatcher_lock:
+        if _dispatcher is None:
+            _dispatcher = MailDispatcher(current_app._get_current_object())
+            _dispatcher.start()
+    _dispatcher.wake()
+
+
+class MailDispatcher:
+    """
+    Sends queued messages from the outbox in background threads.
+    """
+
+    def __init__(self, app):
+        """
+        Args:
+            app (Flask): Application whose config and database to use.
+        """
+        self.app = app
+        self.batch_size = app.config["MAIL_QUEUE_BATCH_SIZE"]
+        self.poll_interval = app.config["MAIL_QUEUE_POLL_INTERVAL"]
+        self.workers = app.config["MAIL_QUEUE_WORKERS"]
+        self.max_attempts = app.config["MAIL_QUEUE_MAX_ATTEMPTS"]
+        self.retry_delay = app.config["MAIL_QUEUE_RETRY_DELAY"]
+        self.claim_timeout = timedelta(seconds=app.config["MAIL_QUEUE_CLAIM_TIMEOUT"])
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._threads = []
+
+    def start(self):
+        """
+        Starts the worker threads.
+        """
+        for n in range(self.workers):
+            thread = threading.Thread(
+                target=self._run, name=f"mail-dispatcher-{n}", daemon=True
+            )
+            thread.start()
+            self._threads.append(thread)
+
+    def wake(self):
+        """
+        Makes idle workers check the outbox now.
+        """
+        self._wakeup.set()
+
+    def stop(self, timeout=None):
+        """
+        Asks the workers to finish their current batch and exit.
+        """
+        self._stopping.set()
+        self._wakeup.set()
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def run_forever(self):
+        """
+        Runs the workers until interrupted (used by ``flask mail-worker``).
+        """
+        self.start()
+        try:
+            while any(thread.is_alive() for thread in self._threads):
+                for thread in self._threads:
+                    thread.join(1)
+        except KeyboardInterrupt:
+            self.stop()
+
+    def _run(self):
+        while not self._stopping.is_set():
+            try:
+                with self.app.app_context():
+                    sent = self.run_once()
+            except Exception:
+                logger.exception("Mail dispatcher iteration failed")
+                sent = 0
+            if not sent:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+
+    def run_once(self):
+        """
+        Claims and sends one batch of due messages.
+
+        Must be called inside an application context.
+
+        Returns:
+            int: Number of messages processed.
+        """
+        batch = self._claim()
+        if batch:
+            self._send(batch)
+        return len(batch)
+
+    def _due(self, now):
+        return db.or_(
+            db.and_(MailOutbox.status == "pending", MailOutbox.next_attempt_at <= now),
+            # Claimed by a worker that died mid-batch
+            db.and_(
+                MailOutbox.status == "sending",
+                MailOutbox.claimed_at < now - self.claim_timeout,
+            ),
+        )
+
+    def _claim(self):
+        """
+        Atomically marks a batch of due messages as being sent by this worker.
+        """
+        now = datetime.utcnow()
+        ids = (
+            db.session.execute(
+                db.select(MailOutbox.id)
+                .where(self._due(now))
+                .order_by(MailOutbox.id)
+                .limit(self.batch_size)
+            )
+            .scalars()
+            .all()
+        )
+        claimed = []
+        for message_id in ids:
+            result = db.session.execute(
+                db.update(MailOutbox)
+                .where(MailOutbox.id == message_id, self._due(now))
+                .values(status="sending", claimed_at=now)
+                .execution_options(synchronize_session=False)
+            )
+            if result.rowcount == 1:
+                claimed.append(message_id)
+        db.session.commit()
+
+        if not claimed:
+            return []
+        return MailOutbox.query.filter(MailOutbox.id.in_(claimed)).all()
+
+    def _send(self, batch):
+        """
+        Sends a claimed batch over one SMTP connection.
+        """
+        try:
+            with mail.connect() as connection:
+                for message in batch:
+                    try:
+                        connection.send(self._build(message))
+                    except Exception as e:
+                        self._failed(message, e)
+                    else:
+                        message.status = "sent"
+                        message.sent_at = datetime.utcnow()
+                        message.last_error = None
+                    db.session.commit()
+        except Exception as e:
+            # Connection could not be opened (or dropped): retry the rest
+            for message in batch:
+                if message.status == "sending":
+                    self._failed(message, e)
+            db.session.commit()
+
+    def _build(self, message):
+        return Message(
+            subject=message.subject,
+            sender=message.sender or self.app.config.get("MAIL_DEFAULT_SENDER"),
+            recipients=message.recipients.split(","),
+            body=message.body,
+            html=message.html,
+        )
+
+    def _failed(self, message, error):
+        """
+        Schedules a retry with exponential backoff or gives up.
+        """
+        message.attempts += 1
+        message.last_error = str(error)[:1000]
+        if message.attempts >= self.max_attempts:
+            message.status = "failed"
+            logger.error("Giving up on mail %s: %s", message.id, error)
+            return
+
+        delay = min(self.retry_delay * 2 ** (message.attempts - 1), 3600)
+        message.status = "pending"
+        message.next_attempt_at = datetime.utcnow() + timedelta(seconds=delay)
+        logger.warning(
+            "Mail %s failed (attempt %s), retrying in %ss: %s",
+            message.id,
+            message.attempts,
+            delay,
+            error,
+        )
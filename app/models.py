@@ -2,7 +2,7 @@ from . import db
 from flask_login import UserMixin
 from datetime import datetime, timezone
 from sqlalchemy import Enum as SqlEnum
-from werkzeug.security import generate_password_hash, check_password_hash
+from .passwords import hash_password, needs_rehash, verify_password
 from flask_wtf import FlaskForm
 from wtforms import StringField, BooleanField, SubmitField, PasswordField
 from wtforms.validators import DataRequired, Email, Length, EqualTo
@@ -16,6 +16,9 @@ class CarBrand(db.Model):
     __tablename__ = "car_brands"
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(50), nullable=False, unique=True)
+    updated_at = db.Column(
+        db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow
+    )
 
     def __str__(self):
         """
@@ -30,6 +33,12 @@ class Products(db.Model):
     """
 
     __tablename__ = "product"
+    __table_args__ = (
+        # Catalog filters and keyset paging (see routes._catalog_page)
+        db.Index("ix_product_type_category_price", "type", "category", "price"),
+        db.Index("ix_product_category_price", "category", "price"),
+        db.Index("ix_product_price_id", "price", "id"),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(50), nullable=False, unique=True)
@@ -52,13 +61,16 @@ class Products(db.Model):
         ),
         nullable=False,
     )
-    brand_id = db.Column(db.Integer, db.ForeignKey("car_brands.id"))
+    brand_id = db.Column(db.Integer, db.ForeignKey("car_brands.id"), index=True)
     brand = db.relationship("CarBrand", backref="filters")
     price = db.Column(db.Float, nullable=False)
     description = db.Column(db.String(1000), nullable=False)
     in_stock = db.Column(db.Boolean, default=False)
-    is_main = db.Column(db.Boolean, default=False)
+    is_main = db.Column(db.Boolean, default=False, index=True)
     photo_filename = db.Column(db.String(128))
+    updated_at = db.Column(
+        db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow
+    )
 
 
 class Blog(db.Model):
@@ -76,6 +88,23 @@ class Blog(db.Model):
         SqlEnum("Константин", "Сергей", name="blog_autor"), nullable=False
     )
     photo_filename = db.Column(db.String(128))
+    updated_at = db.Column(
+        db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow
+    )
+
+
+class ContentVersion(db.Model):
+    """
+    Version counter of the site content (see app/versioning.py).
+
+    Bumped in the same transaction as every change to products, brands
+    or blog posts; used for ETags and cache keys.
+    """
+
+    __tablename__ = "content_version"
+    name = db.Column(db.String(20), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
 
 
 class Subscriber(db.Model):
@@ -102,13 +131,21 @@ class User(db.Model, UserMixin):
     orders = db.relationship("Order", backref="user", lazy=True)
 
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = hash_password(password)
 
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        return verify_password(self.password_hash, password)
+
+    def password_needs_rehash(self):
+        return needs_rehash(self.password_hash)
 
 
 class Order(db.Model):
+    __table_args__ = (
+        # Заказы пользователя, новые первыми (профиль)
+        db.Index("ix_order_user_id_created_at", "user_id", "created_at"),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     order_number = db.Column(db.String(20), unique=True, index=True)
     user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False)
@@ -134,7 +171,9 @@ class Order(db.Model):
 
 class OrderItem(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    order_id = db.Column(db.Integer, db.ForeignKey("order.id"), nullable=False)
+    order_id = db.Column(
+        db.Integer, db.ForeignKey("order.id"), nullable=False, index=True
+    )
 
     product_id = db.Column(db.Integer, db.ForeignKey("product.id"), nullable=True)
     product_name = db.Column(db.String(255))
@@ -147,24 +186,223 @@ class OrderItem(db.Model):
         return f"<OrderItem {self.product_name} x{self.quantity}>"
 
 
+class OrderCounter(db.Model):
+    """
+    Per-day counter behind order numbers (see generate_order_number).
+    """
+
+    __tablename__ = "order_counter"
+    day = db.Column(db.String(8), primary_key=True)  # YYYYMMDD
+    value = db.Column(db.Integer, nullable=False, default=0)
+
+
+def insert_on_conflict(model):
+    """
+    Returns an INSERT for the model that supports ``on_conflict_do_*``
+    (PostgreSQL in production, SQLite in development).
+    """
+    if db.engine.dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert(model)
+
+
 def generate_order_number():
-    """Генерирует уникальный человекочитаемый номер заказа, например AGT-20251109-0007"""
+    """
+    Генерирует уникальный человекочитаемый номер заказа, например AGT-20251109-0007.
+
+    Номер дня берётся из счётчика order_counter одним атомарным
+    INSERT ... ON CONFLICT DO UPDATE ... RETURNING в отдельной короткой
+    транзакции: параллельные оформления получают разные номера, не ждут
+    друг друга до коммита заказа и не делают повторных попыток.
+    """
     date_part = datetime.utcnow().strftime("%Y%m%d")
-    last_order = Order.query.order_by(Order.id.desc()).first()
-    seq = (last_order.id + 1) if last_order else 1
+    stmt = (
+        insert_on_conflict(OrderCounter)
+        .values(day=date_part, value=1)
+        .on_conflict_do_update(
+            index_elements=[OrderCounter.day],
+            set_={"value": OrderCounter.value + 1},
+        )
+        .returning(OrderCounter.value)
+    )
+    with db.engine.begin() as conn:
+        seq = conn.execute(stmt).scalar_one()
     return f"AGT-{date_part}-{seq:04d}"
 
 
+class MailOutbox(db.Model):
+    """
+    Outgoing email waiting for the background mail dispatcher (app/mailqueue.py).
+    """
+
+    __tablename__ = "mail_outbox"
+    id = db.Column(db.Integer, primary_key=True)
+    subject = db.Column(db.String(255), nullable=False)
+    sender = db.Column(db.String(255))
+    recipients = db.Column(db.Text, nullable=False)  # через запятую
+    body = db.Column(db.Text)
+    html = db.Column(db.Text)
+
+    # pending -> sending -> sent | failed
+    status = db.Column(db.String(20), nullable=False, default="pending", index=True)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    claimed_at = db.Column(db.DateTime)
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    sent_at = db.Column(db.DateTime)
+
+    def __repr__(self):
+        return f"<MailOutbox {self.id} {self.status}>"
+
+
+class HttpSession(db.Model):
+    """
+    Server-side session data (see app/sessions.py); the cookie holds the id.
+    """
+
+    __tablename__ = "http_session"
+    id = db.Column(db.String(64), primary_key=True)
+    data = db.Column(db.LargeBinary, nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+
+
+class ImageJob(db.Model):
+    """
+    Pending generation of image variants for an upload (app/imagejobs.py).
+    """
+
+    __tablename__ = "image_job"
+    id = db.Column(db.Integer, primary_key=True)
+    filename = db.Column(db.String(255), nullable=False)
+
+    # pending -> processing -> done | failed
+    status = db.Column(db.String(20), nullable=False, default="pending", index=True)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    claimed_at = db.Column(db.DateTime)
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    finished_at = db.Column(db.DateTime)
+
+    def __repr__(self):
+        return f"<ImageJob {self.id} {self.filename} {self.status}>"
+
+
 class CartItem(db.Model):
+    __table_args__ = (
+        # Одна строка на товар в корзине пользователя
+        db.Index("uq_cart_item_user_product", "user_id", "product_id", unique=True),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False)
-    product_id = db.Column(db.Integer, db.ForeignKey("product.id"), nullable=False)
+    product_id = db.Column(
+        db.Integer, db.ForeignKey("product.id"), nullable=False, index=True
+    )
     quantity = db.Column(db.Integer, default=1, nullable=False)
 
     user = db.relationship("User", backref="cart_items")
     product = db.relationship("Products")
 
 
+def _cart_line(user_id, product_id):
+    return db.and_(CartItem.user_id == user_id, CartItem.product_id == product_id)
+
+
+def add_cart_item(user_id, product_id, delta=1):
+    """
+    Добавляет товар в корзину (или увеличивает количество) одним запросом.
+
+    INSERT ... SELECT из product ... ON CONFLICT (user_id, product_id)
+    DO UPDATE SET quantity = quantity + delta RETURNING quantity: двойной
+    клик не теряет увеличение, а несуществующий товар просто не вставляется.
+
+    Returns:
+        int or None: Новое количество; None, если товара нет.
+    """
+    stmt = (
+        insert_on_conflict(CartItem)
+        .from_select(
+            [CartItem.user_id, CartItem.product_id, CartItem.quantity],
+            db.select(
+                db.literal(user_id, db.Integer),
+                Products.id,
+                db.literal(delta, db.Integer),
+            ).where(Products.id == product_id),
+        )
+        .on_conflict_do_update(
+            index_elements=[CartItem.user_id, CartItem.product_id],
+            set_={"quantity": CartItem.quantity + delta},
+        )
+        .returning(CartItem.quantity)
+    )
+    return db.session.execute(stmt).scalar_one_or_none()
+
+
+def set_cart_item_quantity(user_id, product_id, quantity):
+    """
+    Задаёт количество товара в корзине одним UPDATE ... RETURNING.
+
+    Returns:
+        int or None: Новое количество; None, если товара нет в корзине.
+    """
+    stmt = (
+        db.update(CartItem)
+        .where(_cart_line(user_id, product_id))
+        .values(quantity=quantity)
+        .returning(CartItem.quantity)
+        .execution_options(synchronize_session=False)
+    )
+    return db.session.execute(stmt).scalar_one_or_none()
+
+
+def change_cart_item_quantity(user_id, product_id, delta):
+    """
+    Изменяет количество товара в корзине на delta (может быть отрицательным).
+
+    Увеличение — тот же upsert, что в add_cart_item; уменьшение — UPDATE
+    ... SET quantity = quantity + delta RETURNING, строка удаляется,
+    когда количество доходит до нуля.
+
+    Returns:
+        int or None: Новое количество (0 — товар удалён); None, если товара
+        нет (или нет в корзине при уменьшении).
+    """
+    if delta > 0:
+        return add_cart_item(user_id, product_id, delta)
+    stmt = (
+        db.update(CartItem)
+        .where(_cart_line(user_id, product_id))
+        .values(quantity=CartItem.quantity + delta)
+        .returning(CartItem.quantity)
+        .execution_options(synchronize_session=False)
+    )
+    quantity = db.session.execute(stmt).scalar_one_or_none()
+    if quantity is not None and quantity <= 0:
+        delete_cart_item(user_id, product_id)
+        return 0
+    return quantity
+
+
+def delete_cart_item(user_id, product_id):
+    """
+    Удаляет товар из корзины одним DELETE ... RETURNING.
+
+    Returns:
+        bool: Была ли такая строка в корзине.
+    """
+    stmt = (
+        db.delete(CartItem)
+        .where(_cart_line(user_id, product_id))
+        .returning(CartItem.id)
+        .execution_options(synchronize_session=False)
+    )
+    return db.session.execute(stmt).scalar_one_or_none() is not None
+
+
 class LoginForm(FlaskForm):
     email = StringField(
         "Email:",
@@ -0,0 +1,232 @@
+"""
+Cursor (keyset) pagination helpers.
+
+A cursor is an opaque url-safe token holding the sort key of the last row
+the client has already seen, so every page is fetched with an index-friendly
+``WHERE (key, id) > (:key, :id) ... LIMIT n`` instead of a growing OFFSET.
+"""
+
+import base64
+import json
+from collections import namedtuple
+
+from sqlalchemy import tuple_
+
+Page = namedtuple("Page", ["items", "next_cursor"])
+
+
+def _is_int(value):
+    """
+    Checks that a cursor value is a plain integer (booleans are rejected).
+    """
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def _is_key(value):
+    """
+    Checks that a cursor value can be bound as a sort key.
+    """
+    return value is None or _is_int(value) or isinstance(value, (str, float))
+
+
+class StreamedPage:
+    """
+    Page whose rows are read from the database while the template iterates
+    them (used for streamed responses).
+
+    ``items`` can be iterated once; ``len()`` and ``next_cursor`` are known
+    after that.
+    """
+
+    def __init__(self, query, per_page, make_cursor):
+        self._query = query
+        self._per_page = per_page
+        self._make_cursor = make_cursor
+        self._count = 0
+        self.next_cursor = None
+
+    @property
+    def items(self):
+        return self
+
+    def __iter__(self):
+        last_item = None
+        for item in self._query:
+            if self._count == self._per_page:
+                # The extra row only tells that another page exists
+                self.next_cursor = self._make_cursor(last_item)
+                continue
+            self._count += 1
+            last_item = item
+            yield item
+
+    def __len__(self):
+        return self._count
+
+
+def _fetch_page(query, per_page, make_cursor, yield_per, fetch=None):
+    """
+    Runs ``query`` limited to one page (plus one row to detect the next),
+    or to ``fetch`` rows when fewer are left to page through.
+    """
+    if fetch is None:
+        fetch = per_page + 1
+    if fetch == 0:
+        return Page([], None)
+
+    query = query.limit(fetch)
+    if yield_per:
+        return StreamedPage(query.yield_per(yield_per), per_page, make_cursor)
+
+    items = query.all()
+    next_cursor = None
+    if len(items) > per_page:
+        items = items[:per_page]
+        next_cursor = make_cursor(items[-1])
+    return Page(items, next_cursor)
+
+
+def encode_cursor(payload):
+    """
+    Packs cursor data into an opaque url-safe token.
+
+    Args:
+        payload (dict): JSON-serialisable cursor data.
+
+    Returns:
+        str: Url-safe token.
+    """
+    raw = json.dumps(payload, separators=(",", ":"), ensure_ascii=False)
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(token):
+    """
+    Unpacks a token produced by ``encode_cursor``.
+
+    Args:
+        token (str): Token from the query string.
+
+    Returns:
+        dict: Cursor data.
+
+    Raises:
+        ValueError: If the token is malformed.
+    """
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        payload = json.loads(raw)
+    except (ValueError, TypeError) as e:
+        raise ValueError("Invalid cursor") from e
+    if not isinstance(payload, dict):
+        raise ValueError("Invalid cursor")
+    return payload
+
+
+def cursor_key(cursor, tag):
+    """
+    Validates a keyset cursor and returns its position.
+
+    Args:
+        cursor (dict): Decoded cursor.
+        tag (str): Sort mode the cursor must have been issued for.
+
+    Returns:
+        tuple: ``(key, id)`` of the last item of the previous page.
+
+    Raises:
+        ValueError: If the cursor is invalid or belongs to another order.
+    """
+    if cursor.get("s") != tag or "k" not in cursor or "i" not in cursor:
+        raise ValueError("Cursor does not match the sort order")
+    if not _is_key(cursor["k"]) or not _is_int(cursor["i"]):
+        raise ValueError("Invalid cursor")
+    return cursor["k"], cursor["i"]
+
+
+def cursor_offset(cursor, tag):
+    """
+    Validates an offset cursor and returns its offset.
+
+    Raises:
+        ValueError: If the cursor is invalid or belongs to another order.
+    """
+    if cursor.get("s") != tag or not _is_int(cursor.get("o")):
+        raise ValueError("Cursor does not match the sort order")
+    return max(cursor["o"], 0)
+
+
+def keyset_page(
+    query, column, id_column, descending, cursor, per_page, tag, yield_per=None
+):
+    """
+    Fetches one page ordered by ``(column, id_column)``.
+
+    Args:
+        query (Query): Filtered, unordered query.
+        column (InstrumentedAttribute): Sort column.
+        id_column (InstrumentedAttribute): Unique tie-breaker column.
+        descending (bool): Sort direction.
+        cursor (dict or None): Decoded cursor of the previous page.
+        per_page (int): Page size.
+        tag (str): Sort mode stored in the cursor, so a cursor issued for
+            one ordering is not applied to another.
+        yield_per (int, optional): Stream the rows in batches of this size
+            instead of loading the page at once.
+
+    Returns:
+        Page or StreamedPage: Items of the page and the cursor of the next
+        one (or None).
+    """
+    key = tuple_(column, id_column)
+    if cursor is not None:
+        last = cursor_key(cursor, tag)
+        query = query.filter(key < last if descending else key > last)
+
+    if descending:
+        query = query.order_by(column.desc(), id_column.desc())
+    else:
+        query = query.order_by(column.asc(), id_column.asc())
+
+    def make_cursor(last_item):
+        return encode_cursor(
+            {
+                "s": tag,
+                "k": getattr(last_item, column.key),
+                "i": getattr(last_item, id_column.key),
+            }
+        )
+
+    return _fetch_page(query, per_page, make_cursor, yield_per)
+
+
+def offset_page(query, cursor, per_page, tag, limit=None, yield_per=None):
+    """
+    Fetches one page of an already ordered query by offset.
+
+    Used for relevance-ranked search results, whose sort key is computed
+    per query and whose listing is bounded by ``limit``.
+
+    Args:
+        query (Query): Filtered and ordered query.
+        cursor (dict or None): Decoded cursor of the previous page.
+        per_page (int): Page size.
+        tag (str): Sort mode stored in the cursor.
+        limit (int, optional): Total number of rows that can be paged
+            through (unbounded by default).
+        yield_per (int, optional): Stream the rows in batches of this size.
+
+    Returns:
+        Page or StreamedPage: Items of the page and the cursor of the next
+        one (or None).
+    """
+    offset = cursor_offset(cursor, tag) if cursor is not None else 0
+
+    fetch = per_page + 1
+    if limit is not None:
+        fetch = min(fetch, max(limit - offset, 0))
+
+    def make_cursor(last_item):
+        return encode_cursor({"s": tag, "o": offset + per_page})
+
+    return _fetch_page(query.offset(offset), per_page, make_cursor, yield_per, fetch)
@@ -0,0 +1,128 @@
+"""
+Password hashing.
+
+Hashes are made with ``PASSWORD_HASH_METHOD`` (any werkzeug method string,
+e.g. ``scrypt:32768:8:1`` or ``pbkdf2:sha256:600000``). A stored hash made
+with other parameters still verifies; ``needs_rehash`` tells the login view
+to replace it with one made with the current method.
+
+Hashing is CPU-bound, so it runs in a pool of ``PASSWORD_HASH_WORKERS``
+processes instead of the request thread (0 hashes inline). At most
+``PASSWORD_HASH_MAX_PENDING`` hashes are queued or running; a request that
+cannot get a slot within ``PASSWORD_HASH_TIMEOUT`` seconds gets
+``HashingBusy`` instead of queueing up behind a login burst.
+
+The pool belongs to one web worker process: with four gunicorn workers and
+``PASSWORD_HASH_WORKERS = 2`` there are eight hashing processes. Its
+processes are spawned rather than forked, so they do not inherit the
+worker's threads, locks or database connections.
+"""
+
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from flask import current_app
+from werkzeug.security import check_password_hash, generate_password_hash
+
+_pool = None
+_slots = None
+_pool_lock = threading.Lock()
+
+
+class HashingBusy(Exception):
+    """
+    Raised when too many passwords are already waiting to be hashed.
+    """
+
+
+def _get_pool():
+    global _pool, _slots
+
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=current_app.config["PASSWORD_HASH_WORKERS"],
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+            _slots = threading.BoundedSemaphore(
+                current_app.config["PASSWORD_HASH_MAX_PENDING"]
+            )
+        return _pool, _slots
+
+
+def _run(func, *args):
+    """
+    Runs a hashing function in the pool (or inline without workers).
+    """
+    if current_app.config["PASSWORD_HASH_WORKERS"] <= 0:
+        return func(*args)
+
+    pool, slots = _get_pool()
+    if not slots.acquire(timeout=current_app.config["PASSWORD_HASH_TIMEOUT"]):
+        raise HashingBusy()
+    try:
+        return pool.submit(func, *args).result()
+    finally:
+        slots.release()
+
+
+def shutdown_pool():
+    """
+    Stops the hashing processes; the next hash starts a new pool.
+    """
+    global _pool, _slots
+
+    with _pool_lock:
+        pool, _pool, _slots = _pool, None, None
+    if pool is not None:
+        pool.shutdown(wait=True)
+
+
+def hash_password(password):
+    """
+    Hashes a password with the configured method.
+
+    Args:
+        password (str): Plain-text password.
+
+    Returns:
+        str: Hash for ``User.password_hash``.
+
+    Raises:
+        HashingBusy: If the hashing pool is saturated.
+    """
+    return _run(
+        generate_password_hash, password, current_app.config["PASSWORD_HASH_METHOD"]
+    )
+
+
+def verify_password(password_hash, password):
+    """
+    Checks a password against a stored hash (of any method).
+
+    Raises:
+        HashingBusy: If the hashing pool is saturated.
+    """
+    return _run(check_password_hash, password_hash, password)
+
+
+def needs_rehash(password_hash):
+    """
+    Tells whether a hash was made with other parameters than the
+    configured method.
+    """
+    prefix = current_app.extensions["password_hash_prefix"]
+    return password_hash.split("$", 1)[0] != prefix
+
+
+def init_passwords(app):
+    """
+    Works out the parameter prefix of the hashes the configured method
+    makes, once per process rather than on every login.
+    """
+    # werkzeug fills in default parameters (e.g. "pbkdf2" ->
+    # "pbkdf2:sha256:600000"): hash once to get the full prefix
+    method = app.config["PASSWORD_HASH_METHOD"]
+    prefix = generate_password_hash("", method).split("$", 1)[0]
+    app.extensions["password_hash_prefix"] = prefix
@@ -5,10 +5,13 @@ from flask import (
     redirect,
     url_for,
     flash,
-    current_app,
 )
 from flask_login import login_required, current_user
-from app.models import CartItem
+from sqlalchemy.orm import joinedload, selectinload
+from app.models import CartItem, Order
+from app.cart_state import remember_cart
+from app.images import save_upload
+from app.imagejobs import wake_image_workers
 from app import db
 
 prof_bp = Blueprint("prof", __name__)
@@ -18,7 +21,12 @@ prof_bp = Blueprint("prof", __name__)
 @login_required
 def profile():
     user = current_user
-    cart_items = CartItem.query.filter_by(user_id=user.id).all()
+    cart_items = (
+        CartItem.query.options(joinedload(CartItem.product))
+        .filter_by(user_id=user.id)
+        .all()
+    )
+    remember_cart(cart_items)  # пересинхронизируем сводку корзины в сессии
     return render_template("profile.html", user=user, cart_items=cart_items)
 
 
@@ -46,15 +54,7 @@ def profile_edit():
                 )
 
             if allowed_file(photo.filename):
-                from werkzeug.utils import secure_filename
-                import os
-
-                filename = secure_filename(photo.filename)
-                upload_folder = os.path.join(current_app.root_path, "static", "uploads")
-                os.makedirs(upload_folder, exist_ok=True)
-
-                filepath = os.path.join(upload_folder, filename)
-                photo.save(filepath)
+                filename = save_upload(photo)
 
                 # Сохраняем имя файла в БД
                 current_user.photo_filename = filename
@@ -64,6 +64,7 @@ def profile_edit():
                 )
 
         db.session.commit()
+        wake_image_workers()
         flash("Профиль успешно обновлён", "success")
         return redirect(url_for("prof.profile"))
 
@@ -74,6 +75,8 @@ def profile_edit():
 @login_required
 def order_list():
     user_orders = (
-        current_user.orders
-    )  # или Order.query.filter_by(user_id=current_user.id).all()
+        Order.query.options(selectinload(Order.items))
+        .filter_by(user_id=current_user.id)
+        .all()
+    )
     return render_template("orders.html", orders=user_orders)
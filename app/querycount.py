@@ -0,0 +1,59 @@
+"""
+Query budget guard for tests.
+
+Usage::
+
+    with app.app_context(), query_budget(3):
+        client.get("/profile")
+
+The block fails with ``QueryBudgetExceeded`` when more statements than the
+budget were executed, listing them to make N+1 patterns easy to spot. The
+counter listens on the whole engine, so run it without concurrent traffic.
+"""
+
+from contextlib import contextmanager
+
+from sqlalchemy import event
+
+from . import db
+
+
+class QueryBudgetExceeded(AssertionError):
+    """
+    Raised when a block executes more SQL statements than allowed.
+    """
+
+
+@contextmanager
+def query_budget(limit, engine=None):
+    """
+    Counts SQL statements executed inside the block.
+
+    Args:
+        limit (int): Maximum number of statements allowed.
+        engine (Engine, optional): Engine to watch, ``db.engine`` by default.
+
+    Yields:
+        list: Statements executed so far (grows while the block runs).
+
+    Raises:
+        QueryBudgetExceeded: If the block executed more than ``limit``
+            statements.
+    """
+    engine = engine if engine is not None else db.engine
+    statements = []
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", count)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, "before_cursor_execute", count)
+
+    if len(statements) > limit:
+        listing = "\n".join(f"  {i}. {sql}" for i, sql in enumerate(statements, 1))
+        raise QueryBudgetExceeded(
+            f"Expected at most {limit} queries, got {len(statements)}:\n{listing}"
+        )
@@ -7,21 +7,41 @@ from flask import (
     url_for,
     flash,
     jsonify,
+    abort,
+    current_app,
+    stream_template,
+    stream_with_context,
 )
 from flask_login import login_required, current_user
+from flask_wtf.csrf import generate_csrf
 from markupsafe import Markup
 from app.models import (
     Subscriber,
     Blog,
     Products,
-    CarBrand,
     CartItem,
     OrderItem,
     Order,
+    add_cart_item,
+    change_cart_item_quantity,
+    delete_cart_item,
     generate_order_number,
+    set_cart_item_quantity,
 )
-from flask_mail import Message
-from app import db, mail, csrf
+from app.search import apply_search
+from app.cart_state import (
+    clear_cart_state,
+    get_cart_quantities,
+    remember_cart,
+    set_cart_quantity,
+)
+from app.facets import get_facets
+from app.snapshot import get_snapshot
+from app.dbpool import pool_status
+from app.versioning import conditional
+from app.pagination import decode_cursor, keyset_page, offset_page
+from app.mailqueue import enqueue_mail, wake_mail_dispatcher
+from app import db, csrf
 from datetime import datetime, timezone
 import re
 import os
@@ -109,6 +129,7 @@ def copy_link():
 
 @main_bp.route("/")
 @main_bp.route("/home")
+@conditional
 def index():
     """
     Renders the homepage with recent blog posts and main products.
@@ -116,12 +137,17 @@ def index():
     Returns:
         str: Rendered HTML of the index page.
     """
-    posts = Blog.query.order_by(Blog.date.desc()).limit(3).all()
-    main_products = Products.query.filter_by(is_main=True).limit(3).all()
+    # Queries are executed by the template only on a fragment cache miss
+    posts = Blog.query.order_by(Blog.date.desc()).limit(3)
+    if current_app.config["CATALOG_SNAPSHOT"]:
+        main_products = get_snapshot().main_products[:3]
+    else:
+        main_products = Products.query.filter_by(is_main=True).limit(3)
     return render_template("index.html", posts=posts, main_products=main_products)
 
 
 @main_bp.route("/contacts")
+@conditional
 def contacts():
     """
     Renders the contacts page.
@@ -132,6 +158,25 @@ def contacts():
     return render_template("contacts.html")
 
 
+@main_bp.route("/healthz")
+def healthz():
+    """
+    Health check for the load balancer: reports the connection pool of
+    this worker without opening a connection.
+
+    Returns:
+        tuple: JSON status; 503 while every pooled connection is in use.
+    """
+    status = pool_status()
+    pool = status["pool"]
+    saturated = pool["capacity"] is not None and pool["checked_out"] >= pool["capacity"]
+    status["status"] = "saturated" if saturated else "ok"
+    status["pid"] = os.getpid()
+    response = jsonify(status)
+    response.headers["Cache-Control"] = "no-store"
+    return response, 503 if saturated else 200
+
+
 @main_bp.app_errorhandler(404)
 def page_not_found(e):
     """
@@ -147,6 +192,7 @@ def page_not_found(e):
 
 
 @main_bp.route("/about")
+@conditional
 def about():
     """
     Renders the about page.
@@ -168,40 +214,46 @@ def thank_you():
     return render_template("thank_you.html")
 
 
-@main_bp.route("/catalog")
-def catalog():
+# Sort mode -> (column, descending)
+CATALOG_SORTS = {
+    "name_asc": (Products.name, False),
+    "name_desc": (Products.name, True),
+    "price_asc": (Products.price, False),
+    "price_desc": (Products.price, True),
+}
+
+# Sort labels for UI
+SORT_LABELS = {
+    "name_asc": "Имя: А → Я",
+    "name_desc": "Имя: Я → А",
+    "price_asc": "Цена ↑",
+    "price_desc": "Цена ↓",
+}
+
+
+def _catalog_query(args):
     """
-    Renders the product catalog with search, filtering and sorting.
+    Builds the filtered (but not yet ordered) product query for the catalog.
 
-    Query Parameters:
-        q (str): Search query.
-        sort (str): Sort type ('name_asc', 'name_desc', 'price_asc', 'price_desc').
-        type (str): Product type filter.
-        category (str): Product category filter.
-        brand (str): Brand ID filter.
-        price_min (str): Minimum price filter.
-        price_max (str): Maximum price filter.
+    Args:
+        args (MultiDict): Request query parameters.
 
     Returns:
-        str: Rendered catalog page with filtered product list.
+        tuple: The query and the relevance ORDER BY clause of the search
+        (None when there is no search query).
     """
-    query = request.args.get("q", "").strip()
-    sort = request.args.get("sort")
-    type_filter = request.args.get("type")
-    category_filter = request.args.get("category")
-    brand_filter = request.args.get("brand")
-    price_min = request.args.get("price_min")
-    price_max = request.args.get("price_max")
+    query = args.get("q", "").strip()
+    type_filter = args.get("type")
+    category_filter = args.get("category")
+    brand_filter = args.get("brand")
+    price_min = args.get("price_min")
+    price_max = args.get("price_max")
     filters = Products.query
+    rank = None
 
     # Search
     if query:
-        filters = filters.filter(
-            db.or_(
-                Products.name.ilike(f"%{query}%"),
-                Products.article.cast(db.String).ilike(f"%{query}%"),
-            )
-        )
+        filters, rank = apply_search(filters, query)
 
     # Filtering
     if type_filter:
@@ -215,75 +267,227 @@ def catalog():
     if price_max:
         filters = filters.filter(Products.price <= int(price_max))
 
-    # Sorting
-    if sort == "name_asc":
-        filters = filters.order_by(Products.name.asc())
-    elif sort == "name_desc":
-        filters = filters.order_by(Products.name.desc())
-    elif sort == "price_asc":
-        filters = filters.order_by(Products.price.asc())
-    elif sort == "price_desc":
-        filters = filters.order_by(Products.price.desc())
-    else:
-        filters = filters.order_by(Products.name.asc())
+    return filters, rank
 
-    # Получаем данные
-    products = filters.all()
 
-    # Sort labels for UI
-    sort_labels = {
-        "name_asc": "Имя: А → Я",
-        "name_desc": "Имя: Я → А",
-        "price_asc": "Цена ↑",
-        "price_desc": "Цена ↓",
-    }
-    current_sort_label = sort_labels.get(sort, "По умолчанию")
+def _catalog_page(args, yield_per=None):
+    """
+    Fetches one page of the catalog for the given query parameters.
 
-    # Dropdown values (type/category/brand)
-    type_query = db.session.query(Products.type).distinct()
-    category_query = db.session.query(Products.category).distinct()
+    Search results without an explicit sort are ordered by relevance and
+    paged by offset; every other ordering is paged by keyset.
 
-    if type_filter:
-        category_query = category_query.filter(Products.type == type_filter)
-    if category_filter:
-        type_query = type_query.filter(Products.category == category_filter)
+    Args:
+        args (MultiDict): Request query parameters (``cursor`` and
+            ``per_page`` control paging).
+        yield_per (int, optional): Stream the products from the database
+            while the page is rendered (the snapshot needs no streaming).
+
+    Returns:
+        Page or StreamedPage: Products of the page and the cursor of the
+        next one.
+    """
+    per_page = args.get(
+        "per_page", default=current_app.config["CATALOG_PAGE_SIZE"], type=int
+    )
+    per_page = min(max(per_page, 1), current_app.config["CATALOG_MAX_PAGE_SIZE"])
+
+    if current_app.config["CATALOG_SNAPSHOT"]:
+        return _snapshot_page(args, per_page)
 
-    types = [row[0] for row in type_query]
-    categories = [row[0] for row in category_query]
+    filters, rank = _catalog_query(args)
 
-    brand_query = db.session.query(Products.brand_id)
+    try:
+        cursor = decode_cursor(args["cursor"]) if args.get("cursor") else None
+        sort = args.get("sort")
+        if sort not in CATALOG_SORTS and rank is not None:
+            return offset_page(
+                filters.order_by(rank, Products.name.asc()),
+                cursor,
+                per_page,
+                "rank",
+                limit=current_app.config["SEARCH_MAX_RESULTS"],
+                yield_per=yield_per,
+            )
+        if sort not in CATALOG_SORTS:
+            sort = "name_asc"
+        column, descending = CATALOG_SORTS[sort]
+        return keyset_page(
+            filters, column, Products.id, descending, cursor, per_page, sort, yield_per
+        )
+    except ValueError:
+        abort(400)
 
-    if type_filter not in (None, ""):
-        brand_query = brand_query.filter(Products.type == type_filter)
 
-    brand_ids = [row[0] for row in brand_query.distinct() if row[0] is not None]
+def _snapshot_page(args, per_page):
+    """
+    Fetches one page of the catalog from the in-memory snapshot.
+
+    Args:
+        args (MultiDict): Request query parameters.
+        per_page (int): Page size.
 
-    if brand_ids:
-        brands = (
-            CarBrand.query.filter(CarBrand.id.in_(brand_ids))
-            .order_by(CarBrand.name)
-            .all()
+    Returns:
+        Page: Products of the page and the cursor of the next one.
+    """
+    brand = args.get("brand")
+    price_min = args.get("price_min")
+    price_max = args.get("price_max")
+    try:
+        cursor = decode_cursor(args["cursor"]) if args.get("cursor") else None
+        return get_snapshot().page(
+            args.get("sort"),
+            cursor,
+            per_page,
+            text=args.get("q", "").strip(),
+            type_filter=args.get("type"),
+            category_filter=args.get("category"),
+            brand_id=int(brand) if brand else None,
+            price_min=int(price_min) if price_min else None,
+            price_max=int(price_max) if price_max else None,
+            max_results=current_app.config["SEARCH_MAX_RESULTS"],
         )
-    else:
-        brands = []
+    except ValueError:
+        abort(400)
 
-    user_cart_items = {
-        item.product_id: item
-        for item in CartItem.query.filter_by(user_id=current_user.id).all()
-    }
 
-    return render_template(
-        "catalog.html",
-        products=products,
+@main_bp.route("/catalog")
+@conditional
+def catalog():
+    """
+    Renders the product catalog with search, filtering and sorting.
+
+    Query Parameters:
+        q (str): Search query (results are ranked by relevance unless
+            an explicit sort is chosen).
+        sort (str): Sort type ('name_asc', 'name_desc', 'price_asc', 'price_desc').
+        type (str): Product type filter.
+        category (str): Product category filter.
+        brand (str): Brand ID filter.
+        price_min (str): Minimum price filter.
+        price_max (str): Maximum price filter.
+        cursor (str): Opaque cursor of the page to show.
+        per_page (int): Page size (capped by ``CATALOG_MAX_PAGE_SIZE``).
+
+    Returns:
+        str or Response: Rendered catalog page with the first page of
+        filtered products (streamed when ``CATALOG_STREAMING`` is on).
+    """
+    sort = request.args.get("sort")
+    type_filter = request.args.get("type")
+    category_filter = request.args.get("category")
+    streaming = current_app.config["CATALOG_STREAMING"]
+
+    # Получаем данные (при стриминге товары читаются во время рендера)
+    page = _catalog_page(
+        request.args,
+        yield_per=current_app.config["CATALOG_STREAM_YIELD_PER"] if streaming else None,
+    )
+
+    current_sort_label = SORT_LABELS.get(sort, "По умолчанию")
+
+    # Dropdown values (type/category/brand)
+    if current_app.config["CATALOG_SNAPSHOT"]:
+        facets = get_snapshot().facets(type_filter, category_filter)
+    else:
+        facets = get_facets(type_filter, category_filter)
+
+    context = dict(
+        page=page,
+        products=page.items,
+        next_url=lambda cursor: _catalog_url("main.catalog", cursor),
+        next_page_url=lambda cursor: _catalog_url("main.catalog_page", cursor),
         current_sort_label=current_sort_label,
-        types=types,
-        categories=categories,
-        brands=brands,
-        user_cart_items=user_cart_items,
+        types=facets.types,
+        categories=facets.categories,
+        brands=facets.brands,
+        cart_quantities=get_cart_quantities(),
+    )
+    if not streaming:
+        return render_template("catalog.html", **context)
+
+    # The session is saved before the body is sent: create the CSRF token now
+    generate_csrf()
+    chunks = stream_template("catalog.html", **context)
+    return current_app.response_class(
+        stream_with_context(
+            _buffered(chunks, current_app.config["CATALOG_STREAM_BUFFER"])
+        ),
+        mimetype="text/html",
+    )
+
+
+def _catalog_url(endpoint, cursor):
+    """
+    Returns the URL of the next catalog page, keeping the current filters.
+    """
+    args = request.args.to_dict()
+    args["cursor"] = cursor
+    return url_for(endpoint, **args)
+
+
+# Marks where a streamed template flushes what it has rendered so far
+STREAM_FLUSH = "<!-- stream:flush -->"
+
+
+def _buffered(chunks, size):
+    """
+    Joins the small pieces a streamed template yields into larger chunks.
+
+    A chunk is sent once it reaches ``size`` characters, or at a
+    ``STREAM_FLUSH`` mark, which comes right before the template starts
+    reading products from the database.
+
+    Args:
+        chunks (iterable): Template output pieces.
+        size (int): Minimum chunk size.
+
+    Yields:
+        str: Output chunks.
+    """
+    buffer, buffered = [], 0
+    for chunk in chunks:
+        buffer.append(chunk)
+        buffered += len(chunk)
+        if buffered >= size or STREAM_FLUSH in chunk:
+            yield "".join(buffer)
+            buffer, buffered = [], 0
+    if buffer:
+        yield "".join(buffer)
+
+
+@main_bp.route("/catalog/page")
+@conditional
+def catalog_page():
+    """
+    Returns the next page of the catalog for infinite scroll.
+
+    Accepts the same query parameters as ``catalog``.
+
+    Returns:
+        Response: JSON with rendered product cards and the next cursor.
+    """
+    page = _catalog_page(request.args)
+
+    next_page_url = None
+    if page.next_cursor:
+        next_page_url = _catalog_url("main.catalog_page", page.next_cursor)
+
+    html = render_template(
+        "_product_cards.html",
+        products=page.items,
+        cart_quantities=get_cart_quantities(),
+    )
+    return jsonify(
+        html=html,
+        count=len(page.items),
+        next_cursor=page.next_cursor,
+        next_page_url=next_page_url,
     )
 
 
 @main_bp.route("/product_card/<int:product_id>")
+@conditional
 def product_card(product_id):
     """
     Renders the product detail page.
@@ -294,17 +498,19 @@ def product_card(product_id):
     Returns:
         str: Rendered product card page.
     """
-    product = Products.query.get_or_404(product_id)
-    user_cart_items = {
-        item.product_id: item
-        for item in CartItem.query.filter_by(user_id=current_user.id).all()
-    }
+    if current_app.config["CATALOG_SNAPSHOT"]:
+        product = get_snapshot().get(product_id)
+        if product is None:
+            abort(404)
+    else:
+        product = Products.query.get_or_404(product_id)
     return render_template(
-        "product_card.html", product=product, user_cart_items=user_cart_items
+        "product_card.html", product=product, cart_quantities=get_cart_quantities()
     )
 
 
 @main_bp.route("/blog")
+@conditional
 def blog():
     """
     Renders the list of blog posts sorted by date descending.
@@ -312,11 +518,13 @@ def blog():
     Returns:
         str: Rendered blog list page.
     """
-    blogs = Blog.query.order_by(Blog.date.desc()).all()
+    # Executed by the template only on a fragment cache miss
+    blogs = Blog.query.order_by(Blog.date.desc())
     return render_template("blog.html", blogs=blogs)
 
 
 @main_bp.route("/blog_card/<int:blog_id>")
+@conditional
 def blog_card(blog_id):
     """
     Renders a single blog post page.
@@ -366,58 +574,61 @@ def admin_logout():
 cart_bp = Blueprint("cart", __name__, url_prefix="/cart")
 
 
+def _to_int(value):
+    """
+    Converts a product id or quantity from the request to int.
+
+    Returns:
+        int or None: None if the value is missing or not an integer.
+    """
+    if isinstance(value, bool):
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
 @cart_bp.route("/add", methods=["POST"])
 @login_required
 def add_to_cart():
     data = request.get_json()
-    product_id = data.get("product_id")
+    product_id = _to_int(data.get("product_id"))
 
     if not product_id:
         return jsonify(success=False, message="Нет product_id"), 400
 
-    product = Products.query.get(product_id)
-    if not product:
+    # Один атомарный upsert вместо чтения, увеличения и записи
+    quantity = add_cart_item(current_user.id, product_id)
+    if quantity is None:
+        db.session.rollback()
         return jsonify(success=False, message="Товар не найден"), 404
 
-    # Проверка, есть ли уже такой товар в корзине
-    item = CartItem.query.filter_by(
-        user_id=current_user.id, product_id=product_id
-    ).first()
-
-    if item:
-        item.quantity += 1
-    else:
-        item = CartItem(user_id=current_user.id, product_id=product_id, quantity=1)
-        db.session.add(item)
-
-    print("data from JS:", data)
-
     db.session.commit()
-    return jsonify(success=True, quantity=item.quantity)
+    set_cart_quantity(product_id, quantity)
+    return jsonify(success=True, quantity=quantity)
 
 
 @cart_bp.route("/update", methods=["POST"])
 @login_required
 def update_cart():
     data = request.get_json()
-    product_id = data.get("product_id")
-    quantity = data.get("quantity")
+    product_id = _to_int(data.get("product_id"))
+    quantity = _to_int(data.get("quantity"))
 
     if not product_id or quantity is None:
         return jsonify(success=False, message="Некорректные данные"), 400
 
-    item = CartItem.query.filter_by(
-        user_id=current_user.id, product_id=product_id
-    ).first()
-    if not item:
-        return jsonify(success=False, message="Товар не найден в корзине"), 404
-
     if quantity <= 0:
-        db.session.delete(item)
+        found = delete_cart_item(current_user.id, product_id)
     else:
-        item.quantity = quantity
+        found = set_cart_item_quantity(current_user.id, product_id, quantity)
+    if not found:
+        db.session.rollback()
+        return jsonify(success=False, message="Товар не найден в корзине"), 404
 
     db.session.commit()
+    set_cart_quantity(product_id, quantity)
     return jsonify(success=True, quantity=quantity)
 
 
@@ -430,6 +641,9 @@ def remove_from_cart():
     else:
         product_id = request.form.get("product_id")
 
+    # Приводим к int один раз: дальше id идёт и в запрос, и в сводку корзины
+    product_id = _to_int(product_id)
+
     if not product_id:
         message = "Некорректный запрос"
         if request.is_json:
@@ -437,16 +651,15 @@ def remove_from_cart():
         flash(message, "danger")
         return redirect(url_for("prof.profile"))
 
-    item = CartItem.query.filter_by(
-        user_id=current_user.id, product_id=product_id
-    ).first()
-    if item:
-        db.session.delete(item)
+    if delete_cart_item(current_user.id, product_id):
         db.session.commit()
         message = "Товар удалён из корзины"
     else:
+        # Закрываем транзакцию пустого DELETE до сохранения сессии
+        db.session.rollback()
         # ✨ Вот тут важный момент:
         message = "Товар уже отсутствует в корзине"
+    set_cart_quantity(product_id, 0)
 
     if request.is_json:
         # Всегда success: True — потому что цель достигнута
@@ -456,13 +669,106 @@ def remove_from_cart():
     return redirect(url_for("prof.profile"))
 
 
+def _parse_cart_ops(data):
+    """
+    Validates the operations of a ``/cart/batch`` request.
+
+    Returns:
+        list or None: ``(product_id, "delta" or "quantity", value)`` tuples,
+        or None if the request is malformed.
+    """
+    ops = data.get("ops") if isinstance(data, dict) else None
+    if not isinstance(ops, list) or not ops:
+        return None
+    if len(ops) > current_app.config["CART_BATCH_MAX_OPS"]:
+        return None
+
+    parsed = []
+    for op in ops:
+        if not isinstance(op, dict):
+            return None
+        kinds = [kind for kind in ("delta", "quantity") if kind in op]
+        if len(kinds) != 1:
+            return None
+        product_id, value = _to_int(op.get("product_id")), op[kinds[0]]
+        if product_id is None:
+            return None
+        if not isinstance(value, int) or isinstance(value, bool):
+            return None
+        parsed.append((product_id, kinds[0], value))
+    return parsed
+
+
+@cart_bp.route("/batch", methods=["POST"])
+@login_required
+def batch_cart():
+    """
+    Applies several cart changes in one transaction.
+
+    Body: ``{"ops": [{"product_id": 3, "delta": 2}, {"product_id": 5,
+    "quantity": 0}, ...]}``; ``delta`` changes the quantity, ``quantity``
+    sets it (zero or less removes the product). Products that do not exist
+    (or are not in the cart, for a negative delta) are skipped.
+
+    Returns:
+        Response: JSON with the whole resulting cart (``{product_id:
+        quantity}``) and the skipped product ids.
+    """
+    ops = _parse_cart_ops(request.get_json(silent=True))
+    if ops is None:
+        return jsonify(success=False, message="Некорректные данные"), 400
+
+    skipped = []
+    for product_id, kind, value in ops:
+        if kind == "delta":
+            result = change_cart_item_quantity(current_user.id, product_id, value)
+        elif value <= 0:
+            delete_cart_item(current_user.id, product_id)
+            result = 0
+        else:
+            result = set_cart_item_quantity(current_user.id, product_id, value)
+            if result is None:
+                result = add_cart_item(current_user.id, product_id, value)
+        if result is None:
+            skipped.append(product_id)
+
+    cart = db.session.execute(
+        db.select(CartItem.product_id, CartItem.quantity).filter_by(
+            user_id=current_user.id
+        )
+    ).all()
+    db.session.commit()
+
+    remember_cart(cart)
+    return jsonify(
+        success=True,
+        cart={str(row.product_id): row.quantity for row in cart},
+        skipped=skipped,
+    )
+
+
+def _locked_cart_ids(user_id):
+    """
+    Returns a SELECT of the user's cart line ids that locks those rows
+    until the end of the transaction (FOR UPDATE is omitted on SQLite).
+    """
+    return db.select(CartItem.id).filter_by(user_id=user_id).with_for_update()
+
+
 @cart_bp.route("/checkout", methods=["POST"])
 @login_required
 def checkout():
-    """Оформление заказа из корзины"""
-    # 1️⃣ Проверяем, пуста ли корзина
-    cart_items = CartItem.query.filter_by(user_id=current_user.id).all()
-    if not cart_items:
+    """
+    Оформление заказа из корзины.
+
+    Заказ собирается набором запросов, число которых не зависит от размера
+    корзины: строки корзины блокируются, позиции заказа копируются одним
+    INSERT ... SELECT из корзины и товаров, сумма считается в SQL
+    в Numeric, корзина удаляется в той же транзакции.
+    """
+    # 1️⃣ Блокируем строки корзины и проверяем, не пуста ли она
+    cart_ids = db.session.execute(_locked_cart_ids(current_user.id)).scalars().all()
+    if not cart_ids:
         flash("Ваша корзина пуста.", "warning")
         return redirect(url_for("prof.profile"))
 
@@ -495,41 +801,69 @@ def checkout():
     db.session.add(order)
     db.session.flush()  # чтобы получить order.id
 
-    total_sum = 0
-    for item in cart_items:
-        product = item.product
-        price = float(product.price)
-        total_sum += price * item.quantity
-
-        order_item = OrderItem(
-            order_id=order.id,
-            product_id=product.id,
-            product_name=product.name,
-            article=product.article,
-            quantity=item.quantity,
-            price=price,
-            sum=price * item.quantity,
+    # Позиции заказа — снимок товаров из корзины одним INSERT ... SELECT
+    price = db.cast(Products.price, db.Numeric(10, 2))
+    cart_lines = (
+        db.select(
+            db.literal(order.id, db.Integer),
+            Products.id,
+            Products.name,
+            Products.article,
+            CartItem.quantity,
+            price,
+            price * CartItem.quantity,
+        )
+        .join_from(CartItem, Products, CartItem.product_id == Products.id)
+        .where(CartItem.id.in_(cart_ids))
+    )
+    db.session.execute(
+        db.insert(OrderItem).from_select(
+            [
+                OrderItem.order_id,
+                OrderItem.product_id,
+                OrderItem.product_name,
+                OrderItem.article,
+                OrderItem.quantity,
+                OrderItem.price,
+                OrderItem.sum,
+            ],
+            cart_lines,
         )
-        db.session.add(order_item)
+    )
 
-    order.total_sum = total_sum
+    # Итог считается в базе по сохранённым позициям (Numeric, без float)
+    total_sum = (
+        db.select(db.func.coalesce(db.func.sum(OrderItem.sum), 0))
+        .where(OrderItem.order_id == order.id)
+        .scalar_subquery()
+    )
+    db.session.execute(
+        db.update(Order)
+        .where(Order.id == order.id)
+        .values(total_sum=total_sum)
+        .execution_options(synchronize_session=False)
+    )
 
     # 4️⃣ Очищаем корзину
-    CartItem.query.filter_by(user_id=current_user.id).delete()
-    db.session.commit()
+    db.session.execute(
+        db.delete(CartItem)
+        .where(CartItem.id.in_(cart_ids))
+        .execution_options(synchronize_session=False)
+    )
 
-    # 5️⃣ Отправляем уведомление админу
-    try:
-        msg = Message(
-            subject=f"🛒 Новый заказ №{order.order_number}",
-            sender=os.getenv("DEL_EMAIL"),
-            recipients=[os.getenv("REC_EMAIL")],
-            body=render_template("email/new_order.txt", order=order),
-            html=render_template("email/new_order.html", order=order),
-        )
-        mail.send(msg)
-    except Exception as e:
-        print("Ошибка при отправке письма:", e)
+    # 5️⃣ Ставим уведомление админу в очередь — в той же транзакции, что и заказ;
+    # отправит фоновый диспетчер (app/mailqueue.py), ответ не ждёт SMTP
+    db.session.expire(order, ["total_sum"])
+    enqueue_mail(
+        subject=f"🛒 Новый заказ №{order.order_number}",
+        sender=os.getenv("DEL_EMAIL"),
+        recipients=[os.getenv("REC_EMAIL")],
+        body=render_template("email/new_order.txt", order=order),
+        html=render_template("email/new_order.html", order=order),
+    )
+    db.session.commit()
+    clear_cart_state()
+    wake_mail_dispatcher()
 
     # 6️⃣ Перенаправляем на страницу 'спасибо'
     flash(f"Заказ №{order.order_number} успешно оформлен!", "success")
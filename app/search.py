@@ -0,0 +1,223 @@
+"""
+Catalog search.
+
+On PostgreSQL the search runs against the trigram and tsvector GIN indexes
+built by the ``catalog search index`` migration. Other backends (SQLite in
+development) use an in-process trigram inverted index that is rebuilt lazily
+when the content version changes (in any process) or when it gets older
+than ``SEARCH_INDEX_TTL``.
+"""
+
+import re
+import threading
+import time
+from collections import defaultdict
+
+from flask import current_app
+from sqlalchemy import case, func, literal_column
+
+from . import db
+from .models import Products
+from .versioning import get_content_version
+
+_TOKEN_RE = re.compile(r"\w+")
+
+_index = None
+_index_version = None
+_index_built_at = 0.0
+_index_lock = threading.Lock()
+
+
+def search_document():
+    """
+    Builds the SQL expression that is indexed and searched.
+
+    The expression must stay in sync with the one used by the
+    ``catalog search index`` migration, otherwise PostgreSQL will not
+    use the GIN indexes.
+
+    Returns:
+        ColumnElement: ``name || ' ' || article || ' ' || full_marking``.
+    """
+    separator = literal_column("' '")
+    return (
+        Products.name + separator + Products.article + separator + Products.full_marking
+    )
+
+
+def _escape_like(value):
+    """
+    Escapes LIKE wildcards in user input.
+
+    Args:
+        value (str): Raw search string.
+
+    Returns:
+        str: String safe to embed into a LIKE pattern with ``\\`` as escape.
+    """
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def _trigrams(text):
+    """
+    Splits a string into the set of its character trigrams.
+
+    Args:
+        text (str): Lowercased text.
+
+    Returns:
+        set: Trigrams of the text (empty for strings shorter than 3 chars).
+    """
+    return {text[i : i + 3] for i in range(len(text) - 2)}
+
+
+class SearchIndex:
+    """
+    In-memory trigram inverted index over product name, article and marking.
+
+    Matches the PostgreSQL behaviour: a product is found when every word of
+    the query occurs somewhere in its search document.
+    """
+
+    def __init__(self, rows):
+        """
+        Args:
+            rows (iterable): Tuples of ``(id, name, article, full_marking)``.
+        """
+        self._docs = {}
+        self._postings = defaultdict(set)
+        for product_id, name, article, full_marking in rows:
+            name, article = name.lower(), article.lower()
+            document = f"{name} {article} {full_marking.lower()}"
+            self._docs[product_id] = (name, article, document)
+            for trigram in _trigrams(document):
+                self._postings[trigram].add(product_id)
+
+    def _candidates(self, tokens):
+        """
+        Narrows the document set down using the trigram postings.
+        """
+        trigrams = set()
+        for token in tokens:
+            trigrams |= _trigrams(token)
+        if not trigrams:
+            return self._docs.keys()
+
+        postings = sorted(
+            (self._postings.get(trigram, set()) for trigram in trigrams), key=len
+        )
+        candidates = set(postings[0])
+        for posting in postings[1:]:
+            if not candidates:
+                break
+            candidates &= posting
+        return candidates
+
+    def search(self, query, limit=None):
+        """
+        Finds products matching the query, best matches first.
+
+        Args:
+            query (str): Search string as typed by the user.
+            limit (int, optional): Maximum number of ids to return (all
+                matches by default).
+
+        Returns:
+            list: Product ids ordered by relevance.
+        """
+        phrase = query.strip().lower()
+        tokens = _TOKEN_RE.findall(phrase)
+        if not tokens:
+            return []
+
+        scored = []
+        for product_id in self._candidates(tokens):
+            name, article, document = self._docs[product_id]
+            if not all(token in document for token in tokens):
+                continue
+
+            if article == phrase:
+                score = 100
+            elif article.startswith(phrase):
+                score = 50
+            elif name.startswith(phrase):
+                score = 30
+            elif phrase in document:
+                score = 20
+            else:
+                score = 10
+            scored.append((-score, name, product_id))
+
+        scored.sort()
+        return [product_id for _, _, product_id in scored[:limit]]
+
+
+def _get_index():
+    """
+    Returns the process-wide search index, rebuilding it when stale.
+    """
+    global _index, _index_version, _index_built_at
+
+    version = get_content_version()
+    ttl = current_app.config["SEARCH_INDEX_TTL"]
+    with _index_lock:
+        if (
+            _index is None
+            or _index_version != version
+            or time.monotonic() - _index_built_at > ttl
+        ):
+            rows = db.session.query(
+                Products.id, Products.name, Products.article, Products.full_marking
+            )
+            _index = SearchIndex(rows)
+            _index_version = version
+            _index_built_at = time.monotonic()
+        return _index
+
+
+def invalidate_search_index():
+    """
+    Drops the in-process index so the next search rebuilds it.
+    """
+    global _index
+
+    with _index_lock:
+        _index = None
+
+
+def apply_search(query, text):
+    """
+    Restricts a product query to the search results.
+
+    Outside PostgreSQL all ids matched by the in-process index go into the
+    same query as the other catalog filters, so the filters apply before
+    any cap on the number of results (see ``SEARCH_MAX_RESULTS``).
+
+    Args:
+        query (Query): Base ``Products`` query.
+        text (str): Search string.
+
+    Returns:
+        tuple: Filtered query and an ORDER BY clause ranking the results
+        by relevance.
+    """
+    if db.engine.dialect.name == "postgresql":
+        document = search_document()
+        tsvector = func.to_tsvector("simple", document)
+        tsquery = func.plainto_tsquery("simple", text)
+        query = query.filter(
+            db.or_(
+                document.ilike(f"%{_escape_like(text)}%", escape="\\"),
+                tsvector.op("@@")(tsquery),
+            )
+        )
+        rank = func.similarity(document, text) + func.ts_rank(tsvector, tsquery)
+        return query, rank.desc()
+
+    ids = _get_index().search(text)
+    if not ids:
+        return query.filter(db.false()), Products.id
+    rank = case(
+        {product_id: pos for pos, product_id in enumerate(ids)}, value=Products.id
+    )
+    return query.filter(Products.id.in_(ids)), rank
@@ -0,0 +1,329 @@
+"""
+Server-side sessions.
+
+Flask keeps the whole session (login state, admin flag, flashes, cart
+summary) in a signed cookie that is re-signed and re-sent on every request.
+With ``SESSION_STORE`` set to a server-side backend the cookie holds only a
+random session id and the data lives in:
+
+    sql      the ``http_session`` table (shared by all workers and hosts)
+    memory   a per-process LRU (single-process development servers only)
+    redis    Redis or a compatible server (needs the ``redis`` package)
+    cookie   Flask's signed cookie, as before
+
+Data is read on the first request that has a session cookie (static files
+skip the session altogether) and written only when the session changed;
+the stored copy expires ``PERMANENT_SESSION_LIFETIME`` after the last
+change. It is stored as tagged JSON (so flashes and Markup survive),
+compressed with zlib when larger than ``SESSION_COMPRESS_MIN_SIZE`` bytes.
+
+The session id is replaced whenever a privilege changes (user login,
+logout or switch, admin login or logout), so an id planted in the browser
+beforehand never becomes a privileged session.
+"""
+
+import re
+import secrets
+import zlib
+from datetime import datetime, timedelta
+
+from flask.sessions import (
+    SecureCookieSession,
+    SessionInterface,
+    session_json_serializer,
+)
+
+from . import db
+from .cache import MemoryCache
+from .models import HttpSession, insert_on_conflict
+
+SID_RE = re.compile(r"^[A-Za-z0-9_-]{32,64}$")
+
+# Session keys that grant privileges: the id is rotated when they change
+PRIVILEGE_KEYS = ("_user_id", "admin")
+
+# Requests that never use the session (load balancer probes)
+SESSIONLESS_PATHS = ("/healthz",)
+
+# Stored payload prefixes
+_PLAIN, _ZLIB = b"j", b"z"
+
+
+def encode_session(data, compress_min_size):
+    """
+    Serialises session data compactly.
+
+    Args:
+        data (dict): Session contents.
+        compress_min_size (int): Compress payloads of at least this size.
+
+    Returns:
+        bytes: Payload for the store.
+    """
+    raw = session_json_serializer.dumps(data).encode()
+    if len(raw) >= compress_min_size:
+        return _ZLIB + zlib.compress(raw)
+    return _PLAIN + raw
+
+
+def decode_session(payload):
+    """
+    Reverses ``encode_session``.
+
+    Raises:
+        ValueError: If the payload is corrupt.
+    """
+    kind, body = payload[:1], payload[1:]
+    if kind == _ZLIB:
+        try:
+            body = zlib.decompress(body)
+        except zlib.error as e:
+            raise ValueError("Corrupt session payload") from e
+    elif kind != _PLAIN:
+        raise ValueError("Unknown session payload")
+    return session_json_serializer.loads(body.decode())
+
+
+class SqlSessionStore:
+    """
+    Sessions in the ``http_session`` table.
+
+    Uses its own short transactions, so saving a session never commits
+    what the view left in ``db.session``.
+    """
+
+    def load(self, sid):
+        with db.engine.connect() as conn:
+            row = conn.execute(
+                db.select(HttpSession.data, HttpSession.expires_at).where(
+                    HttpSession.id == sid
+                )
+            ).first()
+        if row is None or row.expires_at <= datetime.utcnow():
+            return None
+        return row.data, row.expires_at
+
+    def save(self, sid, payload, expires_at):
+        stmt = (
+            insert_on_conflict(HttpSession)
+            .values(id=sid, data=payload, expires_at=expires_at)
+            .on_conflict_do_update(
+                index_elements=[HttpSession.id],
+                set_={"data": payload, "expires_at": expires_at},
+            )
+        )
+        with db.engine.begin() as conn:
+            conn.execute(stmt)
+
+    def delete(self, sid):
+        with db.engine.begin() as conn:
+            conn.execute(db.delete(HttpSession).where(HttpSession.id == sid))
+
+    def purge(self):
+        """
+        Deletes expired sessions.
+
+        Returns:
+            int: Number of deleted rows.
+        """
+        with db.engine.begin() as conn:
+            result = conn.execute(
+                db.delete(HttpSession).where(
+                    HttpSession.expires_at <= datetime.utcnow()
+                )
+            )
+        return result.rowcount
+
+
+class MemorySessionStore:
+    """
+    Sessions in a per-process LRU; lost on restart and not shared between
+    workers.
+    """
+
+    def __init__(self, max_entries):
+        self._cache = MemoryCache(max_entries)
+
+    def load(self, sid):
+        return self._cache.get(sid)
+
+    def save(self, sid, payload, expires_at):
+        ttl = (expires_at - datetime.utcnow()).total_seconds()
+        self._cache.set(sid, (payload, expires_at), ttl=max(ttl, 1))
+
+    def delete(self, sid):
+        self._cache.delete(sid)
+
+    def purge(self):
+        return 0  # entries expire on their own
+
+
+class RedisSessionStore:
+    """
+    Sessions in Redis, expired by Redis itself.
+    """
+
+    def __init__(self, url, prefix="agt:session:"):
+        import redis
+
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+
+    def load(self, sid):
+        pipe = self.client.pipeline()
+        pipe.get(self.prefix + sid)
+        pipe.ttl(self.prefix + sid)
+        payload, ttl = pipe.execute()
+        if payload is None or ttl is None or ttl < 0:
+            return None
+        return payload, datetime.utcnow() + timedelta(seconds=ttl)
+
+    def save(self, sid, payload, expires_at):
+        ttl = (expires_at - datetime.utcnow()).total_seconds()
+        self.client.set(self.prefix + sid, payload, ex=max(int(ttl), 1))
+
+    def delete(self, sid):
+        self.client.delete(self.prefix + sid)
+
+    def purge(self):
+        return 0  # keys expire on their own
+
+
+class ServerSession(SecureCookieSession):
+    """
+    Session whose data is kept by a store under ``sid``.
+    """
+
+    def __init__(self, initial=None, sid=None, expires_at=None):
+        super().__init__(initial)
+        self.new = sid is None
+        self.sid = sid or secrets.token_urlsafe(32)
+        self.expires_at = expires_at
+        # Privileges the stored data was saved with
+        self.loaded_privileges = self.privileges()
+
+    def privileges(self):
+        return tuple(self.get(key) for key in PRIVILEGE_KEYS)
+
+    def rotate(self):
+        """
+        Moves the data to a fresh id; returns the old one.
+        """
+        old_sid, self.sid, self.new = self.sid, secrets.token_urlsafe(32), True
+        return old_sid
+
+
+class ServerSessionInterface(SessionInterface):
+    """
+    Keeps the session id in the cookie and the data in a store.
+    """
+
+    def __init__(self, store, compress_min_size):
+        """
+        Args:
+            store: ``SqlSessionStore``, ``MemorySessionStore`` or
+                ``RedisSessionStore``.
+            compress_min_size (int): See ``encode_session``.
+        """
+        self.store = store
+        self.compress_min_size = compress_min_size
+
+    def open_session(self, app, request):
+        # Static files and uploads never use the session
+        if request.path.startswith(app.static_url_path.rstrip("/") + "/"):
+            return self.make_null_session(app)
+        if request.path in SESSIONLESS_PATHS:
+            return self.make_null_session(app)
+
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if not sid or not SID_RE.match(sid):
+            return ServerSession()
+
+        stored = self.store.load(sid)
+        if stored is None:
+            return ServerSession()
+        payload, expires_at = stored
+        try:
+            data = decode_session(payload)
+        except ValueError:
+            app.logger.warning("Discarding unreadable session %s...", sid[:8])
+            return ServerSession()
+        return ServerSession(data, sid=sid, expires_at=expires_at)
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        cookie = dict(
+            domain=self.get_cookie_domain(app),
+            path=self.get_cookie_path(app),
+            secure=self.get_cookie_secure(app),
+            partitioned=self.get_cookie_partitioned(app),
+            samesite=self.get_cookie_samesite(app),
+            httponly=self.get_cookie_httponly(app),
+        )
+
+        if session.accessed:
+            response.vary.add("Cookie")
+
+        # Emptied (logout): forget the stored data and the cookie
+        if not session:
+            if session.modified:
+                if not session.new:
+                    self.store.delete(session.sid)
+                response.delete_cookie(name, **cookie)
+                response.vary.add("Cookie")
+            return
+
+        if not session.modified:
+            return
+
+        # A privilege changed: a new id, so an id planted in the browser
+        # before login never becomes an authenticated session
+        if not session.new and session.privileges() != session.loaded_privileges:
+            self.store.delete(session.rotate())
+
+        expires_at = datetime.utcnow() + app.permanent_session_lifetime
+        self.store.save(
+            session.sid,
+            encode_session(dict(session), self.compress_min_size),
+            expires_at,
+        )
+        response.set_cookie(
+            name,
+            session.sid,
+            expires=self.get_expiration_time(app, session),
+            **cookie,
+        )
+        response.vary.add("Cookie")
+
+
+def create_session_store(config):
+    """
+    Builds the session store selected by ``SESSION_STORE``.
+
+    Returns:
+        Store instance, or None for Flask's cookie sessions.
+    """
+    store = config["SESSION_STORE"]
+    if store == "sql":
+        return SqlSessionStore()
+    if store == "memory":
+        return MemorySessionStore(config["SESSION_MEMORY_MAX_ENTRIES"])
+    if store == "redis":
+        return RedisSessionStore(config["SESSION_REDIS_URL"])
+    if store == "cookie":
+        return None
+    raise ValueError(f"Unknown SESSION_STORE: {store}")
+
+
+def init_sessions(app):
+    """
+    Installs the server-side session interface unless cookie sessions are
+    configured.
+    """
+    store = create_session_store(app.config)
+    if store is None:
+        return
+    app.session_interface = ServerSessionInterface(
+        store,
+        app.config["SESSION_COMPRESS_MIN_SIZE"],
+    )
@@ -0,0 +1,403 @@
+"""
+In-memory catalog snapshot.
+
+The catalog (products with their brands) is small and changes only through
+the admin, so every process keeps a read-only copy of it and answers the
+catalog, index and product pages from memory: filtering, keyset paging,
+search and facets run over plain Python objects, and the only SQL left per
+request is the content version check (itself cached for
+``CONTENT_VERSION_TTL``). With NumPy installed, filtering and sorting use
+the bitmaps and sort permutations of ``app/columnar.py``
+(``CATALOG_COLUMNAR``).
+
+A snapshot is never modified. When the content version moves (a product or
+brand was committed by any process) the next request builds a new one and
+swaps the module-level reference, so concurrent readers keep the snapshot
+they started with. The admin also drops it right after its own writes.
+
+Disabled with ``CATALOG_SNAPSHOT = 0``, which falls back to the SQL path.
+"""
+
+import threading
+from bisect import bisect_left, bisect_right
+from operator import attrgetter
+
+from flask import current_app
+
+from . import db
+from .columnar import ColumnarCatalog, available as columnar_available
+from .facets import MAX_CACHED_COMBINATIONS, compute_facets
+from .models import CarBrand, Products
+from .pagination import Page, cursor_key, cursor_offset, encode_cursor
+from .search import SearchIndex
+from .versioning import get_content_version
+
+# Sort mode -> (record attribute, descending); same modes as the SQL path
+SORTS = {
+    "name_asc": ("name", False),
+    "name_desc": ("name", True),
+    "price_asc": ("price", False),
+    "price_desc": ("price", True),
+}
+
+_snapshot = None
+_lock = threading.Lock()
+
+
+class BrandRecord:
+    """
+    Read-only copy of a ``CarBrand`` row.
+    """
+
+    __slots__ = ("id", "name")
+
+    def __init__(self, id, name):
+        self.id = id
+        self.name = name
+
+
+class ProductRecord:
+    """
+    Read-only copy of a ``Products`` row with the attributes the templates
+    use; ``brand`` is a shared ``BrandRecord`` (or None).
+    """
+
+    __slots__ = (
+        "id",
+        "name",
+        "article",
+        "full_marking",
+        "type",
+        "category",
+        "brand_id",
+        "brand",
+        "price",
+        "description",
+        "in_stock",
+        "is_main",
+        "photo_filename",
+    )
+
+    def __init__(self, row, brand):
+        (
+            self.id,
+            self.name,
+            self.article,
+            self.full_marking,
+            self.type,
+            self.category,
+            self.brand_id,
+            self.price,
+            self.description,
+            self.in_stock,
+            self.is_main,
+            self.photo_filename,
+        ) = row
+        self.brand = brand
+
+
+def _matcher(
+    type_filter=None,
+    category_filter=None,
+    brand_id=None,
+    price_min=None,
+    price_max=None,
+    ids=None,
+):
+    """
+    Builds a predicate for the catalog filters (None when there are none).
+
+    Used when NumPy is not installed; see ``ColumnarCatalog.mask``.
+    """
+    checks = []
+    if type_filter is not None:
+        checks.append(lambda p: p.type == type_filter)
+    if category_filter is not None:
+        checks.append(lambda p: p.category == category_filter)
+    if brand_id is not None:
+        checks.append(lambda p: p.brand_id == brand_id)
+    if price_min is not None:
+        checks.append(lambda p: p.price >= price_min)
+    if price_max is not None:
+        checks.append(lambda p: p.price <= price_max)
+    if ids is not None:
+        ids = set(ids)
+        checks.append(lambda p: p.id in ids)
+    if not checks:
+        return None
+    return lambda p: all(check(p) for check in checks)
+
+
+class CatalogSnapshot:
+    """
+    Immutable view of the catalog at one content version.
+    """
+
+    def __init__(self, version, rows, columnar=True):
+        """
+        Args:
+            version (int): Content version the rows were read at.
+            rows (iterable): Product columns as selected by ``_load_rows``
+                followed by the brand name.
+            columnar (bool): Filter and sort with NumPy arrays (if NumPy is
+                installed) instead of Python loops.
+        """
+        self.version = version
+        brands = {}
+        products = []
+        for row in rows:
+            *columns, brand_name = row
+            brand_id = columns[6]
+            brand = None
+            if brand_id is not None:
+                brand = brands.get(brand_id)
+                if brand is None:
+                    brand = brands[brand_id] = BrandRecord(brand_id, brand_name)
+            products.append(ProductRecord(columns, brand))
+
+        self.products = tuple(sorted(products, key=attrgetter("id")))
+        self.by_id = {product.id: product for product in self.products}
+        self.main_products = tuple(p for p in self.products if p.is_main)
+
+        # Ascending (key, id) order per sort key; descending pages walk it
+        # backwards. The key lists are what bisect searches for a cursor.
+        self._orders = {}
+        for attr in {attr for attr, _ in SORTS.values()}:
+            ordered = sorted(self.products, key=attrgetter(attr, "id"))
+            keys = [(getattr(p, attr), p.id) for p in ordered]
+            self._orders[attr] = (tuple(ordered), keys)
+
+        self._columns = None
+        if columnar and columnar_available():
+            self._columns = ColumnarCatalog(
+                self.products,
+                {attr: ordered for attr, (ordered, _) in self._orders.items()},
+            )
+
+        self._search_index = SearchIndex(
+            (p.id, p.name, p.article, p.full_marking) for p in self.products
+        )
+
+        counts = {}
+        for p in self.products:
+            key = (p.type, p.category, p.brand_id, p.brand.name if p.brand else None)
+            counts[key] = counts.get(key, 0) + 1
+        self._facet_rows = [(*key, count) for key, count in counts.items()]
+        self._facets = {}
+        self._facets_lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.products)
+
+    def get(self, product_id):
+        """
+        Returns the product with the given id, or None.
+        """
+        return self.by_id.get(product_id)
+
+    def facets(self, type_filter=None, category_filter=None):
+        """
+        Returns the catalog facets, like ``facets.get_facets``.
+        """
+        key = (type_filter or "", category_filter or "")
+        facets = self._facets.get(key)
+        if facets is None:
+            facets = compute_facets(self._facet_rows, *key)
+            with self._facets_lock:
+                if len(self._facets) >= MAX_CACHED_COMBINATIONS:
+                    self._facets.clear()
+                self._facets[key] = facets
+        return facets
+
+    def search(self, text, limit):
+        """
+        Returns the ids of the products matching a search, best first.
+        """
+        return self._search_index.search(text, limit)
+
+    def page(
+        self,
+        sort,
+        cursor,
+        per_page,
+        text=None,
+        type_filter=None,
+        category_filter=None,
+        brand_id=None,
+        price_min=None,
+        price_max=None,
+        max_results=None,
+    ):
+        """
+        Returns one page of the filtered catalog.
+
+        Cursors are the ones ``keyset_page`` and ``offset_page`` issue, so
+        links stay valid when a process switches between the two paths.
+
+        Args:
+            sort (str or None): Key of ``SORTS``; search results without a
+                sort are ordered by relevance.
+            cursor (dict or None): Decoded cursor of the previous page.
+            per_page (int): Page size.
+            text (str, optional): Search string.
+            type_filter, category_filter (str, optional): Exact values.
+            brand_id (int, optional): Brand filter.
+            price_min, price_max (int, optional): Inclusive price bounds.
+            max_results (int, optional): Cap on the relevance-ordered
+                search results, applied after the filters.
+
+        Returns:
+            Page: Products of the page and the cursor of the next one.
+
+        Raises:
+            ValueError: If the cursor does not fit the sort order.
+        """
+        filters = dict(
+            type_filter=type_filter or None,
+            category_filter=category_filter or None,
+            brand_id=brand_id,
+            price_min=price_min,
+            price_max=price_max,
+        )
+        ids = None
+        if text:
+            ids = self.search(text, len(self.products))
+            if not ids:
+                return Page([], None)
+            if sort not in SORTS:
+                ranked = [self.by_id[i] for i in ids]
+                matches = self._predicate(filters)
+                if matches is not None:
+                    ranked = [p for p in ranked if matches(p)]
+                if max_results:
+                    ranked = ranked[:max_results]
+                return self._offset_page(ranked, cursor, per_page)
+
+        if sort not in SORTS:
+            sort = "name_asc"
+        attr, descending = SORTS[sort]
+        ordered, keys = self._orders[attr]
+
+        start = len(ordered) - 1 if descending else 0
+        if cursor is not None:
+            last = cursor_key(cursor, sort)
+            try:
+                if descending:
+                    start = bisect_left(keys, last) - 1
+                else:
+                    start = bisect_right(keys, last)
+            except TypeError as e:
+                raise ValueError("Cursor does not match the sort order") from e
+
+        # One extra product tells that another page exists
+        items = self._scan(filters, ids, attr, descending, start, per_page + 1)
+        next_cursor = None
+        if len(items) > per_page:
+            items = items[:per_page]
+            last = items[-1]
+            next_cursor = encode_cursor(
+                {"s": sort, "k": getattr(last, attr), "i": last.id}
+            )
+        return Page(items, next_cursor)
+
+    def _predicate(self, filters, ids=None):
+        """
+        Returns a test for single products (None when nothing is filtered).
+        """
+        if ids is None and all(value is None for value in filters.values()):
+            return None
+        if self._columns is not None:
+            mask = self._columns.mask(ids=ids, **filters)
+            return lambda p: self._columns.contains(mask, p.id)
+        return _matcher(ids=ids, **filters)
+
+    def _scan(self, filters, ids, attr, descending, start, limit):
+        """
+        Collects up to ``limit`` filtered products in sort order, starting
+        at a position of the ascending order (walking down if descending).
+        """
+        if self._columns is not None:
+            mask = self._columns.mask(ids=ids, **filters)
+            rows = self._columns.select(mask, attr, descending, start, limit)
+            return [self.products[row] for row in rows]
+
+        ordered = self._orders[attr][0]
+        matches = _matcher(ids=ids, **filters)
+        positions = range(start, -1, -1) if descending else range(start, len(ordered))
+        items = []
+        for pos in positions:
+            product = ordered[pos]
+            if matches is None or matches(product):
+                items.append(product)
+                if len(items) == limit:
+                    break
+        return items
+
+    @staticmethod
+    def _offset_page(ranked, cursor, per_page):
+        offset = cursor_offset(cursor, "rank") if cursor is not None else 0
+        items = ranked[offset : offset + per_page]
+        next_cursor = None
+        if len(ranked) > offset + per_page:
+            next_cursor = encode_cursor({"s": "rank", "o": offset + per_page})
+        return Page(items, next_cursor)
+
+
+def _load_rows():
+    """
+    Reads all products with their brand names in one query.
+    """
+    return (
+        db.session.query(
+            Products.id,
+            Products.name,
+            Products.article,
+            Products.full_marking,
+            Products.type,
+            Products.category,
+            Products.brand_id,
+            Products.price,
+            Products.description,
+            Products.in_stock,
+            Products.is_main,
+            Products.photo_filename,
+            CarBrand.name,
+        )
+        .outerjoin(CarBrand, Products.brand_id == CarBrand.id)
+        .all()
+    )
+
+
+def get_snapshot():
+    """
+    Returns the catalog snapshot of the current content version, building
+    it first if the catalog has changed.
+
+    Returns:
+        CatalogSnapshot: The snapshot; do not modify it.
+    """
+    global _snapshot
+
+    version = get_content_version()
+    snapshot = _snapshot
+    if snapshot is not None and snapshot.version == version:
+        return snapshot
+    with _lock:
+        # Another thread may have rebuilt it while this one waited
+        snapshot = _snapshot
+        if snapshot is None or snapshot.version != version:
+            snapshot = CatalogSnapshot(
+                version, _load_rows(), current_app.config["CATALOG_COLUMNAR"]
+            )
+            _snapshot = snapshot
+        return snapshot
+
+
+def invalidate_snapshot():
+    """
+    Drops the snapshot so the next request rebuilds it.
+    """
+    global _snapshot
+
+    with _lock:
+        _snapshot = None
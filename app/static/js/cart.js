@@ -1,57 +1,62 @@
 document.addEventListener("DOMContentLoaded", function () {
-  const buttons = document.querySelectorAll(".btn-cart-icon");
-
-  buttons.forEach((button) => {
-    button.addEventListener("click", function () {
-      const productId = this.dataset.productId;
-      const isAuthenticated = this.dataset.auth === "true";
-
-      if (!isAuthenticated) {
-        alert("Чтобы добавить товар в корзину, нужно авторизоваться.");
-        return;
-      }
-
-      // Защита от повторного клика
-      if (this.disabled) return;
-      this.disabled = true;
-
-      fetch("/cart/add", {
-        method: "POST",
-        headers: {
-          "Content-Type": "application/json",
-          "X-CSRFToken": getCSRFToken(),
-        },
-        body: JSON.stringify({ product_id: productId }),
+  // Делегирование: карточки, подгруженные бесконечной прокруткой, тоже работают
+  document.addEventListener("click", function (e) {
+    const button = e.target.closest(".btn-cart-icon");
+    if (!button) return;
+
+    const productId = button.dataset.productId;
+    const isAuthenticated = button.dataset.auth === "true";
+
+    if (!isAuthenticated) {
+      alert("Чтобы добавить товар в корзину, нужно авторизоваться.");
+      return;
+    }
+
+    // Защита от повторного клика
+    if (button.disabled) return;
+    button.disabled = true;
+
+    fetch("/cart/add", {
+      method: "POST",
+      headers: {
+        "Content-Type": "application/json",
+        "X-CSRFToken": getCSRFToken(),
+      },
+      body: JSON.stringify({ product_id: productId }),
+    })
+      .then((res) => res.json())
+      .then((data) => {
+        if (data.success) {
+          const parent = button.parentElement;
+          const productId = button.dataset.productId;
+
+          const newBlock = document.createElement("div");
+          newBlock.classList.add("cart-quantity", "ms-3");
+          newBlock.dataset.productId = productId;
+          newBlock.innerHTML = `
+            <button class="qty-btn minus">−</button>
+            <span class="qty-count">${data.quantity}</span>
+            <button class="qty-btn plus">+</button>
+          `;
+
+          parent.replaceChild(newBlock, button);
+        } else {
+          alert(data.message || "Ошибка добавления в корзину.");
+        }
       })
-        .then((res) => res.json())
-        .then((data) => {
-          if (data.success) {
-            const parent = this.parentElement;
-            const productId = this.dataset.productId;
-
-            const newBlock = document.createElement("div");
-            newBlock.classList.add("cart-quantity", "ms-3");
-            newBlock.dataset.productId = productId;
-            newBlock.innerHTML = `
-              <button class="qty-btn minus">−</button>
-              <span class="qty-count">${data.quantity}</span>
-              <button class="qty-btn plus">+</button>
-            `;
-
-            parent.replaceChild(newBlock, this);
-          } else {
-            alert(data.message || "Ошибка добавления в корзину.");
-          }
-        })
-        .catch(() => {
-          alert("Ошибка сервера.");
-        })
-        .finally(() => {
-          this.disabled = false;
-        });
-    });
+      .catch(() => {
+        alert("Ошибка сервера.");
+      })
+      .finally(() => {
+        button.disabled = false;
+      });
   });
 
+  // Клики "+" и "−" копятся и уходят одним запросом /cart/batch
+  const CART_BATCH_DELAY = 400; // мс после последнего клика
+  const pendingQuantities = new Map(); // productId -> новое количество
+  let batchTimer = null;
+
   // ✅ Глобальный слушатель на document — для "+" и "-"
   document.addEventListener("click", function (e) {
     const plusBtn = e.target.closest(".qty-btn.plus");
@@ -69,56 +74,106 @@ document.addEventListener("DOMContentLoaded", function () {
     } else if (minusBtn) {
       quantity--;
     }
+    if (quantity < 0) return;
+
+    pendingQuantities.set(productId, quantity);
+    clearTimeout(batchTimer);
+    if (quantity === 0) {
+      // Удаление не откладываем: кнопка корзины заменит счётчик
+      flushCart();
+      return;
+    }
+    // Сразу показываем новое количество, сервер подтвердит его позже
+    showQuantity(productId, quantity);
+    batchTimer = setTimeout(flushCart, CART_BATCH_DELAY);
+  });
+
+  // Несохранённые клики отправляем и при уходе со страницы
+  window.addEventListener("pagehide", function () {
+    flushCart(true);
+  });
 
-    fetch("/cart/update", {
+  function flushCart(keepalive) {
+    clearTimeout(batchTimer);
+    batchTimer = null;
+    if (!pendingQuantities.size) return;
+
+    const ops = Array.from(pendingQuantities, ([productId, quantity]) => ({
+      product_id: productId,
+      quantity,
+    }));
+    pendingQuantities.clear();
+
+    fetch("/cart/batch", {
       method: "POST",
+      keepalive: keepalive === true,
       headers: {
         "Content-Type": "application/json",
         "X-CSRFToken": getCSRFToken(),
       },
-      body: JSON.stringify({ product_id: productId, quantity }),
+      body: JSON.stringify({ ops }),
     })
       .then((res) => res.json())
-        .then((data) => {
-          if (data.success) {
-            if (quantity === 0) {
-              // Если находимся в корзине профиля — отправить форму удаления
-              const cartItem = container.closest('.cart-profile-item');
-              if (cartItem) {
-                const deleteForm = cartItem.querySelector('form');
-                if (deleteForm) {
-                  deleteForm.submit();
-                  return;
-                }
-              }
-
-              // Если не в корзине профиля — поведение по умолчанию (оставляем старую логику)
-              const newBtn = document.createElement("button");
-              newBtn.className = "btn btn-cart-icon ms-3";
-              newBtn.dataset.productId = productId;
-              newBtn.dataset.auth = "true";
-              newBtn.style = "background: none; border: none; padding: 0;";
-              newBtn.innerHTML = '<i class="icofont-cart cart-icon"></i>';
-
-              container.parentElement.replaceChild(newBtn, container);
-            } else {
-              countSpan.textContent = quantity;
-
-              // 🔁 Добавь вот этот блок для обновления ×2 возле картинки
-              const qtyLabel = document.querySelector(`.cart-qty-label[data-product-id="${productId}"]`);
-              if (qtyLabel) {
-                qtyLabel.textContent = `×${quantity}`;
-              }
-            }
-          } else {
-            alert(data.message || "Ошибка обновления количества.");
-          }
-        })
-
+      .then((data) => {
+        if (!data.success) {
+          alert(data.message || "Ошибка обновления количества.");
+          return;
+        }
+        ops.forEach(({ product_id: productId }) => {
+          // Для товара уже накопились новые клики — их ответ и покажем
+          if (pendingQuantities.has(productId)) return;
+          applyQuantity(productId, data.cart[productId] || 0);
+        });
+      })
       .catch(() => {
         alert("Ошибка сервера.");
       });
-  });
+  }
+
+  function showQuantity(productId, quantity) {
+    document
+      .querySelectorAll(`.cart-quantity[data-product-id="${productId}"] .qty-count`)
+      .forEach((countSpan) => {
+        countSpan.textContent = quantity;
+      });
+
+    // 🔁 Обновляем ×2 возле картинки
+    const qtyLabel = document.querySelector(`.cart-qty-label[data-product-id="${productId}"]`);
+    if (qtyLabel) {
+      qtyLabel.textContent = `×${quantity}`;
+    }
+  }
+
+  function applyQuantity(productId, quantity) {
+    if (quantity > 0) {
+      showQuantity(productId, quantity);
+      return;
+    }
+
+    document
+      .querySelectorAll(`.cart-quantity[data-product-id="${productId}"]`)
+      .forEach((container) => {
+        // Если находимся в корзине профиля — отправить форму удаления
+        const cartItem = container.closest('.cart-profile-item');
+        if (cartItem) {
+          const deleteForm = cartItem.querySelector('form');
+          if (deleteForm) {
+            deleteForm.submit();
+            return;
+          }
+        }
+
+        // Если не в корзине профиля — возвращаем кнопку корзины
+        const newBtn = document.createElement("button");
+        newBtn.className = "btn btn-cart-icon ms-3";
+        newBtn.dataset.productId = productId;
+        newBtn.dataset.auth = "true";
+        newBtn.style = "background: none; border: none; padding: 0;";
+        newBtn.innerHTML = '<i class="icofont-cart cart-icon"></i>';
+
+        container.parentElement.replaceChild(newBtn, container);
+      });
+  }
 });
 
 // CSRF helper
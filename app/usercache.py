@@ -0,0 +1,89 @@
+"""
+Cache of logged-in users.
+
+Flask-Login loads the user on every authenticated request. ``load_user``
+keeps the column values of recently seen users in a per-process LRU cache
+with a TTL (``USER_CACHE_TTL``, ``USER_CACHE_MAX_ENTRIES``) and attaches
+them to the database session without a query.
+
+Entries are keyed on the shared ``users`` version, which every transaction
+that writes a ``User`` bumps (profile edits, the admin, registration). All
+processes stop serving the old values once they re-read the version, at
+most ``CONTENT_VERSION_TTL`` later.
+
+The password hash is not cached: it is loaded from the database when
+something reads it.
+"""
+
+from flask import current_app
+from sqlalchemy import inspect
+from sqlalchemy.orm import make_transient_to_detached
+
+from . import db
+from .cache import MemoryCache, NullCache
+from .models import User
+from .versioning import get_version, track_version
+
+USERS = "users"
+
+# Columns that are never kept in the cache
+UNCACHED_COLUMNS = {"password_hash"}
+
+
+def _columns():
+    return [
+        attr.key
+        for attr in inspect(User).mapper.column_attrs
+        if attr.key not in UNCACHED_COLUMNS
+    ]
+
+
+def _get_cache():
+    return current_app.extensions["user_cache"]
+
+
+def _attach(values):
+    """
+    Turns cached values into a persistent ``User`` of the current session
+    without querying the database.
+    """
+    user = User(**dict(zip(_columns(), values)))
+    make_transient_to_detached(user)
+    return db.session.merge(user, load=False)
+
+
+def load_user(user_id):
+    """
+    Flask-Login user loader backed by the cache.
+
+    Args:
+        user_id (str): Id stored in the session.
+
+    Returns:
+        User or None: The user, attached to the current session.
+    """
+    user_id = int(user_id)
+    key = f"{get_version(USERS)}:{user_id}"
+
+    values = _get_cache().get(key)
+    if values is not None:
+        return _attach(values)
+
+    user = db.session.get(User, user_id)
+    if user is not None:
+        _get_cache().set(key, tuple(getattr(user, name) for name in _columns()))
+    return user
+
+
+def init_user_cache(app):
+    """
+    Sets up the user cache (disabled with ``USER_CACHE_TTL = 0``).
+    """
+    track_version(USERS, User)
+    ttl = app.config["USER_CACHE_TTL"]
+    if ttl > 0:
+        app.extensions["user_cache"] = MemoryCache(
+            app.config["USER_CACHE_MAX_ENTRIES"], ttl
+        )
+    else:
+        app.extensions["user_cache"] = NullCache()
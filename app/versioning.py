@@ -0,0 +1,244 @@
+"""
+Content versioning and HTTP conditional requests.
+
+Every transaction that writes one of the tracked models (products, brands,
+blog posts) bumps the ``content`` row of ``content_version`` before it
+commits. Views decorated with ``conditional`` build a cheap ETag from that
+version and the visitor's own state and answer ``304 Not Modified``
+without rendering when the browser already has the page.
+
+Other per-process caches use further rows the same way (``users`` for the
+user cache, see ``track_version``).
+
+Each process reuses a version it read for ``CONTENT_VERSION_TTL``
+seconds, so a change committed by another worker is seen at most that
+late; changes committed by this process are seen at once.
+"""
+
+import hashlib
+import threading
+import time
+from datetime import datetime
+from functools import wraps
+
+from flask import current_app, g, has_app_context, make_response, request, session
+from flask_login import current_user
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from . import db
+from .cart_state import get_cart_quantities
+from .models import ContentVersion, insert_on_conflict
+
+CONTENT = "content"
+
+# Version name -> model classes whose writes bump it
+_tracked_models = {}
+
+# Versions last read by this process, {name: (version, time.monotonic())};
+# the generation changes on every local commit, so a read that raced with
+# one is not kept
+_cached_versions = {}
+_generation = 0
+_lock = threading.Lock()
+
+
+def _read_version(name):
+    """
+    Returns a version shared by all processes, re-reading it from the
+    database once ``CONTENT_VERSION_TTL`` has passed.
+    """
+    ttl = current_app.config["CONTENT_VERSION_TTL"]
+    with _lock:
+        cached = _cached_versions.get(name)
+        if cached is not None and time.monotonic() - cached[1] < ttl:
+            return cached[0]
+        generation = _generation
+
+    version = db.session.execute(
+        db.select(ContentVersion.version).where(ContentVersion.name == name)
+    ).scalar() or 0
+    with _lock:
+        if generation == _generation:
+            _cached_versions[name] = (version, time.monotonic())
+    return version
+
+
+def get_version(name):
+    """
+    Returns the current value of a named version, read at most once per
+    request.
+
+    Returns:
+        int: The version; 0 before the first change.
+    """
+    key = f"{name}_version"
+    if key not in g:
+        setattr(g, key, _read_version(name))
+    return g.get(key)
+
+
+def get_content_version():
+    """
+    Returns the current content version, read at most once per request.
+
+    Returns:
+        int: The version; 0 before the first change.
+    """
+    return get_version(CONTENT)
+
+
+def forget_content_version():
+    """
+    Drops the versions cached by this process so the next read hits the
+    database.
+    """
+    global _generation
+
+    with _lock:
+        _cached_versions.clear()
+        _generation += 1
+
+
+def bump_version(session, name):
+    """
+    Bumps a named version in the session's current transaction.
+
+    Args:
+        session (Session): Session whose transaction to use.
+        name (str): Version name, e.g. ``CONTENT``.
+    """
+    now = datetime.utcnow()
+    stmt = (
+        insert_on_conflict(ContentVersion)
+        .values(name=name, version=1, updated_at=now)
+        .on_conflict_do_update(
+            index_elements=[ContentVersion.name],
+            set_={"version": ContentVersion.version + 1, "updated_at": now},
+        )
+    )
+    session.connection().execute(stmt)
+    session.info.setdefault("bumped_versions", set()).add(name)
+    if has_app_context():
+        g.pop(f"{name}_version", None)
+
+
+def bump_content_version(session):
+    """
+    Bumps the content version in the session's current transaction.
+
+    Needed only for changes that alter pages without writing a tracked
+    model (e.g. new image variants on disk).
+
+    Args:
+        session (Session): Session whose transaction to use.
+    """
+    bump_version(session, CONTENT)
+
+
+def _bump_on_flush(session, flush_context):
+    """
+    Bumps the versions of the models changed by the flush, inside the
+    transaction that changed them.
+    """
+    bumped = session.info.get("bumped_versions", ())
+    changed = (*session.new, *session.dirty, *session.deleted)
+    for name, models in _tracked_models.items():
+        if name not in bumped and any(isinstance(obj, models) for obj in changed):
+            bump_version(session, name)
+
+
+def _forget_on_commit(session):
+    """
+    Makes this process see its own committed change without waiting for
+    ``CONTENT_VERSION_TTL``.
+    """
+    if session.info.pop("bumped_versions", None):
+        forget_content_version()
+
+
+def _discard_on_rollback(session, previous_transaction):
+    session.info.pop("bumped_versions", None)
+
+
+def track_version(name, *models):
+    """
+    Bumps a named version whenever one of the models is written.
+
+    Args:
+        name (str): Version name.
+        *models: Model classes whose changes invalidate what the version
+            guards.
+    """
+    _tracked_models[name] = tuple(models)
+    if not event.contains(Session, "after_flush", _bump_on_flush):
+        event.listen(Session, "after_flush", _bump_on_flush)
+        event.listen(Session, "after_commit", _forget_on_commit)
+        event.listen(Session, "after_soft_rollback", _discard_on_rollback)
+
+
+def track_content(*models):
+    """
+    Bumps the content version whenever one of the models is written.
+
+    Args:
+        *models: Model classes whose changes alter rendered pages.
+    """
+    track_version(CONTENT, *models)
+
+
+def _page_etag():
+    """
+    Builds the ETag of the current page for the current visitor.
+
+    Besides the URL and the content version it covers everything
+    user-specific the pages render: login state, cart quantities and the
+    CSRF token (rotated before it can expire in a reused page).
+    """
+    parts = [
+        request.full_path,
+        str(get_content_version()),
+        str(current_user.get_id()),
+        repr(sorted(get_cart_quantities().items())),
+        str(session.get("csrf_token")),
+    ]
+    time_limit = current_app.config.get("WTF_CSRF_TIME_LIMIT", 3600)
+    if time_limit:
+        parts.append(str(int(time.time() // max(time_limit // 2, 1))))
+    return hashlib.sha1("\x00".join(parts).encode()).hexdigest()
+
+
+def conditional(view):
+    """
+    Adds an ETag validator to a GET view and answers ``304 Not Modified``
+    without calling it when the client's copy is current.
+
+    No Last-Modified is sent: the content version's timestamp does not
+    cover the visitor's own state (login, cart, CSRF token), so an
+    ``If-Modified-Since`` match could serve a stale page. Pages with
+    pending flash messages are always rendered.
+    """
+
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if request.method != "GET" or session.get("_flashes"):
+            return view(*args, **kwargs)
+
+        etag = _page_etag()
+
+        # Weak comparison: compressed responses carry a weak ETag
+        if request.if_none_match.contains_weak(etag):
+            response = make_response("", 304)
+        else:
+            response = make_response(view(*args, **kwargs))
+            if response.status_code != 200:
+                return response
+            # Rendering may have created the session's CSRF token
+            etag = _page_etag()
+
+        response.set_etag(etag)
+        # Pages differ per visitor: browsers may keep them, shared caches may not
+        response.headers["Cache-Control"] = "private, no-cache"
+        return response
+
+    return wrapper
@@ -1,3 +1,4 @@
+import click
 from app import create_app, db
 from flask.cli import with_appcontext
 from flask_migrate import Migrate, upgrade, migrate as run_migrate, init as run_init
@@ -32,6 +33,209 @@ def db_upgrade():
     upgrade()
 
 
+@app.cli.command("mail-worker")
+@with_appcontext
+def mail_worker():
+    """Отправляет письма из очереди mail_outbox (отдельный процесс)"""
+    from app.mailqueue import MailDispatcher
+
+    MailDispatcher(app).run_forever()
+
+
+@app.cli.command("image-worker")
+@with_appcontext
+def image_worker():
+    """Создаёт уменьшенные копии фото из очереди image_job (отдельный процесс)"""
+    from app.imagejobs import ImageWorkerPool
+
+    ImageWorkerPool(app).run_forever()
+
+
+@app.cli.command("images-build")
+@with_appcontext
+def images_build():
+    """Создаёт уменьшенные копии (WebP/AVIF) для загруженных ранее фото"""
+    from app.images import has_variants, process_image, supported_formats
+    from app.models import Blog, Products, User
+
+    formats = supported_formats()
+    for model in (Products, Blog, User):
+        filenames = db.session.execute(
+            db.select(model.photo_filename)
+            .where(model.photo_filename.isnot(None))
+            .distinct()
+        ).scalars()
+        for filename in filenames:
+            missing = [fmt for fmt in formats if not has_variants(filename, fmt)]
+            if not missing:
+                continue
+            try:
+                process_image(filename, missing)
+                print(f"{filename}: {', '.join(missing)}")
+            except (OSError, ValueError) as e:
+                print(f"{filename}: пропущено ({e})")
+
+
+@app.cli.command("uploads-gc")
+@click.option("--grace-hours", default=24, help="Не трогать файлы моложе N часов")
+@click.option("--dry-run", is_flag=True, help="Только показать, что будет удалено")
+@with_appcontext
+def uploads_gc(grace_hours, dry_run):
+    """Удаляет загруженные файлы, на которые не ссылается ни одна запись"""
+    from app.images import collect_garbage
+
+    removed = collect_garbage(grace_hours * 3600, dry_run=dry_run)
+    for filename in removed:
+        print(filename)
+    print(f"{'Будет удалено' if dry_run else 'Удалено'} файлов: {len(removed)}")
+
+
+@app.cli.command("assets-build")
+@with_appcontext
+def assets_build():
+    """Собирает статику с хэшами в именах, бандл CSS и .gz/.br копии"""
+    from app.assets import build_assets
+
+    manifest = build_assets(app.static_folder, app.static_url_path)
+    print(f"Собрано файлов: {len(manifest)} (static/build/manifest.json)")
+
+
+# Запросы каталога для `flask catalog-bench`
+BENCH_QUERIES = (
+    "",
+    "sort=price_desc",
+    "type=Грузовики&sort=price_asc",
+    "category=Воздушный&price_min=1000&price_max=5000",
+    "brand=1&sort=name_desc",
+    "q=фильтр&sort=price_asc",
+)
+
+
+@app.cli.command("catalog-bench")
+@click.option("--repeat", default=200, help="Сколько раз выполнить каждый запрос")
+@with_appcontext
+def catalog_bench(repeat):
+    """Сравнивает выборку страницы каталога: SQL, снапшот и NumPy"""
+    import timeit
+
+    from flask import request
+    from app.columnar import available
+    from app.routes import _catalog_page
+    from app.snapshot import invalidate_snapshot
+
+    modes = {"SQL": (False, False), "снапшот": (True, False)}
+    if available():
+        modes["NumPy"] = (True, True)
+    print(f"{'запрос':50}" + "".join(f"{name:>12}" for name in modes) + "  (мкс)")
+    for query in BENCH_QUERIES:
+        timings = []
+        with app.test_request_context(query_string=query):
+            for snapshot, columnar in modes.values():
+                app.config["CATALOG_SNAPSHOT"] = snapshot
+                app.config["CATALOG_COLUMNAR"] = columnar
+                invalidate_snapshot()
+                _catalog_page(request.args)  # прогрев: сборка снапшота
+                seconds = timeit.timeit(
+                    lambda: _catalog_page(request.args), number=repeat
+                )
+                timings.append(seconds / repeat * 1e6)
+        print(
+            f"{query or '(без фильтров)':50}" + "".join(f"{t:12.0f}" for t in timings)
+        )
+    invalidate_snapshot()
+
+
+@app.cli.command("query-plans")
+@click.option("--repeat", default=100, help="Сколько раз выполнить каждый запрос")
+@with_appcontext
+def query_plans(repeat):
+    """Показывает планы и время частых запросов (сравнить до/после индексов)"""
+    import timeit
+
+    from sqlalchemy import select, text, tuple_
+    from app.models import CartItem, Order, OrderItem, Products
+
+    queries = {
+        "каталог: тип и категория по цене": select(Products)
+        .filter_by(type="Грузовики", category="Воздушный")
+        .order_by(Products.price, Products.id)
+        .limit(25),
+        "каталог: следующая страница по цене": select(Products)
+        .where(tuple_(Products.price, Products.id) > (1000, 1))
+        .order_by(Products.price, Products.id)
+        .limit(25),
+        "главная: основные товары": select(Products).filter_by(is_main=True).limit(3),
+        "корзина: товар пользователя": select(CartItem).filter_by(
+            user_id=1, product_id=1
+        ),
+        "заказ: позиции": select(OrderItem).filter_by(order_id=1),
+        "профиль: заказы пользователя": select(Order)
+        .filter_by(user_id=1)
+        .order_by(Order.created_at.desc()),
+    }
+    if db.engine.dialect.name == "sqlite":
+        explain = "EXPLAIN QUERY PLAN "
+    else:
+        explain = "EXPLAIN "
+    for title, query in queries.items():
+        sql = str(query.compile(db.engine, compile_kwargs={"literal_binds": True}))
+        plan = db.session.execute(text(explain + sql)).all()
+        seconds = timeit.timeit(lambda: db.session.execute(query).all(), number=repeat)
+        print(f"{title}: {seconds / repeat * 1e6:.0f} мкс")
+        for row in plan:
+            print("   ", row[-1])
+
+
+@app.cli.command("password-bench")
+@click.option("--seconds", default=3.0, help="Длительность каждого замера")
+@click.option("--threads", default=8, help="Одновременных входов (потоков)")
+@with_appcontext
+def password_bench(seconds, threads):
+    """Измеряет число проверок пароля в секунду: в потоке запроса и в пуле"""
+    import os
+    import time
+    from concurrent.futures import ThreadPoolExecutor
+
+    from app.passwords import hash_password, verify_password
+
+    workers = app.config["PASSWORD_HASH_WORKERS"] or 1
+    password_hash = hash_password("benchmark")
+    print(f"Метод: {app.config['PASSWORD_HASH_METHOD']}, потоков: {threads}")
+
+    def logins(deadline):
+        count = 0
+        with app.app_context():
+            while time.monotonic() < deadline:
+                verify_password(password_hash, "benchmark")
+                count += 1
+        return count
+
+    for title, pool_workers in (("в потоке", 0), ("в пуле", workers)):
+        app.config["PASSWORD_HASH_WORKERS"] = pool_workers
+        deadline = time.monotonic() + seconds
+        with ThreadPoolExecutor(threads) as executor:
+            total = sum(executor.map(logins, [deadline] * threads))
+        cores = pool_workers or os.cpu_count() or 1
+        print(
+            f"{title}: {total / seconds:.1f} входов/с, "
+            f"{total / seconds / cores:.1f} на ядро ({cores})"
+        )
+    app.config["PASSWORD_HASH_WORKERS"] = workers
+
+
+@app.cli.command("sessions-gc")
+@with_appcontext
+def sessions_gc():
+    """Удаляет истёкшие серверные сессии (для cron)"""
+    from app.sessions import ServerSessionInterface
+
+    interface = app.session_interface
+    if not isinstance(interface, ServerSessionInterface):
+        print("SESSION_STORE=cookie: серверных сессий нет")
+        return
+    print(f"Удалено сессий: {interface.store.purge()}")
+
+
 @app.context_processor
 def inject_user():
     return dict(current_user=current_user)
@@ -0,0 +1,44 @@
+"""catalog search index
+
+Revision ID: 3c1f5a9d2b74
+Revises: ece97d0621d3
+Create Date: 2026-10-16 10:12:41.118305
+
+"""
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = "3c1f5a9d2b74"
+down_revision = "ece97d0621d3"
+branch_labels = None
+depends_on = None
+
+
+# Must match app.search.search_document()
+SEARCH_DOCUMENT = "(name || ' ' || article || ' ' || full_marking)"
+
+
+def upgrade():
+    # Other backends use the in-process index from app.search
+    if op.get_bind().dialect.name != "postgresql":
+        return
+
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    op.execute(
+        "CREATE INDEX IF NOT EXISTS ix_product_search_trgm "
+        f"ON product USING gin ({SEARCH_DOCUMENT} gin_trgm_ops)"
+    )
+    op.execute(
+        "CREATE INDEX IF NOT EXISTS ix_product_search_tsv "
+        f"ON product USING gin (to_tsvector('simple', {SEARCH_DOCUMENT}))"
+    )
+
+
+def downgrade():
+    if op.get_bind().dialect.name != "postgresql":
+        return
+
+    op.execute("DROP INDEX IF EXISTS ix_product_search_tsv")
+    op.execute("DROP INDEX IF EXISTS ix_product_search_trgm")
@@ -0,0 +1,47 @@
+"""image job queue
+
+Revision ID: a93e5c07b4d2
+Revises: f61b0d8e3a47
+Create Date: 2026-10-16 14:11:40.206583
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "a93e5c07b4d2"
+down_revision = "f61b0d8e3a47"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # main.py runs db.create_all() before migrations, so it may exist already
+    if sa.inspect(op.get_bind()).has_table("image_job"):
+        return
+
+    op.create_table(
+        "image_job",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("filename", sa.String(length=255), nullable=False),
+        sa.Column("status", sa.String(length=20), nullable=False),
+        sa.Column("attempts", sa.Integer(), nullable=False),
+        sa.Column("next_attempt_at", sa.DateTime(), nullable=False),
+        sa.Column("claimed_at", sa.DateTime(), nullable=True),
+        sa.Column("last_error", sa.Text(), nullable=True),
+        sa.Column("created_at", sa.DateTime(), nullable=True),
+        sa.Column("finished_at", sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    with op.batch_alter_table("image_job", schema=None) as batch_op:
+        batch_op.create_index(
+            batch_op.f("ix_image_job_status"), ["status"], unique=False
+        )
+
+
+def downgrade():
+    with op.batch_alter_table("image_job", schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f("ix_image_job_status"))
+
+    op.drop_table("image_job")
@@ -0,0 +1,52 @@
+"""order counter
+
+Revision ID: b84e0c6f1a25
+Revises: 3c1f5a9d2b74
+Create Date: 2026-10-16 11:40:07.532914
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "b84e0c6f1a25"
+down_revision = "3c1f5a9d2b74"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    columns = [
+        sa.Column("day", sa.String(length=8), nullable=False),
+        sa.Column("value", sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint("day"),
+    ]
+    # main.py runs db.create_all() before migrations, so it may exist already
+    if sa.inspect(op.get_bind()).has_table("order_counter"):
+        order_counter = sa.table("order_counter", *columns[:2])
+    else:
+        order_counter = op.create_table("order_counter", *columns)
+
+    # Continue after numbers already issued (AGT-YYYYMMDD-NNNN), so the
+    # per-day counter never repeats one of them
+    counters = {}
+    rows = op.get_bind().execute(
+        sa.text('SELECT order_number FROM "order" WHERE order_number IS NOT NULL')
+    )
+    for (order_number,) in rows:
+        parts = order_number.split("-")
+        if len(parts) == 3 and parts[1].isdigit() and parts[2].isdigit():
+            counters[parts[1]] = max(counters.get(parts[1], 0), int(parts[2]))
+
+    if counters:
+        op.execute(order_counter.delete())
+        op.bulk_insert(
+            order_counter,
+            [{"day": day, "value": value} for day, value in counters.items()],
+        )
+
+
+def downgrade():
+    op.drop_table("order_counter")
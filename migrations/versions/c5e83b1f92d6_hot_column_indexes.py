@@ -0,0 +1,79 @@
+"""indexes for catalog, cart and order queries
+
+Revision ID: c5e83b1f92d6
+Revises: a93e5c07b4d2
+Create Date: 2026-10-16 15:20:48.731904
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "c5e83b1f92d6"
+down_revision = "a93e5c07b4d2"
+branch_labels = None
+depends_on = None
+
+# (table, index name, columns, unique); must match the models
+INDEXES = (
+    # Catalog: type/category filters sorted by price, keyset pages by (price, id)
+    ("product", "ix_product_type_category_price", ["type", "category", "price"], False),
+    ("product", "ix_product_category_price", ["category", "price"], False),
+    ("product", "ix_product_price_id", ["price", "id"], False),
+    ("product", "ix_product_brand_id", ["brand_id"], False),
+    ("product", "ix_product_is_main", ["is_main"], False),
+    # Cart: one row per user and product; the product side for deletes
+    ("cart_item", "uq_cart_item_user_product", ["user_id", "product_id"], True),
+    ("cart_item", "ix_cart_item_product_id", ["product_id"], False),
+    # Orders: items of an order, orders of a user newest first
+    ("order_item", "ix_order_item_order_id", ["order_id"], False),
+    ("order", "ix_order_user_id_created_at", ["user_id", "created_at"], False),
+)
+
+
+def _merge_duplicate_cart_items():
+    """
+    Folds repeated (user_id, product_id) rows into the oldest one, summing
+    the quantities, so the unique index can be created.
+    """
+    op.execute("""
+        UPDATE cart_item SET quantity = (
+            SELECT SUM(other.quantity) FROM cart_item AS other
+            WHERE other.user_id = cart_item.user_id
+              AND other.product_id = cart_item.product_id
+        )
+        WHERE id IN (
+            SELECT MIN(id) FROM cart_item
+            GROUP BY user_id, product_id HAVING COUNT(*) > 1
+        )
+        """)
+    op.execute("""
+        DELETE FROM cart_item WHERE id NOT IN (
+            SELECT keep.id FROM (
+                SELECT MIN(id) AS id FROM cart_item GROUP BY user_id, product_id
+            ) AS keep
+        )
+        """)
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+
+    _merge_duplicate_cart_items()
+
+    for table, name, columns, unique in INDEXES:
+        # main.py runs db.create_all() before migrations: new databases
+        # get the indexes from the models
+        existing = {index["name"] for index in inspector.get_indexes(table)}
+        if name not in existing:
+            op.create_index(name, table, columns, unique=unique)
+
+
+def downgrade():
+    inspector = sa.inspect(op.get_bind())
+
+    for table, name, _, _ in reversed(INDEXES):
+        existing = {index["name"] for index in inspector.get_indexes(table)}
+        if name in existing:
+            op.drop_index(name, table_name=table)
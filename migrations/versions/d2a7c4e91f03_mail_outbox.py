@@ -0,0 +1,52 @@
+"""mail outbox
+
+Revision ID: d2a7c4e91f03
+Revises: b84e0c6f1a25
+Create Date: 2026-10-16 12:25:51.904116
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "d2a7c4e91f03"
+down_revision = "b84e0c6f1a25"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # main.py runs db.create_all() before migrations, so it may exist already
+    if sa.inspect(op.get_bind()).has_table("mail_outbox"):
+        return
+
+    op.create_table(
+        "mail_outbox",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("subject", sa.String(length=255), nullable=False),
+        sa.Column("sender", sa.String(length=255), nullable=True),
+        sa.Column("recipients", sa.Text(), nullable=False),
+        sa.Column("body", sa.Text(), nullable=True),
+        sa.Column("html", sa.Text(), nullable=True),
+        sa.Column("status", sa.String(length=20), nullable=False),
+        sa.Column("attempts", sa.Integer(), nullable=False),
+        sa.Column("next_attempt_at", sa.DateTime(), nullable=False),
+        sa.Column("claimed_at", sa.DateTime(), nullable=True),
+        sa.Column("last_error", sa.Text(), nullable=True),
+        sa.Column("created_at", sa.DateTime(), nullable=True),
+        sa.Column("sent_at", sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    with op.batch_alter_table("mail_outbox", schema=None) as batch_op:
+        batch_op.create_index(
+            batch_op.f("ix_mail_outbox_status"), ["status"], unique=False
+        )
+
+
+def downgrade():
+    with op.batch_alter_table("mail_outbox", schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f("ix_mail_outbox_status"))
+
+    op.drop_table("mail_outbox")
@@ -0,0 +1,41 @@
+"""server-side sessions
+
+Revision ID: e4b19d7c2a58
+Revises: c5e83b1f92d6
+Create Date: 2026-10-16 17:38:05.512377
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "e4b19d7c2a58"
+down_revision = "c5e83b1f92d6"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # main.py runs db.create_all() before migrations, so it may exist already
+    if sa.inspect(op.get_bind()).has_table("http_session"):
+        return
+
+    op.create_table(
+        "http_session",
+        sa.Column("id", sa.String(length=64), nullable=False),
+        sa.Column("data", sa.LargeBinary(), nullable=False),
+        sa.Column("expires_at", sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    with op.batch_alter_table("http_session", schema=None) as batch_op:
+        batch_op.create_index(
+            batch_op.f("ix_http_session_expires_at"), ["expires_at"], unique=False
+        )
+
+
+def downgrade():
+    with op.batch_alter_table("http_session", schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f("ix_http_session_expires_at"))
+
+    op.drop_table("http_session")
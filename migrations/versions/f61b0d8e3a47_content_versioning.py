@@ -0,0 +1,47 @@
+"""content versioning
+
+Revision ID: f61b0d8e3a47
+Revises: d2a7c4e91f03
+Create Date: 2026-10-16 13:02:17.418230
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "f61b0d8e3a47"
+down_revision = "d2a7c4e91f03"
+branch_labels = None
+depends_on = None
+
+CONTENT_TABLES = ("car_brands", "product", "blog")
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+
+    for table in CONTENT_TABLES:
+        columns = {column["name"] for column in inspector.get_columns(table)}
+        if "updated_at" in columns:
+            continue
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.add_column(sa.Column("updated_at", sa.DateTime(), nullable=True))
+
+    # main.py runs db.create_all() before migrations, so it may exist already
+    if not inspector.has_table("content_version"):
+        op.create_table(
+            "content_version",
+            sa.Column("name", sa.String(length=20), nullable=False),
+            sa.Column("version", sa.Integer(), nullable=False),
+            sa.Column("updated_at", sa.DateTime(), nullable=False),
+            sa.PrimaryKeyConstraint("name"),
+        )
+
+
+def downgrade():
+    op.drop_table("content_version")
+
+    for table in reversed(CONTENT_TABLES):
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.drop_column("updated_at")
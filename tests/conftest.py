@@ -0,0 +1,149 @@
+import importlib.util
+import re
+from pathlib import Path
+
+import pytest
+from alembic.migration import MigrationContext
+from alembic.operations import Operations
+
+from app import create_app, db
+from app.admin import invalidate_catalog_caches
+from app.models import CarBrand, Products, User
+from app.versioning import forget_content_version
+
+
+# Settings that keep the app self-contained and fast: no background
+# threads or processes, no fragment cache in the way of query counts, cheap
+# password hashes
+TEST_ENV = {
+    "MAIL_QUEUE_MODE": "external",
+    "IMAGE_QUEUE_MODE": "inline",
+    "PAGE_CACHE_TYPE": "null",
+    "MAIL_USE_TLS": "0",
+    "PASSWORD_HASH_WORKERS": "0",
+    "PASSWORD_HASH_METHOD": "pbkdf2:sha256:1000",
+}
+
+
+def reset_process_caches():
+    invalidate_catalog_caches()
+    forget_content_version()
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    """
+    Application on a fresh SQLite database, inside an app context.
+    """
+    for name in ("DEL_EMAIL", "PASSWORD", "REC_EMAIL", "MAIL_SERVER", "MAIL_PORT"):
+        monkeypatch.delenv(name, raising=False)
+    monkeypatch.setenv("DATABASE_URL", f"sqlite:///{tmp_path / 'test.db'}")
+    for name, value in TEST_ENV.items():
+        monkeypatch.setenv(name, value)
+
+    app = create_app()
+    app.config.update(
+        TESTING=True,
+        WTF_CSRF_ENABLED=False,
+        UPLOAD_FOLDER=str(tmp_path / "uploads"),
+    )
+    with app.app_context():
+        db.create_all()
+        reset_process_caches()
+        yield app
+        db.session.remove()
+        db.engine.dispose()
+    reset_process_caches()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def user(app):
+    """
+    Customer with a complete profile (checkout needs one).
+    """
+    user = User(
+        email="buyer@example.com",
+        password_hash="-",
+        name="Иван",
+        phone="+70000000000",
+        user_type="фл",
+    )
+    db.session.add(user)
+    db.session.commit()
+    return user
+
+
+@pytest.fixture
+def auth_client(client, user):
+    """
+    Test client logged in as ``user`` (with what ``login_user`` stores).
+    """
+    with client.session_transaction() as sess:
+        sess["_user_id"] = str(user.id)
+        sess["_fresh"] = True
+    return client
+
+
+@pytest.fixture
+def products(app):
+    """
+    Forty products of two brands, priced 100, 110, ... 490.
+    """
+    brands = [CarBrand(name="КАМАЗ"), CarBrand(name="МТЗ")]
+    items = [
+        Products(
+            name=f"Фильтр {n:02d}",
+            article=f"F{n:02d}",
+            full_marking=f"FLT-{n:02d}",
+            type="Грузовики" if n % 2 else "Сельхоз",
+            category="Воздушный" if n % 3 else "Масляный",
+            brand=brands[n % 2],
+            price=100 + 10 * n,
+            description="Описание",
+        )
+        for n in range(40)
+    ]
+    db.session.add_all(items)
+    db.session.commit()
+    return items
+
+
+@pytest.fixture(params=[True, False], ids=["snapshot", "sql"])
+def catalog(request, app, products):
+    """
+    ``products``, with the test run against the in-memory catalog snapshot
+    and against the SQL path.
+    """
+    app.config["CATALOG_SNAPSHOT"] = request.param
+    return products
+
+
+def product_ids(html):
+    """
+    Ids of the product cards in rendered HTML, in page order.
+    """
+    ids = []
+    for match in re.finditer(r"/product_card/(\d+)", html):
+        product_id = int(match.group(1))
+        if not ids or ids[-1] != product_id:
+            ids.append(product_id)
+    return ids
+
+
+def run_migration(filename, direction="upgrade"):
+    """
+    Runs ``upgrade()`` (or ``downgrade()``) of one migration script against
+    the test database, outside of the Alembic revision chain.
+    """
+    path = Path(__file__).parent.parent / "migrations" / "versions" / filename
+    spec = importlib.util.spec_from_file_location(path.stem, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    with db.engine.begin() as connection:
+        with Operations.context(MigrationContext.configure(connection)):
+            getattr(module, direction)()
@@ -0,0 +1,64 @@
+import gzip
+import json
+import os
+
+import pytest
+
+from app.assets import BUNDLE_NAME, build_assets, minify_css
+
+
+@pytest.mark.parametrize(
+    "source, expected",
+    [
+        ("a > b ,  c {\n  color : red ;\n}\n", "a>b,c{color : red}"),
+        ("/* header */ p { margin: 0 } /* it's done */", "p{margin: 0}"),
+        # Quoted strings are kept as they are
+        ('q::before { content: "a  ;  b" ; }', 'q::before{content: "a  ;  b"}'),
+        ("i { content: '/* not a comment */' }", "i{content: '/* not a comment */'}"),
+        (r'b { content: "\"  { \"" }', r'b{content: "\"  { \""}'),
+        ('u { background: url("x ,y.png") }', 'u{background: url("x ,y.png")}'),
+    ],
+)
+def test_minify_css(source, expected):
+    assert minify_css(source) == expected
+
+
+def write(folder, name, data):
+    path = os.path.join(folder, name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+def test_build_fingerprints_and_rewrites_references(tmp_path):
+    static = str(tmp_path)
+    write(static, "img/logo.png", b"png")
+    write(static, "js/app.js", b"console.log(1);" * 50)
+    write(static, "uploads/ab/photo.jpg", b"jpg")
+    write(
+        static,
+        "css/style.css",
+        b'.logo { background: url("../img/logo.png") ; content: "  " }',
+    )
+
+    manifest = build_assets(static)
+
+    logo = manifest["img/logo.png"]
+    assert logo.startswith("build/img/logo.") and logo.endswith(".png")
+    assert "uploads/ab/photo.jpg" not in manifest
+    with open(os.path.join(static, manifest["css/style.css"])) as f:
+        css = f.read()
+    assert css == '.logo{background: url("../img/%s");content: "  "}' % (
+        os.path.basename(logo)
+    )
+    # The bundle holds the stylesheets of base.html that exist
+    with open(os.path.join(static, manifest[BUNDLE_NAME])) as f:
+        assert f.read() == '@charset "UTF-8";\n' + css
+
+    script = os.path.join(static, manifest["js/app.js"])
+    with gzip.open(script + ".gz") as f:
+        assert f.read() == b"console.log(1);" * 50
+    assert not os.path.exists(os.path.join(static, logo) + ".gz")
+
+    with open(os.path.join(static, "build", "manifest.json")) as f:
+        assert json.load(f) == manifest
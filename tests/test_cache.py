@@ -0,0 +1,94 @@
+import pytest
+
+from app import db
+from app.cache import FileSystemCache, MemoryCache, get_cache
+from app.models import Products, User
+from app.querycount import query_budget
+
+
+@pytest.fixture
+def cache(app):
+    app.extensions["page_cache"] = MemoryCache()
+    return get_cache()
+
+
+def render(app, source, **context):
+    return app.jinja_env.from_string(source).render(**context)
+
+
+def test_fragment_key_includes_every_argument(app, cache):
+    source = '{% cache "card", product_id, lang %}{{ text }}{% endcache %}'
+
+    assert render(app, source, product_id=1, lang="ru", text="первый") == "первый"
+    # Same key: the cached text is reused
+    assert render(app, source, product_id=1, lang="ru", text="другой") == "первый"
+    # Another argument value: rendered and cached separately
+    assert render(app, source, product_id=2, lang="ru", text="второй") == "второй"
+    # Keys also carry the content version (0 before the first change)
+    assert cache.get("fragment:0:card:1:ru") == "первый"
+    assert cache.get("fragment:0:card:2:ru") == "второй"
+
+
+def test_warm_homepage_runs_no_queries(app, client, cache, products):
+    products[0].is_main = True
+    db.session.commit()
+    first = client.get("/").get_data(as_text=True)
+
+    # Only the visitor's session (it holds the CSRF token) is loaded
+    with query_budget(1) as statements:
+        second = client.get("/").get_data(as_text=True)
+    assert all("http_session" in sql for sql in statements)
+    assert second == first
+
+
+def test_committed_product_change_clears_the_cache(app, cache, products):
+    cache.set("fragment:x", "cached")
+
+    products[0].name = "Новое имя"
+    db.session.commit()
+
+    assert cache.get("fragment:x") is None
+
+
+def test_unwatched_models_keep_the_cache(app, cache, user):
+    cache.set("fragment:x", "cached")
+
+    user.name = "Пётр"
+    db.session.commit()
+
+    assert cache.get("fragment:x") == "cached"
+
+
+def test_rolled_back_change_keeps_the_cache(app, cache, products, user):
+    cache.set("fragment:x", "cached")
+
+    products[0].name = "Черновик"
+    db.session.flush()
+    db.session.rollback()
+    # The flag of the rolled back flush must not leak into this commit
+    db.session.add(User(email="other@example.com", password_hash="-"))
+    db.session.commit()
+
+    assert cache.get("fragment:x") == "cached"
+    assert Products.query.get(products[0].id).name != "Черновик"
+
+
+def test_memory_cache_evicts_least_recently_used():
+    cache = MemoryCache(max_entries=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+
+    assert (cache.get("a"), cache.get("b"), cache.get("c")) == (1, None, 3)
+
+
+def test_expired_entries_are_dropped(tmp_path):
+    for cache in (MemoryCache(), FileSystemCache(str(tmp_path))):
+        cache.set("fresh", "value")
+        cache.set("stale", "value", ttl=-1)
+
+        assert cache.get("fresh") == "value"
+        assert cache.get("stale") is None
+        cache.clear()
+        assert cache.get("fresh") is None
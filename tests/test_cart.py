@@ -0,0 +1,222 @@
+import pytest
+from sqlalchemy import event
+
+from app import db
+from app.models import (
+    CartItem,
+    add_cart_item,
+    change_cart_item_quantity,
+    delete_cart_item,
+    set_cart_item_quantity,
+)
+
+
+def cart(user):
+    rows = CartItem.query.filter_by(user_id=user.id).all()
+    return {row.product_id: row.quantity for row in rows}
+
+
+def session_cart(client):
+    with client.session_transaction() as sess:
+        return sess["cart"]["items"]
+
+
+def test_catalog_renders_for_anonymous_visitors(client, products):
+    assert client.get("/catalog").status_code == 200
+    assert client.get("/catalog/page").status_code == 200
+
+
+def test_cart_routes_keep_the_session_summary(auth_client, user, products):
+    product_id = products[0].id
+
+    auth_client.post("/cart/add", json={"product_id": product_id})
+    auth_client.post("/cart/add", json={"product_id": product_id})
+    assert session_cart(auth_client) == {str(product_id): 2}
+
+    auth_client.post("/cart/remove", json={"product_id": product_id})
+    assert session_cart(auth_client) == {}
+    assert cart(user) == {}
+
+
+def test_remove_missing_item_succeeds(auth_client, user, products):
+    response = auth_client.post("/cart/remove", json={"product_id": products[0].id})
+
+    assert response.json == {
+        "success": True,
+        "message": "Товар уже отсутствует в корзине",
+    }
+
+
+@pytest.mark.parametrize("product_id", ["abc", None, [1], "0"])
+def test_remove_rejects_a_bad_product_id(auth_client, user, products, product_id):
+    auth_client.post("/cart/add", json={"product_id": products[0].id})
+
+    response = auth_client.post("/cart/remove", json={"product_id": product_id})
+
+    assert response.status_code == 400
+    assert cart(user) == {products[0].id: 1}
+
+
+def test_remove_form_with_a_bad_product_id(auth_client, user, products):
+    response = auth_client.post("/cart/remove", data={"product_id": "abc"})
+
+    assert response.status_code == 302
+
+
+def test_add_inserts_then_increments_one_row(auth_client, user, products):
+    product_id = products[0].id
+
+    first = auth_client.post("/cart/add", json={"product_id": product_id})
+    second = auth_client.post("/cart/add", json={"product_id": str(product_id)})
+
+    assert first.json == {"success": True, "quantity": 1}
+    assert second.json == {"success": True, "quantity": 2}
+    assert cart(user) == {product_id: 2}
+
+
+def test_add_unknown_product(auth_client, user, products):
+    response = auth_client.post("/cart/add", json={"product_id": 10_000})
+
+    assert response.status_code == 404
+    assert cart(user) == {}
+    # The empty statement was rolled back: the next request is not blocked
+    response = auth_client.post("/cart/add", json={"product_id": products[0].id})
+    assert response.json["success"]
+
+
+@pytest.mark.parametrize("product_id", ["abc", None, True, [1]])
+def test_add_rejects_a_bad_product_id(auth_client, user, products, product_id):
+    response = auth_client.post("/cart/add", json={"product_id": product_id})
+
+    assert response.status_code == 400
+    assert cart(user) == {}
+
+
+def test_upsert_helpers(app, user, products):
+    product_id = products[0].id
+
+    assert add_cart_item(user.id, product_id, 3) == 3
+    assert add_cart_item(user.id, product_id, 2) == 5
+    assert set_cart_item_quantity(user.id, product_id, 1) == 1
+    assert delete_cart_item(user.id, product_id)
+    # Changing or removing a missing line does not create one
+    assert set_cart_item_quantity(user.id, product_id, 4) is None
+    assert not delete_cart_item(user.id, product_id)
+    db.session.commit()
+    assert cart(user) == {}
+
+
+def test_update_sets_and_removes(auth_client, user, products):
+    product_id = products[0].id
+    auth_client.post("/cart/add", json={"product_id": product_id})
+
+    response = auth_client.post(
+        "/cart/update", json={"product_id": str(product_id), "quantity": 7}
+    )
+    assert response.json["quantity"] == 7
+    assert cart(user) == {product_id: 7}
+    assert session_cart(auth_client) == {str(product_id): 7}
+
+    auth_client.post("/cart/update", json={"product_id": product_id, "quantity": 0})
+    assert cart(user) == {}
+
+    response = auth_client.post(
+        "/cart/update", json={"product_id": product_id, "quantity": 1}
+    )
+    assert response.status_code == 404
+
+
+@pytest.mark.parametrize("quantity", [None, "many", True])
+def test_update_rejects_a_bad_quantity(auth_client, user, products, quantity):
+    auth_client.post("/cart/add", json={"product_id": products[0].id})
+
+    response = auth_client.post(
+        "/cart/update", json={"product_id": products[0].id, "quantity": quantity}
+    )
+
+    assert response.status_code == 400
+    assert cart(user) == {products[0].id: 1}
+
+
+def test_change_quantity_helper(app, user, products):
+    product_id = products[0].id
+
+    assert change_cart_item_quantity(user.id, product_id, 2) == 2
+    assert change_cart_item_quantity(user.id, product_id, -1) == 1
+    assert change_cart_item_quantity(user.id, product_id, -1) == 0
+    # Removed at zero; decreasing a missing line does not create one
+    assert change_cart_item_quantity(user.id, product_id, -1) is None
+    assert change_cart_item_quantity(user.id, 10_000, 1) is None
+    db.session.commit()
+    assert cart(user) == {}
+
+
+def test_batch_applies_all_ops(auth_client, user, products):
+    a, b, c = (p.id for p in products[:3])
+    auth_client.post("/cart/add", json={"product_id": c})
+
+    response = auth_client.post(
+        "/cart/batch",
+        json={
+            "ops": [
+                {"product_id": a, "delta": 2},
+                {"product_id": str(a), "delta": 1},
+                {"product_id": b, "quantity": 5},
+                {"product_id": c, "quantity": 0},
+                {"product_id": 10_000, "delta": 1},
+            ]
+        },
+    )
+
+    assert response.json == {
+        "success": True,
+        "cart": {str(a): 3, str(b): 5},
+        "skipped": [10_000],
+    }
+    assert cart(user) == {a: 3, b: 5}
+    # Rendered from the session summary, not from cart_item
+    assert session_cart(auth_client) == {str(a): 3, str(b): 5}
+
+
+def test_batch_is_one_transaction(app, auth_client, user, products):
+    commits = []
+
+    def count_commits(conn):
+        commits.append(conn)
+
+    event.listen(db.engine, "commit", count_commits)
+    try:
+        auth_client.post(
+            "/cart/batch",
+            json={"ops": [{"product_id": p.id, "delta": 1} for p in products[:10]]},
+        )
+    finally:
+        event.remove(db.engine, "commit", count_commits)
+
+    # The cart changes, then the session with the new cart summary
+    assert len(commits) == 2
+    assert len(cart(user)) == 10
+
+
+@pytest.mark.parametrize(
+    "body",
+    [
+        {},
+        [],
+        {"ops": []},
+        {"ops": {"product_id": 1, "delta": 1}},
+        {"ops": [{"product_id": 1}]},
+        {"ops": [{"product_id": 1, "delta": 1, "quantity": 1}]},
+        {"ops": [{"product_id": 1, "delta": "1"}]},
+        {"ops": [{"product_id": 1, "delta": True}]},
+        {"ops": [{"product_id": "x", "delta": 1}]},
+        {"ops": [{"product_id": 1, "delta": 1}] * 3},
+    ],
+)
+def test_batch_rejects_malformed_requests(app, auth_client, user, products, body):
+    app.config["CART_BATCH_MAX_OPS"] = 2
+
+    response = auth_client.post("/cart/batch", json=body)
+
+    assert response.status_code == 400
+    assert cart(user) == {}
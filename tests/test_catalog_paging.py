@@ -0,0 +1,163 @@
+import base64
+import json
+import re
+
+import pytest
+
+from app import db
+from app.models import Products
+from tests.conftest import product_ids
+
+
+def walk(client, url):
+    """
+    Follows ``next_page_url`` from the first page to the last one.
+
+    Returns:
+        list: Pages of product ids.
+    """
+    pages = []
+    while url:
+        response = client.get(url)
+        assert response.status_code == 200
+        pages.append(product_ids(response.json["html"]))
+        assert response.json["count"] == len(pages[-1])
+        url = response.json["next_page_url"]
+    return pages
+
+
+@pytest.mark.parametrize(
+    "sort, key, reverse",
+    [
+        ("name_asc", "name", False),
+        ("name_desc", "name", True),
+        ("price_asc", "price", False),
+        ("price_desc", "price", True),
+    ],
+)
+def test_pages_cover_the_sorted_catalog(auth_client, catalog, sort, key, reverse):
+    pages = walk(auth_client, f"/catalog/page?sort={sort}&per_page=7")
+
+    assert [len(page) for page in pages] == [7, 7, 7, 7, 7, 5]
+    expected = sorted(
+        catalog, key=lambda p: (getattr(p, key), p.id), reverse=reverse
+    )
+    assert sum(pages, []) == [p.id for p in expected]
+
+
+def test_pages_keep_the_filters(auth_client, catalog):
+    pages = walk(
+        auth_client, "/catalog/page?type=Грузовики&price_min=200&per_page=4"
+    )
+
+    expected = [
+        p.id
+        for p in sorted(catalog, key=lambda p: p.name)
+        if p.type == "Грузовики" and p.price >= 200
+    ]
+    assert sum(pages, []) == expected
+    assert [len(page) for page in pages] == [4, 4, 4, 3]
+
+
+def test_equal_sort_keys_are_not_skipped(auth_client, catalog):
+    # Ties on the sort key are broken by id
+    for product in catalog:
+        product.price = 100 if product.id % 2 else 200
+    db.session.commit()
+
+    pages = walk(auth_client, "/catalog/page?sort=price_asc&per_page=3")
+
+    ids = sum(pages, [])
+    assert ids == [p.id for p in sorted(catalog, key=lambda p: (p.price, p.id))]
+
+
+def test_cursor_stays_valid_after_insert(auth_client, catalog):
+    first = auth_client.get("/catalog/page?sort=price_asc&per_page=5").json
+    db.session.add(
+        Products(
+            name="Фильтр 00a",
+            article="F00A",
+            full_marking="FLT-00A",
+            type="Сельхоз",
+            category="Воздушный",
+            price=1,
+            description="Описание",
+        )
+    )
+    db.session.commit()
+
+    # The new cheapest product falls before the cursor: no repeats, no gaps
+    rest = walk(auth_client, first["next_page_url"])
+    seen = product_ids(first["html"]) + sum(rest, [])
+    assert seen == [p.id for p in sorted(catalog, key=lambda p: p.price)]
+
+
+def test_page_size_is_capped(app, auth_client, catalog):
+    app.config["CATALOG_MAX_PAGE_SIZE"] = 10
+
+    response = auth_client.get("/catalog/page?per_page=1000")
+
+    assert response.json["count"] == 10
+
+
+@pytest.mark.parametrize(
+    "query",
+    [
+        "cursor=garbage",
+        # A name_asc cursor reused with another sort order
+        "sort=price_desc&cursor={cursor}",
+    ],
+)
+def test_bad_cursor_is_rejected(auth_client, catalog, query):
+    cursor = auth_client.get("/catalog/page?per_page=2").json["next_cursor"]
+
+    response = auth_client.get("/catalog/page?" + query.format(cursor=cursor))
+
+    assert response.status_code == 400
+
+
+def forge_cursor(payload):
+    raw = json.dumps(payload).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+@pytest.mark.parametrize(
+    "payload",
+    [
+        {"s": "name_asc", "k": [1], "i": 1},
+        {"s": "name_asc", "k": {"a": 1}, "i": 1},
+        {"s": "name_asc", "k": "Фильтр 01", "i": "1"},
+        {"s": "name_asc", "k": "Фильтр 01", "i": True},
+        {"s": "rank", "o": "5"},
+    ],
+)
+def test_forged_cursor_is_rejected(auth_client, catalog, payload):
+    response = auth_client.get("/catalog/page?cursor=" + forge_cursor(payload))
+
+    assert response.status_code == 400
+
+
+def test_relevance_paging_stops_at_the_result_cap(app, auth_client, catalog):
+    app.config["SEARCH_MAX_RESULTS"] = 10
+
+    pages = walk(auth_client, "/catalog/page?q=фильтр&per_page=4")
+
+    assert [len(page) for page in pages] == [4, 4, 2]
+    assert len(set(sum(pages, []))) == 10
+
+
+def test_streamed_catalog_matches_the_rendered_one(app, auth_client, products):
+    url = "/catalog?sort=price_asc&type=Грузовики&per_page=5"
+    app.config["CATALOG_SNAPSHOT"] = False
+    rendered = auth_client.get(url)
+    app.config.update(CATALOG_STREAMING=True, CATALOG_STREAM_BUFFER=1024)
+
+    streamed = auth_client.get(url)
+
+    assert streamed.is_streamed
+    html = streamed.get_data(as_text=True)
+    assert product_ids(html) == product_ids(rendered.get_data(as_text=True))
+    assert len(product_ids(html)) == 5
+    next_link = re.search(r'data-next-page-url="([^"]+)"', html).group(1)
+    assert "cursor=" in next_link
+    assert 'name="csrf-token" content="' in html
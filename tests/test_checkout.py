@@ -0,0 +1,70 @@
+from decimal import Decimal
+
+from sqlalchemy import event
+from sqlalchemy.dialects import postgresql
+
+from app import db
+from app.models import CartItem, Order
+from app.routes import _locked_cart_ids
+from tests.test_query_budget import fill_cart
+
+
+def test_order_is_a_snapshot_of_the_cart(auth_client, user, products):
+    products[0].price = 10.15
+    products[1].price = 0.1
+    db.session.commit()
+    fill_cart(user, products, 3)  # two of each
+
+    assert auth_client.post("/cart/checkout").status_code == 200
+
+    order = Order.query.one()
+    lines = {item.product_id: item for item in order.items}
+    assert lines[products[0].id].price == Decimal("10.15")
+    assert lines[products[0].id].sum == Decimal("20.30")
+    assert lines[products[1].id].product_name == products[1].name
+    assert lines[products[2].id].article == products[2].article
+    # Summed in SQL from the Numeric line sums, without float drift
+    assert order.total_sum == Decimal("20.30") + Decimal("0.20") + Decimal("240.00")
+    assert CartItem.query.filter_by(user_id=user.id).count() == 0
+
+
+def test_empty_cart_is_not_ordered(auth_client, user, products):
+    response = auth_client.post("/cart/checkout")
+
+    assert response.status_code == 302
+    assert Order.query.count() == 0
+
+
+def test_cart_rows_are_locked_for_update(app):
+    statement = _locked_cart_ids(1).compile(dialect=postgresql.dialect())
+
+    assert str(statement).endswith("FOR UPDATE")
+
+
+def test_line_added_after_the_lock_stays_in_the_cart(auth_client, user, products):
+    fill_cart(user, products, 2)
+    late_product_id = products[5].id
+    added = []
+
+    # Simulates a concurrent add that lands after the cart rows were locked
+    def add_late_line(conn, cursor, statement, parameters, context, executemany):
+        if statement.startswith('INSERT INTO "order"') and not added:
+            added.append(late_product_id)
+            conn.execute(
+                db.insert(CartItem).values(
+                    user_id=user.id, product_id=late_product_id, quantity=1
+                )
+            )
+
+    event.listen(db.engine, "after_cursor_execute", add_late_line)
+    try:
+        auth_client.post("/cart/checkout")
+    finally:
+        event.remove(db.engine, "after_cursor_execute", add_late_line)
+
+    order = Order.query.one()
+    assert sorted(item.product_id for item in order.items) == sorted(
+        p.id for p in products[:2]
+    )
+    remaining = CartItem.query.filter_by(user_id=user.id).all()
+    assert [item.product_id for item in remaining] == [late_product_id]
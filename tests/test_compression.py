@@ -0,0 +1,120 @@
+import gzip
+from pathlib import Path
+
+import pytest
+from flask import Flask
+
+from app.compression import choose_encoding, init_compression, parse_accept_encoding
+
+STYLE = Path(__file__).parent.parent / "app" / "static" / "css" / "style.css"
+
+
+@pytest.mark.parametrize(
+    "header, brotli_available, expected",
+    [
+        ("gzip, deflate, br", True, "br"),
+        ("gzip, deflate, br", False, "gzip"),
+        ("br;q=0.5, gzip", True, "gzip"),
+        ("br;q=0, gzip;q=0.1", True, "gzip"),
+        ("*", True, "br"),
+        ("*;q=0.5, gzip;q=0", False, None),
+        ("identity", True, None),
+        ("", True, None),
+        (None, True, None),
+    ],
+)
+def test_choose_encoding(header, brotli_available, expected):
+    assert choose_encoding(header, brotli_available=brotli_available) == expected
+
+
+def test_parse_accept_encoding():
+    assert parse_accept_encoding("GZIP;q=0.8, br;q=0, x;q=bad, ,") == {
+        "gzip": 0.8,
+        "br": 0.0,
+        "x": 0.0,
+    }
+
+
+@pytest.fixture
+def static_app(tmp_path):
+    """
+    Bare application serving ``tmp_path`` as its static folder, compressed.
+    """
+    app = Flask(__name__, static_folder=str(tmp_path), static_url_path="/static")
+    app.config.update(
+        COMPRESS_MIN_SIZE=500,
+        COMPRESS_LEVEL=6,
+        COMPRESS_BROTLI_QUALITY=4,
+        WTF_CSRF_FIELD_NAME="csrf_token",
+    )
+    init_compression(app)
+    (tmp_path / "site.css").write_text("body{color:red}" * 100)
+    return app
+
+
+def test_precompressed_sibling_is_served(static_app, tmp_path):
+    sibling = gzip.compress((tmp_path / "site.css").read_bytes())
+    (tmp_path / "site.css.gz").write_bytes(sibling)
+
+    response = static_app.test_client().get(
+        "/static/site.css", headers={"Accept-Encoding": "gzip"}
+    )
+
+    assert response.status_code == 200
+    assert response.data == sibling
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert response.mimetype == "text/css"
+    assert response.headers["Vary"] == "Accept-Encoding"
+
+
+def test_missing_sibling_falls_back_to_compressing(static_app):
+    pytest.importorskip("brotli")
+
+    response = static_app.test_client().get(
+        "/static/site.css", headers={"Accept-Encoding": "br"}
+    )
+
+    assert response.headers["Content-Encoding"] == "br"
+    assert "Content-Length" not in response.headers
+
+
+def test_sibling_path_cannot_escape_static_folder(static_app, tmp_path):
+    (tmp_path.parent / "secret.gz").write_bytes(b"secret")
+
+    response = static_app.test_client().get(
+        "/static/../secret", headers={"Accept-Encoding": "gzip"}
+    )
+
+    assert response.status_code == 404
+
+
+def test_static_file_is_compressed_with_weak_etag(client):
+    response = client.get("/static/css/style.css", headers={"Accept-Encoding": "gzip"})
+
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert "Accept-Encoding" in response.headers["Vary"]
+    assert gzip.decompress(response.data) == STYLE.read_bytes()
+
+    etag = response.headers["ETag"]
+    assert etag.startswith("W/")
+    revalidated = client.get(
+        "/static/css/style.css",
+        headers={"Accept-Encoding": "gzip", "If-None-Match": etag},
+    )
+    assert revalidated.status_code == 304
+
+
+def test_uncompressed_response_still_varies(client):
+    response = client.get("/static/css/style.css")
+
+    assert "Content-Encoding" not in response.headers
+    assert "Accept-Encoding" in response.headers["Vary"]
+    assert response.data == STYLE.read_bytes()
+
+
+def test_pages_with_csrf_token_are_not_compressed(client):
+    response = client.get("/", headers={"Accept-Encoding": "gzip, br"})
+
+    assert response.status_code == 200
+    assert "Content-Encoding" not in response.headers
+    assert 'name="csrf-token"' in response.get_data(as_text=True)
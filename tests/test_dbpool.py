@@ -0,0 +1,77 @@
+from contextlib import ExitStack
+
+from sqlalchemy.exc import TimeoutError as PoolTimeout
+
+from app import db
+from app.dbpool import engine_options, pool_status
+
+CONFIG = {
+    "DB_POOL_SIZE": 4,
+    "DB_MAX_OVERFLOW": 2,
+    "DB_POOL_TIMEOUT": 3,
+    "DB_POOL_RECYCLE": 600,
+    "DB_POOL_PRE_PING": True,
+    "DB_STATEMENT_TIMEOUT": 5000,
+}
+
+
+def test_engine_options_for_postgresql():
+    options = engine_options(
+        dict(CONFIG, SQLALCHEMY_DATABASE_URI="postgresql://u:p@db/agt")
+    )
+
+    assert options == {
+        "pool_pre_ping": True,
+        "pool_recycle": 600,
+        "pool_size": 4,
+        "max_overflow": 2,
+        "pool_timeout": 3,
+        "connect_args": {"options": "-c statement_timeout=5000"},
+    }
+
+
+def test_engine_options_for_sqlite():
+    options = engine_options(dict(CONFIG, SQLALCHEMY_DATABASE_URI="sqlite:///x.db"))
+
+    assert options == {"pool_pre_ping": True, "pool_recycle": 600}
+
+
+def test_healthz_reports_the_pool(client):
+    response = client.get("/healthz")
+
+    assert response.status_code == 200
+    assert response.json["status"] == "ok"
+    assert response.json["pool"]["checked_out"] == 0
+    assert response.headers["Cache-Control"] == "no-store"
+    assert client.get_cookie("session") is None
+
+
+def test_healthz_answers_503_when_the_pool_is_saturated(app, client):
+    capacity = pool_status()["pool"]["capacity"]
+
+    with ExitStack() as stack:
+        for _ in range(capacity):
+            stack.enter_context(db.engine.connect())
+        response = client.get("/healthz")
+
+    assert response.status_code == 503
+    assert response.json["status"] == "saturated"
+    assert response.json["pool"]["checked_out"] == capacity
+    assert client.get("/healthz").status_code == 200
+
+
+def test_pool_timeout_answers_503(app, client):
+    @app.route("/test-pool-timeout")
+    def pool_timeout():
+        raise PoolTimeout("QueuePool limit reached")
+
+    timeouts = pool_status()["metrics"]["timeouts"]
+
+    response = client.get("/test-pool-timeout")
+
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "5"
+    assert response.json == {"success": False, "error": "Сервер перегружен"}
+    metrics = client.get("/healthz").json["metrics"]
+    assert metrics["timeouts"] == timeouts + 1
+    assert metrics["last_timeout"] == 0
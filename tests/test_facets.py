@@ -0,0 +1,54 @@
+from flask import g
+
+from app import db
+from app.admin import invalidate_catalog_caches
+from app.facets import get_facets
+from app.models import ContentVersion, Products
+from app.versioning import forget_content_version
+
+
+def test_facets_count_products(products):
+    facets = get_facets()
+
+    assert facets.types == [("Грузовики", 20), ("Сельхоз", 20)]
+    assert [(b.name, b.count) for b in facets.brands] == [("КАМАЗ", 20), ("МТЗ", 20)]
+
+
+def test_type_filter_narrows_categories_and_brands(products):
+    facets = get_facets(type_filter="Грузовики")
+
+    assert facets.categories == [("Воздушный", 13), ("Масляный", 7)]
+    assert [b.name for b in facets.brands] == ["МТЗ"]
+    # The type dropdown itself still offers every type
+    assert len(facets.types) == 2
+
+
+def test_facets_are_cached_until_invalidated(products):
+    get_facets()
+    # A bulk UPDATE skips the ORM events, so the content version stays put
+    Products.query.filter_by(type="Сельхоз").update({"type": "Спец.техника"})
+    db.session.commit()
+
+    assert ("Сельхоз", 20) in get_facets().types
+
+    invalidate_catalog_caches()
+    assert ("Спец.техника", 20) in get_facets().types
+
+
+def test_facets_follow_changes_of_other_processes(products):
+    get_facets()
+
+    # Another worker moves products and bumps the shared content version
+    with db.engine.begin() as connection:
+        connection.execute(
+            db.update(Products)
+            .where(Products.type == "Сельхоз")
+            .values(type="Спец.техника")
+        )
+        connection.execute(
+            db.update(ContentVersion).values(version=ContentVersion.version + 1)
+        )
+    forget_content_version()  # as if CONTENT_VERSION_TTL had passed
+    g.pop("content_version", None)
+
+    assert ("Спец.техника", 20) in get_facets().types
@@ -0,0 +1,97 @@
+import os
+import time
+
+import pytest
+from flask import g
+from PIL import Image, features
+
+from app import db
+from app.imagejobs import ImageWorkerPool
+from app.images import picture, process_image
+from app.models import ImageJob
+from app.versioning import get_content_version
+
+pytestmark = pytest.mark.skipif(not features.check("webp"), reason="no WebP encoder")
+
+
+@pytest.fixture
+def uploads(app):
+    app.config["IMAGE_FORMATS"] = ["webp"]
+    folder = app.config["UPLOAD_FOLDER"]
+    os.makedirs(folder, exist_ok=True)
+    return folder
+
+
+def make_image(folder, name, width):
+    path = os.path.join(folder, name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    Image.new("RGB", (width, width // 2)).save(path, format="PNG")
+
+
+def test_srcset_lists_actual_widths(app, uploads):
+    make_image(uploads, "small.png", 300)
+    process_image("small.png")
+
+    with app.test_request_context():
+        html = str(picture("small.png"))
+
+    assert "small.thumb.webp 160w" in html
+    assert "small.card.webp 300w" in html
+    # Same size as the card variant: not listed again
+    assert "small.full.webp" not in html
+    assert "480w" not in html and "1200w" not in html
+
+
+def test_srcset_of_large_image(app, uploads):
+    make_image(uploads, "large.png", 2000)
+    process_image("large.png")
+
+    with app.test_request_context():
+        html = str(picture("large.png"))
+
+    assert "large.thumb.webp 160w" in html
+    assert "large.card.webp 480w" in html
+    assert "large.full.webp 1200w" in html
+
+
+def test_variants_of_extensionless_upload_stay_in_its_folder(app, uploads):
+    make_image(uploads, "legacy.dir/photo", 600)
+
+    written = process_image("legacy.dir/photo")
+
+    assert sorted(os.path.relpath(path, uploads) for path in written) == [
+        "legacy.dir/photo.card.webp",
+        "legacy.dir/photo.full.webp",
+        "legacy.dir/photo.thumb.webp",
+    ]
+
+
+def test_worker_pool_makes_variants_in_spawned_processes(app, uploads):
+    app.config["IMAGE_QUEUE_WORKERS"] = 1
+    make_image(uploads, "queued.png", 600)
+    db.session.add_all([ImageJob(filename="queued.png"), ImageJob(filename="gone.png")])
+    db.session.commit()
+    version = get_content_version()
+
+    pool = ImageWorkerPool(app)
+    pool.start()
+    try:
+        assert pool._executor._mp_context.get_start_method() == "spawn"
+        # The feeder thread takes both jobs in one batch, committed at once
+        deadline = time.monotonic() + 60
+        while not ImageJob.query.filter_by(status="done").count():
+            db.session.rollback()
+            assert time.monotonic() < deadline
+            time.sleep(0.1)
+    finally:
+        pool.stop()
+
+    db.session.rollback()
+    jobs = {job.filename: job for job in ImageJob.query}
+    assert jobs["queued.png"].status == "done"
+    assert os.path.exists(os.path.join(uploads, "queued.card.webp"))
+    # A missing original is retried later
+    assert jobs["gone.png"].status == "pending"
+    assert jobs["gone.png"].attempts == 1
+    g.pop("content_version", None)
+    assert get_content_version() == version + 1
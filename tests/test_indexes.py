@@ -0,0 +1,57 @@
+import pytest
+from sqlalchemy.exc import IntegrityError
+
+from app import db
+from app.models import CartItem
+from tests.conftest import run_migration
+
+MIGRATION = "c5e83b1f92d6_hot_column_indexes.py"
+
+
+def index_names(table):
+    return {index["name"] for index in db.inspect(db.engine).get_indexes(table)}
+
+
+def test_migration_merges_duplicate_cart_lines(app, user, products):
+    # A database from before the migration: no unique cart index yet
+    run_migration(MIGRATION, "downgrade")
+    assert "uq_cart_item_user_product" not in index_names("cart_item")
+    db.session.add_all(
+        [
+            CartItem(user_id=user.id, product_id=products[0].id, quantity=2),
+            CartItem(user_id=user.id, product_id=products[1].id, quantity=1),
+            CartItem(user_id=user.id, product_id=products[0].id, quantity=3),
+            CartItem(user_id=user.id, product_id=products[0].id, quantity=1),
+        ]
+    )
+    db.session.commit()
+    first_id = min(
+        line.id for line in CartItem.query.filter_by(product_id=products[0].id)
+    )
+
+    run_migration(MIGRATION)
+
+    db.session.expire_all()
+    lines = {line.product_id: line for line in CartItem.query}
+    assert {pid: line.quantity for pid, line in lines.items()} == {
+        products[0].id: 6,
+        products[1].id: 1,
+    }
+    # The oldest line is the one kept
+    assert lines[products[0].id].id == first_id
+    assert "uq_cart_item_user_product" in index_names("cart_item")
+
+    db.session.add(CartItem(user_id=user.id, product_id=products[1].id))
+    with pytest.raises(IntegrityError):
+        db.session.commit()
+    db.session.rollback()
+
+
+def test_migration_skips_existing_indexes(app):
+    # create_all() already made them; the migration must not fail on that
+    before = index_names("product")
+
+    run_migration(MIGRATION)
+
+    assert index_names("product") == before
+    assert {"ix_product_price_id", "ix_product_brand_id"} <= before
@@ -0,0 +1,157 @@
+import socketserver
+import threading
+from datetime import datetime
+
+import pytest
+
+from app import db, mail
+from app.mailqueue import MailDispatcher, enqueue_mail
+from app.models import MailOutbox
+
+
+class SMTPHandler(socketserver.StreamRequestHandler):
+    """
+    Just enough SMTP for smtplib: accepts every command and keeps the
+    DATA of each message.
+    """
+
+    def reply(self, line):
+        self.wfile.write(f"{line}\r\n".encode())
+
+    def handle(self):
+        self.reply("220 localhost")
+        data, lines = False, []
+        for raw in self.rfile:
+            line = raw.decode().rstrip("\r\n")
+            if data:
+                if line == ".":
+                    self.server.messages.append("\n".join(lines))
+                    data, lines = False, []
+                    self.reply("250 Queued")
+                else:
+                    lines.append(line)
+                continue
+            command = line[:4].upper()
+            if command == "DATA":
+                data = True
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+            elif command == "QUIT":
+                self.reply("221 Bye")
+                return
+            else:
+                self.reply("250 OK")
+
+
+class SMTPStandIn(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+
+    def __init__(self):
+        # Bound but not listening yet: connections are refused until start()
+        super().__init__(("127.0.0.1", 0), SMTPHandler, bind_and_activate=False)
+        self.server_bind()
+        self.messages = []
+        self.started = False
+
+    def start(self):
+        self.server_activate()
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        self.started = True
+
+    def stop(self):
+        if self.started:
+            self.shutdown()
+        self.server_close()
+
+
+@pytest.fixture
+def smtp(app):
+    server = SMTPStandIn()
+    app.config.update(
+        MAIL_SERVER="127.0.0.1",
+        MAIL_PORT=server.server_address[1],
+        MAIL_SUPPRESS_SEND=False,
+    )
+    mail.init_app(app)
+    yield server
+    server.stop()
+
+
+def queue(subject="Новый заказ"):
+    message = enqueue_mail(
+        subject=subject,
+        sender="shop@example.com",
+        recipients=["admin@example.com"],
+        body="Текст",
+    )
+    db.session.commit()
+    return message
+
+
+def make_due(message):
+    message.next_attempt_at = datetime.utcnow()
+    db.session.commit()
+
+
+def test_failed_send_is_retried(app, smtp):
+    message = queue()
+    dispatcher = MailDispatcher(app)
+
+    assert dispatcher.run_once() == 1
+    assert message.status == "pending"
+    assert message.attempts == 1
+    assert message.last_error
+    # Backed off: not due again right away
+    assert dispatcher.run_once() == 0
+
+    smtp.start()
+    make_due(message)
+    assert dispatcher.run_once() == 1
+
+    assert message.status == "sent"
+    assert message.sent_at is not None
+    assert message.last_error is None
+    assert len(smtp.messages) == 1
+    assert "admin@example.com" in smtp.messages[0]
+
+
+def test_batch_is_sent_over_one_connection(app, smtp):
+    smtp.start()
+    messages = [queue(f"Заказ {n}") for n in range(3)]
+
+    assert MailDispatcher(app).run_once() == 3
+
+    assert [m.status for m in messages] == ["sent"] * 3
+    assert len(smtp.messages) == 3
+
+
+def test_gives_up_after_max_attempts(app, smtp):
+    app.config["MAIL_QUEUE_MAX_ATTEMPTS"] = 2
+    message = queue()
+    dispatcher = MailDispatcher(app)
+
+    dispatcher.run_once()
+    make_due(message)
+    dispatcher.run_once()
+
+    assert message.status == "failed"
+    assert message.attempts == 2
+    make_due(message)
+    assert dispatcher.run_once() == 0
+
+
+def test_message_without_recipients_is_not_queued(app):
+    assert enqueue_mail("Тема", "shop@example.com", [None, ""]) is None
+    db.session.commit()
+    assert MailOutbox.query.count() == 0
+
+
+def test_checkout_queues_the_notification(auth_client, user, products, monkeypatch):
+    monkeypatch.setenv("REC_EMAIL", "admin@example.com")
+    auth_client.post("/cart/add", json={"product_id": products[0].id})
+
+    auth_client.post("/cart/checkout")
+
+    message = MailOutbox.query.one()
+    assert message.recipients == "admin@example.com"
+    assert message.status == "pending"
+    assert products[0].name in message.body
@@ -0,0 +1,63 @@
+import threading
+from datetime import datetime
+
+from app import db
+from app.models import Order, OrderCounter, generate_order_number
+from tests.conftest import run_migration
+
+
+class FrozenDatetime(datetime):
+    now_value = datetime(2026, 3, 1, 12, 0)
+
+    @classmethod
+    def utcnow(cls):
+        return cls.now_value
+
+
+def test_numbers_count_per_day(app, monkeypatch):
+    monkeypatch.setattr("app.models.datetime", FrozenDatetime)
+
+    first = [generate_order_number() for _ in range(3)]
+    monkeypatch.setattr(FrozenDatetime, "now_value", datetime(2026, 3, 2, 9, 0))
+    second = generate_order_number()
+
+    assert first == ["AGT-20260301-0001", "AGT-20260301-0002", "AGT-20260301-0003"]
+    assert second == "AGT-20260302-0001"
+    assert dict(db.session.query(OrderCounter.day, OrderCounter.value)) == {
+        "20260301": 3,
+        "20260302": 1,
+    }
+
+
+def test_concurrent_checkouts_get_distinct_numbers(app):
+    numbers = []
+
+    def allocate():
+        with app.app_context():
+            for _ in range(5):
+                numbers.append(generate_order_number())
+
+    threads = [threading.Thread(target=allocate) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(numbers) == len(set(numbers)) == 40
+
+
+def test_migration_continues_after_issued_numbers(app, user):
+    db.session.add_all(
+        Order(order_number=number, user_id=user.id, status="new")
+        for number in ("AGT-20260301-0004", "AGT-20260301-0011", "AGT-20260302-7")
+    )
+    db.session.add(Order(order_number="legacy", user_id=user.id, status="new"))
+    db.session.commit()
+    OrderCounter.__table__.drop(db.engine)
+
+    run_migration("b84e0c6f1a25_order_counter.py")
+
+    assert dict(db.session.query(OrderCounter.day, OrderCounter.value)) == {
+        "20260301": 11,
+        "20260302": 7,
+    }
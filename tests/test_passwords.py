@@ -0,0 +1,95 @@
+import pytest
+from werkzeug.security import generate_password_hash
+
+from app import db, passwords
+from app.models import User
+from app.passwords import (
+    HashingBusy,
+    hash_password,
+    needs_rehash,
+    shutdown_pool,
+    verify_password,
+)
+
+
+@pytest.fixture
+def old_hash_user(app):
+    """
+    User whose stored hash was made with older, cheaper parameters.
+    """
+    user = User(
+        email="old@example.com",
+        password_hash=generate_password_hash("secret", "pbkdf2:sha256:500"),
+    )
+    db.session.add(user)
+    db.session.commit()
+    return user
+
+
+def login(client, password):
+    pytest.importorskip("email_validator")  # needed by the Email() validator
+    return client.post(
+        "/auth/user_login",
+        data={"action": "Войти", "email": "old@example.com", "password": password},
+    )
+
+
+def test_hashes_use_the_configured_method(app):
+    password_hash = hash_password("secret")
+
+    assert password_hash.startswith("pbkdf2:sha256:1000$")
+    assert verify_password(password_hash, "secret")
+    assert not verify_password(password_hash, "wrong")
+    assert not needs_rehash(password_hash)
+    assert needs_rehash(generate_password_hash("secret", "pbkdf2:sha256:500"))
+    assert needs_rehash(generate_password_hash("secret", "scrypt"))
+
+
+def test_login_rehashes_an_outdated_hash(client, old_hash_user):
+    response = login(client, "secret")
+
+    assert response.status_code == 302
+    db.session.refresh(old_hash_user)
+    assert old_hash_user.password_hash.startswith("pbkdf2:sha256:1000$")
+    assert old_hash_user.check_password("secret")
+
+
+def test_failed_login_keeps_the_hash(client, old_hash_user):
+    old_hash = old_hash_user.password_hash
+
+    response = login(client, "wrong")
+
+    assert response.status_code == 200
+    db.session.refresh(old_hash_user)
+    assert old_hash_user.password_hash == old_hash
+
+
+def test_busy_hashing_pool_answers_503(client, old_hash_user, monkeypatch):
+    def busy(password_hash, password):
+        raise HashingBusy()
+
+    monkeypatch.setattr("app.models.verify_password", busy)
+
+    response = login(client, "secret")
+
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "60"
+    assert "Попробуйте войти через минуту" in response.get_data(as_text=True)
+
+
+def test_pool_is_bounded(app):
+    app.config.update(
+        PASSWORD_HASH_WORKERS=1, PASSWORD_HASH_MAX_PENDING=1, PASSWORD_HASH_TIMEOUT=0.1
+    )
+    try:
+        password_hash = hash_password("secret")
+        assert verify_password(password_hash, "secret")
+        assert passwords._pool._mp_context.get_start_method() == "spawn"
+
+        # The only slot is taken by another request
+        passwords._slots.acquire()
+        with pytest.raises(HashingBusy):
+            verify_password(password_hash, "secret")
+        passwords._slots.release()
+    finally:
+        shutdown_pool()
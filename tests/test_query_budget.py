@@ -0,0 +1,105 @@
+"""
+Query counts of the pages that list related rows: they must not grow with
+the number of cart items, orders or listed rows (no N+1 queries).
+
+Budgets include loading and saving the server-side session.
+"""
+
+import pytest
+
+from app import db
+from app.models import CartItem, Order, OrderItem, User
+from app.querycount import QueryBudgetExceeded, query_budget
+
+
+def fill_cart(user, products, count):
+    CartItem.query.filter_by(user_id=user.id).delete()
+    for product in products[:count]:
+        db.session.add(CartItem(user_id=user.id, product_id=product.id, quantity=2))
+    db.session.commit()
+
+
+def add_orders(user, products, count, items_per_order=3):
+    first = Order.query.count()
+    for n in range(first, first + count):
+        order = Order(order_number=f"T-{n:04d}", user_id=user.id, status="new")
+        order.items = [
+            OrderItem(product_id=p.id, product_name=p.name, article=p.article)
+            for p in products[:items_per_order]
+        ]
+        db.session.add(order)
+    db.session.commit()
+
+
+def warm_up(client, url):
+    """
+    Lets a first request run the one-off queries (cart summary, ...), so
+    that measured requests differ only in the rows they list.
+    """
+    assert client.get(url).status_code == 200
+
+
+def run(client, budget, method, url):
+    """
+    Requests a page within a query budget (after ``warm_up``).
+
+    Returns:
+        int: Number of statements executed.
+    """
+    with query_budget(budget) as statements:
+        response = client.open(url, method=method)
+    assert response.status_code == 200
+    return len(statements)
+
+
+def test_budget_exceeded_lists_statements(app, products):
+    with pytest.raises(QueryBudgetExceeded, match="Expected at most 1 queries, got 2"):
+        with query_budget(1):
+            db.session.execute(db.select(User.id)).all()
+            db.session.execute(db.select(Order.id)).all()
+
+
+def test_profile(auth_client, user, products):
+    warm_up(auth_client, "/profile")
+    counts = []
+    for size in (1, 30):
+        fill_cart(user, products, size)
+        counts.append(run(auth_client, 4, "GET", "/profile"))
+    assert counts[0] == counts[1]
+
+
+def test_order_list(auth_client, user, products):
+    warm_up(auth_client, "/orders")
+    counts = []
+    for orders in (1, 10):
+        add_orders(user, products, orders)
+        counts.append(run(auth_client, 4, "GET", "/orders"))
+    assert counts[0] == counts[1]
+
+
+def test_checkout(auth_client, user, products, monkeypatch):
+    monkeypatch.setenv("REC_EMAIL", "admin@example.com")
+    warm_up(auth_client, "/profile")
+    counts = []
+    for size in (1, 30):
+        fill_cart(user, products, size)
+        counts.append(run(auth_client, 14, "POST", "/cart/checkout"))
+    assert counts[0] == counts[1]
+
+
+@pytest.mark.parametrize(
+    "url", ["/admin/order/", "/admin/products/", "/admin/user/", "/admin/carbrand/"]
+)
+def test_admin_list_views(client, user, products, url):
+    with client.session_transaction() as sess:
+        sess["admin"] = True
+    warm_up(client, url)
+    add_orders(user, products, 1)
+    small = run(client, 3, "GET", url)
+
+    add_orders(user, products, 20)
+    db.session.add_all(
+        User(email=f"u{n}@example.com", password_hash="-") for n in range(20)
+    )
+    db.session.commit()
+    assert run(client, 3, "GET", url) == small
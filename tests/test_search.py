@@ -0,0 +1,73 @@
+import pytest
+from flask import g
+
+from app import db
+from app.models import ContentVersion, Products
+from app.search import SearchIndex
+from app.versioning import forget_content_version
+from tests.conftest import product_ids
+
+
+def catalog_ids(client, query):
+    response = client.get("/catalog?" + query)
+    assert response.status_code == 200
+    return product_ids(response.get_data(as_text=True))
+
+
+@pytest.mark.parametrize("sort", ["", "price_desc"])
+def test_filters_apply_before_the_result_cap(app, auth_client, catalog, sort):
+    # Every product matches "фильтр"; the cap must not hide the filtered ones
+    app.config["SEARCH_MAX_RESULTS"] = 5
+    brand_id = catalog[1].brand_id
+
+    ids = catalog_ids(
+        auth_client, f"q=фильтр&brand={brand_id}&price_min=400&sort={sort}"
+    )
+
+    expected = [p for p in catalog if p.brand_id == brand_id and p.price >= 400]
+    assert sorted(ids) == sorted(p.id for p in expected)
+    assert len(ids) == 5
+
+
+def test_relevance_listing_is_capped(app, auth_client, catalog):
+    app.config["SEARCH_MAX_RESULTS"] = 5
+
+    assert len(catalog_ids(auth_client, "q=фильтр")) == 5
+
+
+def test_search_by_article(auth_client, catalog):
+    assert catalog_ids(auth_client, "q=F17") == [catalog[17].id]
+
+
+def test_index_ranks_article_matches_first():
+    index = SearchIndex(
+        [
+            (1, "Фильтр AB12 салонный", "XY1", "XY1-0"),
+            (2, "Фильтр масляный", "AB12", "AB12-0"),
+            (3, "Фильтр AB120", "ZZ9", "ZZ9-0"),
+        ]
+    )
+
+    assert index.search("ab12") == [2, 1, 3]
+    assert index.search("ab12", limit=1) == [2]
+    assert index.search("нет такого") == []
+
+
+def test_index_follows_changes_of_other_processes(app, auth_client, products):
+    app.config["CATALOG_SNAPSHOT"] = False
+    assert catalog_ids(auth_client, "q=F07") == [products[7].id]
+
+    # Another worker changes the article and bumps the shared content version
+    with db.engine.begin() as connection:
+        connection.execute(
+            db.update(Products)
+            .where(Products.id == products[7].id)
+            .values(article="Z7")
+        )
+        connection.execute(
+            db.update(ContentVersion).values(version=ContentVersion.version + 1)
+        )
+    forget_content_version()  # as if CONTENT_VERSION_TTL had passed
+    g.pop("content_version", None)
+
+    assert catalog_ids(auth_client, "q=Z7") == [products[7].id]
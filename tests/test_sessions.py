@@ -0,0 +1,107 @@
+import pytest
+
+from app import db
+from app.models import HttpSession
+from app.sessions import SID_RE, decode_session, encode_session
+
+
+def sid(client):
+    cookie = client.get_cookie("session")
+    return cookie.value if cookie else None
+
+
+def stored_ids():
+    return set(db.session.execute(db.select(HttpSession.id)).scalars())
+
+
+def start_anonymous_session(client):
+    # Flashing a message is the first write to a visitor's session
+    client.post("/copy_link", data={"return_url": "/"})
+    return sid(client)
+
+
+def log_in(client, user):
+    pytest.importorskip("email_validator")  # needed by the Email() validator
+    user.set_password("secret")
+    db.session.commit()
+    return client.post(
+        "/auth/user_login",
+        data={"action": "Войти", "email": user.email, "password": "secret"},
+    )
+
+
+def test_cookie_holds_only_the_id(client):
+    session_id = start_anonymous_session(client)
+
+    assert SID_RE.match(session_id)
+    assert stored_ids() == {session_id}
+
+
+def test_login_rotates_the_id(client, user):
+    anonymous = start_anonymous_session(client)
+
+    assert log_in(client, user).status_code == 302
+
+    authenticated = sid(client)
+    assert authenticated != anonymous
+    assert stored_ids() == {authenticated}
+    assert client.get("/profile").status_code == 200
+
+
+def test_logout_rotates_the_id(client, user):
+    log_in(client, user)
+    authenticated = sid(client)
+
+    client.get("/auth/logout")
+
+    assert sid(client) != authenticated
+    assert authenticated not in stored_ids()
+    assert client.get("/profile").status_code == 401
+
+
+def test_admin_login_rotates_the_id(client, monkeypatch):
+    monkeypatch.setenv("ADMIN_PASSWORD", "admin-secret")
+    anonymous = start_anonymous_session(client)
+
+    client.post("/admin-login", data={"password": "admin-secret"})
+
+    admin = sid(client)
+    assert admin != anonymous
+    assert stored_ids() == {admin}
+
+
+def test_unknown_id_is_replaced(client):
+    planted = "a" * 43
+    client.set_cookie("session", planted)
+
+    client.post("/copy_link", data={"return_url": "/"})
+
+    assert sid(client) != planted
+    assert planted not in stored_ids()
+
+
+def test_unchanged_session_is_not_saved_again(client, user):
+    log_in(client, user)
+    client.get("/profile")
+    session_id = sid(client)
+
+    with db.engine.connect() as conn:
+        before = conn.execute(db.select(HttpSession.expires_at)).scalar_one()
+    client.get("/about")
+    with db.engine.connect() as conn:
+        after = conn.execute(db.select(HttpSession.expires_at)).scalar_one()
+
+    assert sid(client) == session_id
+    assert after == before
+
+
+@pytest.mark.parametrize("size", [10, 1000])
+def test_payload_round_trip(size):
+    data = {"cart": {"user_id": 1, "items": {"7": 2}}, "note": "x" * size}
+
+    payload = encode_session(data, compress_min_size=256)
+
+    assert payload[:1] == (b"z" if size > 256 else b"j")
+    assert decode_session(payload) == data
+    with pytest.raises(ValueError):
+        decode_session(b"z" + b"not zlib")
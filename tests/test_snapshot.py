@@ -0,0 +1,129 @@
+import itertools
+
+import pytest
+from flask import g
+
+from app import db
+from app.models import ContentVersion, Products
+from app.querycount import query_budget
+from app.pagination import decode_cursor
+from app.snapshot import SORTS, CatalogSnapshot, _load_rows, get_snapshot
+from app.versioning import forget_content_version
+from tests.conftest import product_ids
+
+
+def test_snapshot_is_shared_until_the_version_changes(app, products):
+    snapshot = get_snapshot()
+
+    assert get_snapshot() is snapshot
+    assert len(snapshot) == len(products)
+    assert snapshot.get(products[3].id).brand.name == products[3].brand.name
+
+    products[3].name = "Фильтр новый"
+    db.session.commit()
+    g.pop("content_version", None)
+
+    rebuilt = get_snapshot()
+    assert rebuilt is not snapshot
+    assert rebuilt.version > snapshot.version
+    assert rebuilt.get(products[3].id).name == "Фильтр новый"
+    # Readers of the old snapshot keep a consistent view
+    assert snapshot.get(products[3].id).name == "Фильтр 03"
+
+
+def test_snapshot_follows_changes_of_other_processes(client, products):
+    assert "Фильтр 05" in client.get(f"/product_card/{products[5].id}").text
+
+    # Another worker renames the product and bumps the shared content version
+    with db.engine.begin() as connection:
+        connection.execute(
+            db.update(Products)
+            .where(Products.id == products[5].id)
+            .values(name="Фильтр переименованный")
+        )
+        connection.execute(
+            db.update(ContentVersion).values(version=ContentVersion.version + 1)
+        )
+    forget_content_version()  # as if CONTENT_VERSION_TTL had passed
+    g.pop("content_version", None)
+
+    page = client.get(f"/product_card/{products[5].id}").text
+    assert "Фильтр переименованный" in page
+
+
+def test_catalog_is_served_without_queries(client, products):
+    url = "/catalog?q=фильтр&type=Грузовики&sort=price_desc"
+    client.get(url)
+
+    # Only the visitor's session (it holds the CSRF token) is loaded
+    with query_budget(1) as statements:
+        response = client.get(url)
+    assert all("http_session" in sql for sql in statements)
+
+    expected = sorted(
+        (p for p in products if p.type == "Грузовики"),
+        key=lambda p: p.price,
+        reverse=True,
+    )
+    assert product_ids(response.text) == [p.id for p in expected[:24]]
+
+
+def test_unknown_product_is_not_found(client, products):
+    assert client.get("/product_card/100000").status_code == 404
+
+
+def test_index_lists_main_products(client, products):
+    for product in products[:2]:
+        product.is_main = True
+    db.session.commit()
+
+    page = client.get("/").text
+
+    assert "FLT-00" in page and "FLT-01" in page
+    assert "FLT-02" not in page
+
+
+def walk_snapshot(snapshot, sort, per_page, **filters):
+    """
+    Pages through a snapshot listing, following the cursors.
+
+    Returns:
+        list: Pages of product ids.
+    """
+    pages, cursor = [], None
+    while True:
+        page = snapshot.page(sort, cursor, per_page, **filters)
+        pages.append([p.id for p in page.items])
+        if page.next_cursor is None:
+            return pages
+        cursor = decode_cursor(page.next_cursor)
+
+
+FILTERS = [
+    {},
+    {"type_filter": "Грузовики"},
+    {"category_filter": "Масляный", "price_min": 150, "price_max": 420},
+    {"type_filter": "Сельхоз", "category_filter": "Воздушный"},
+    {"type_filter": "Нет такого"},
+    {"price_min": 1000},
+    {"text": "фильтр", "price_max": 300},
+    {"text": "F1"},
+    {"text": "нет такого"},
+]
+
+
+@pytest.mark.parametrize("filters", FILTERS)
+def test_columnar_snapshot_matches_the_python_scan(app, products, filters):
+    pytest.importorskip("numpy")
+    rows = _load_rows()
+    columnar = CatalogSnapshot(1, rows, columnar=True)
+    python = CatalogSnapshot(1, rows, columnar=False)
+    assert columnar._columns is not None and python._columns is None
+
+    brand_ids = [None, products[0].brand_id, products[1].brand_id]
+    for sort, brand_id, per_page in itertools.product(
+        [None, *SORTS], brand_ids, [1, 4, 50]
+    ):
+        listing = dict(filters, brand_id=brand_id)
+        expected = walk_snapshot(python, sort, per_page, **listing)
+        assert walk_snapshot(columnar, sort, per_page, **listing) == expected
@@ -0,0 +1,89 @@
+import io
+import os
+
+import pytest
+from PIL import Image
+from werkzeug.datastructures import FileStorage
+
+from app import db
+from app.images import UnsupportedUpload, collect_garbage, store_upload, upload_path
+from app.models import Products
+
+
+def png_bytes(color="red"):
+    buffer = io.BytesIO()
+    Image.new("RGB", (40, 20), color).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def upload(data, name="photo.png"):
+    return FileStorage(stream=io.BytesIO(data), filename=name)
+
+
+def test_identical_uploads_share_one_file(app):
+    first = store_upload(upload(png_bytes(), "a.png"))
+    second = store_upload(upload(png_bytes(), "Other Name.PNG"))
+
+    assert first == second
+    assert first.startswith(f"{first[6:8]}/{first[8:10]}/")
+    assert first.endswith(".png")
+    assert os.path.exists(upload_path(first))
+
+
+@pytest.mark.parametrize(
+    "name, data",
+    [
+        ("page.html", b"<script></script>"),
+        ("noext", png_bytes()),
+        ("drawing.svg", b"<svg/>"),
+        # Right extension, but not an image
+        ("fake.png", b"not an image"),
+    ],
+    ids=["html", "no-extension", "svg", "fake-png"],
+)
+def test_unsupported_files_are_rejected(app, name, data):
+    with pytest.raises(UnsupportedUpload):
+        store_upload(upload(data, name))
+
+    # Nothing (not even a temporary file) is left behind
+    folder = app.config["UPLOAD_FOLDER"]
+    assert not os.path.exists(folder) or not os.listdir(folder)
+
+
+def test_profile_upload_of_a_non_image_is_a_bad_request(auth_client, user):
+    response = auth_client.post(
+        "/profile/edit",
+        data={"name": "Иван", "photo": (io.BytesIO(b"not an image"), "x.png")},
+        content_type="multipart/form-data",
+    )
+
+    assert response.status_code == 400
+    assert user.photo_filename is None
+
+
+def test_garbage_collection_keeps_referenced_files(app, products):
+    folder = app.config["UPLOAD_FOLDER"]
+    used = store_upload(upload(png_bytes("red")))
+    orphan = store_upload(upload(png_bytes("blue")))
+    for name in (used, orphan):
+        stem = os.path.splitext(name)[0]
+        with open(os.path.join(folder, f"{stem}.card.webp"), "wb") as f:
+            f.write(b"variant")
+    products[0].photo_filename = used
+    db.session.commit()
+
+    # Young files are kept: their rows may not be committed yet
+    assert collect_garbage(grace_period=3600) == []
+
+    orphan_stem = os.path.splitext(orphan)[0]
+    assert sorted(collect_garbage(grace_period=0, dry_run=True)) == sorted(
+        [orphan, f"{orphan_stem}.card.webp"]
+    )
+    assert os.path.exists(upload_path(orphan))
+
+    collect_garbage(grace_period=0)
+    assert os.path.exists(upload_path(used))
+    assert os.path.exists(upload_path(os.path.splitext(used)[0] + ".card.webp"))
+    assert not os.path.exists(upload_path(orphan))
+    assert not os.path.exists(os.path.dirname(upload_path(orphan)))
+    assert Products.query.get(products[0].id).photo_filename == used
@@ -0,0 +1,90 @@
+from flask import g
+
+from app import create_app, db
+from app.cache import NullCache
+from app.models import ContentVersion, User
+from app.querycount import query_budget
+from app.usercache import load_user
+from app.versioning import forget_content_version
+
+
+def load(user_id):
+    """
+    Runs the user loader as a new request would, with an empty session.
+    """
+    db.session.expunge_all()
+    return load_user(str(user_id))
+
+
+def test_cached_user_is_loaded_without_queries(app, user):
+    user_id = user.id
+    load(user_id)
+
+    with query_budget(0):
+        cached = load(user_id)
+
+    assert cached.id == user_id
+    assert cached.email == "buyer@example.com"
+    assert cached in db.session
+
+
+def test_password_hash_is_not_cached(app, user):
+    user_id = user.id
+    entries = app.extensions["user_cache"]._entries
+    load(user_id)
+
+    ((_, values),) = entries.values()
+    assert "-" not in values
+
+    cached = load(user_id)
+    with query_budget(1):
+        assert cached.password_hash == "-"
+
+
+def test_local_change_is_seen_at_once(app, user):
+    user_id = user.id
+    load(user_id)
+
+    user = db.session.get(User, user_id)
+    user.name = "Пётр"
+    db.session.commit()
+
+    assert load(user_id).name == "Пётр"
+
+
+def test_change_by_another_process_is_seen_after_the_ttl(app, user):
+    user_id = user.id
+    load(user_id)
+
+    # Another worker edits the user and bumps the shared users version
+    with db.engine.begin() as connection:
+        connection.execute(
+            db.update(User).where(User.id == user_id).values(name="Пётр")
+        )
+        connection.execute(
+            db.update(ContentVersion)
+            .where(ContentVersion.name == "users")
+            .values(version=ContentVersion.version + 1)
+        )
+    assert load(user_id).name == "Иван"
+
+    forget_content_version()  # as if CONTENT_VERSION_TTL had passed
+    g.pop("users_version", None)
+
+    assert load(user_id).name == "Пётр"
+
+
+def test_deleted_user_is_not_loaded(app, user):
+    user_id = user.id
+    load(user_id)
+
+    db.session.delete(db.session.get(User, user_id))
+    db.session.commit()
+
+    assert load(user_id) is None
+
+
+def test_cache_can_be_disabled(app, monkeypatch):
+    monkeypatch.setenv("USER_CACHE_TTL", "0")
+
+    assert isinstance(create_app().extensions["user_cache"], NullCache)
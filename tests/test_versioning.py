@@ -0,0 +1,89 @@
+import time
+
+from flask import g
+
+from app import db
+from app.models import ContentVersion
+from app.versioning import get_content_version
+
+
+def fresh_version():
+    """
+    Content version as a new request would see it.
+    """
+    g.pop("content_version", None)
+    return get_content_version()
+
+
+def test_content_changes_bump_the_version(app, user, products):
+    before = fresh_version()
+
+    user.name = "Пётр"
+    db.session.commit()
+    assert fresh_version() == before
+
+    products[0].price = 1
+    db.session.commit()
+    assert fresh_version() == before + 1
+
+
+def test_other_processes_changes_are_seen_after_the_ttl(app, products, monkeypatch):
+    app.config["CONTENT_VERSION_TTL"] = 5
+    before = fresh_version()
+
+    # Another worker commits a change this process did not make
+    with db.engine.begin() as connection:
+        connection.execute(
+            db.update(ContentVersion).values(version=ContentVersion.version + 1)
+        )
+    assert fresh_version() == before
+
+    now = time.monotonic()
+    monkeypatch.setattr(time, "monotonic", lambda: now + 6)
+    assert fresh_version() == before + 1
+
+
+def test_unchanged_page_is_not_modified(client, products):
+    first = client.get("/about")
+    assert first.status_code == 200
+    assert first.headers["Cache-Control"] == "private, no-cache"
+    assert "Last-Modified" not in first.headers
+
+    second = client.get("/about", headers={"If-None-Match": first.headers["ETag"]})
+    assert second.status_code == 304
+    assert second.get_data() == b""
+
+
+def test_content_change_changes_the_etag(client, products):
+    etag = client.get("/about").headers["ETag"]
+
+    products[0].name = "Новое имя"
+    db.session.commit()
+
+    response = client.get("/about", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+
+
+def test_if_modified_since_alone_renders_the_page(client, products):
+    response = client.get(
+        "/about", headers={"If-Modified-Since": "Fri, 01 Jan 2100 00:00:00 GMT"}
+    )
+
+    assert response.status_code == 200
+
+
+def test_etag_changes_every_half_csrf_lifetime(app, client, monkeypatch):
+    app.config["WTF_CSRF_TIME_LIMIT"] = 3600
+    monkeypatch.setattr(time, "time", lambda: 10_000.0)
+    etag = client.get("/about").headers["ETag"]
+
+    # Same 30-minute bucket: same ETag
+    monkeypatch.setattr(time, "time", lambda: 10_700.0)
+    assert client.get("/about").headers["ETag"] == etag
+
+    # Next bucket: the page is rendered again with a fresh CSRF token
+    monkeypatch.setattr(time, "time", lambda: 10_900.0)
+    response = client.get("/about", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag